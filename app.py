@@ -1,27 +1,48 @@
 ## Python-specific imports
 import os
+import time
+## Taken before the other imports, for the import-to-first-response time
+IMPORT_STARTED = time.perf_counter()
 import asyncio
 import sqlite3
+import threading
+import functools
+import contextvars
 import util
 import logging
 import urllib.parse
 import urllib.request
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from apscheduler.schedulers.background import BackgroundScheduler
 ## Flask imports
-from flask import Flask, render_template, request, json
+from flask import Flask, Response, g, has_request_context, render_template, request, stream_with_context
+
+## Load .env before the custom imports, which read their settings at import time
+load_dotenv()
 
-# Firebase admin imports
-import firebase_admin
-from firebase_admin import auth
-from firebase_admin import credentials
-from firebase_admin import db
 ###################################################################
 ## Custom imports
+import backends
+import leader
+import metrics
 from models import Sensor
+from occupancy import OccupancyEngine, as_dict, is_true
+from areas import AreaCounts
+from spatial import GridIndex, coords_of
+from history import History, PERIODS
+from plates import PlateIndex
+from snapshot import Snapshot
+from journal import Journal
+from cache import rtdb_cache
+from keystore import sensor_keys
+from rtdb import Store, log_request_calls
+from stream import Broadcaster, spot_filter
+from versions import SpotVersions
+from bodies import parse_body
+from writebuffer import WriteBuffer
 
 ###################################################################
-load_dotenv()
 logging.basicConfig(
                     level=logging.INFO,
                     format='%(asctime)s  |  %(name)s - %(levelname)s - %(message)s',
@@ -29,27 +50,285 @@ logging.basicConfig(
 
 app = Flask(__name__)
 
+
+## Async views run to completion on an event loop kept per worker thread,
+## instead of asgiref starting a loop thread for every call (or, under
+## asgi.py, running them on the server's loop where a blocking read would
+## stall every other request).
+thread_loops = threading.local()
+_UNSET = object()
+
+
+def run_on_thread_loop(func):
+    """Runs an async view on the thread's loop. The view's task works on a
+        copy of the context, so the context variables it sets (such as a
+        request context pushed by stream_with_context) are copied back
+        afterwards, as asgiref's async_to_sync does."""
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        loop = getattr(thread_loops, "loop", None)
+        if loop is None:
+            loop = thread_loops.loop = asyncio.new_event_loop()
+
+        async def view():
+            return await func(*args, **kwargs), contextvars.copy_context()
+
+        result, context = loop.run_until_complete(view())
+        for var, value in context.items():
+            if var.get(_UNSET) is not value:
+                var.set(value)
+        return result
+    return run
+
+
+app.async_to_sync = run_on_thread_loop
+
 ###################################################################
 ## Load in configuration files and environment variables and set 
 ## up logging for the app.
 
-cred = credentials.Certificate(os.environ.get("FIREBASE_AUTH_LOC"))
-fb = firebase_admin.initialize_app(cred, {
-    'databaseURL': os.environ.get("FIREBASE_URL"),
-})
+## Storage backend picked by RTDB_BACKEND: "firebase" (default, configured by
+## FIREBASE_AUTH_LOC and FIREBASE_URL), "sqlite" (SQLITE_PATH) or "memory".
+db = backends.from_env()
+
+
+## Data access layer: every route and util call goes through the store, which
+## memoizes reads per request on top of the shared read-through cache.
+def current_route():
+    """Returns the URL rule being served, or "background" outside a request."""
+
+    if has_request_context() and request.url_rule is not None:
+        return request.url_rule.rule
+    return "background"
+
+
+def observe_rtdb(op, seconds):
+    route = current_route()
+    metrics.rtdb_calls.inc(route, op)
+    metrics.rtdb_latency.observe(seconds, route, op)
+
+
+## Local msgpack snapshot of /spots, /sensors and /plates, written every
+## SNAPSHOT_SECONDS and served on a warm start or while the RTDB is
+## unreachable. On by default with firebase; SNAPSHOT_PATH="" turns it off.
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH", "snapshot.msgpack" if db.name == "firebase" else "")
+SNAPSHOT_SECONDS = int(os.environ.get("SNAPSHOT_SECONDS", 60))
+snapshot = Snapshot(SNAPSHOT_PATH) if SNAPSHOT_PATH else None
+
+## SQLite journal that queues writes while the RTDB is unreachable, replayed
+## by catch_up once it answers again. On by default with firebase;
+## JOURNAL_PATH="" turns it off.
+JOURNAL_PATH = os.environ.get("JOURNAL_PATH", "journal.db" if db.name == "firebase" else "")
+journal = Journal(JOURNAL_PATH) if JOURNAL_PATH else None
+
+## RTDB_POOL threads serve the async reads awaited together with asyncio.gather
+RTDB_POOL = int(os.environ.get("RTDB_POOL", 32))
+store = Store(db, rtdb_cache, observer=observe_rtdb,
+              pool=ThreadPoolExecutor(max_workers=RTDB_POOL, thread_name_prefix="rtdb"),
+              fallback=snapshot, journal=journal)
+
+
+## Occupancy engine that keeps spot free values in sync with their sensors.
+## OCCUPANCY_MODE is "events" (listen on /sensors, with monitor_spots as a
+## low-frequency reconciliation sweep) or "poll" (monitor_spots every 10 s).
+engine = OccupancyEngine(store, rtdb_cache)
+OCCUPANCY_MODE = os.environ.get("OCCUPANCY_MODE", "events")
+RECONCILE_SECONDS = int(os.environ.get("RECONCILE_SECONDS", 300))
+## Processes that lead no shard refresh their views every FOLLOW_SECONDS
+FOLLOW_SECONDS = int(os.environ.get("FOLLOW_SECONDS", 60))
+
+## Spot free transitions are pushed to /data/spots/stream subscribers from the
+## engine's commit, through a ring buffer of the last STREAM_BUFFER changes.
+## Under gunicorn each subscriber holds one of its threads, so at most
+## STREAM_MAX_SUBSCRIBERS are let in; asgi.py serves the stream from the event
+## loop instead, without that limit.
+broadcaster = Broadcaster(size=int(os.environ.get("STREAM_BUFFER", 1024)),
+                          heartbeat=float(os.environ.get("STREAM_HEARTBEAT", 15)),
+                          max_blocking=int(os.environ.get("STREAM_MAX_SUBSCRIBERS", 4)))
+engine.on_change(broadcaster.publish)
+
+## Free and total spot counts per area, kept up to date from the engine's free
+## transitions and relinks and recounted from scratch by monitor_spots.
+areas = AreaCounts()
+
 
+@engine.on_change
+def track_free(changes, spot_areas):
+    for spot, free in changes.items():
+        areas.track(spot, spot_areas.get(spot), free)
 
-## Occupancy Values for different types of sensors:
 
-occ = {
-    "ultrasonic": ["True", "true", 1, True],
-     "us": ["True", "true", 1, True], 
-     "usonic": ["True", "true", 1, True], 
-     "US": ["True", "true", 1, True],
-     "lidar": ["True", "true", 1, True],
-     "Lidar": ["True", "true", 1, True],
-     "LIDAR": ["True", "true", 1, True],
-}
+@engine.on_relink
+def track_relink(sensor, old, new, states):
+    for spot, (area, free) in states.items():
+        areas.track(spot, area, free)
+
+
+## Grid index of the free spots that have coordinates, for /data/spots/nearest.
+## SPATIAL_CELL is the grid cell size in degrees.
+spatial = GridIndex(cell=float(os.environ.get("SPATIAL_CELL", 0.001)))
+
+
+@engine.on_change
+def track_nearest(changes, spot_areas):
+    for spot, free in changes.items():
+        spatial.set_free(spot, free)
+
+
+## Every spot free transition, kept in per-spot ring buffers and in SQLite at
+## HISTORY_PATH, with hourly and daily rollups built by background jobs.
+history = History(path=os.environ.get("HISTORY_PATH", "history.db"),
+                  ring=int(os.environ.get("HISTORY_RING", 64)))
+
+
+@engine.on_change
+def record_history(changes, spot_areas):
+    ## Only the leader writes transitions; followers keep their ring buffers
+    history.record(changes, persist=elector.leading)
+
+
+## Permit list index, reloaded from /plates every PLATES_REFRESH seconds
+plate_index = PlateIndex(store, refresh=float(os.environ.get("PLATES_REFRESH", 60)))
+
+## Version of the spot set, for /data/spots?since=<version> and ETags. It is
+## stored under /spot_versions and stamped by every write to /spots.
+spot_versions = SpotVersions(store)
+store.stamp = spot_versions.stamps
+
+## Write-behind buffer for sensor POSTs: no-op updates are dropped and the
+## latest value per sensor is flushed every SENSOR_FLUSH_MS (0 = write through).
+## A written value suppresses repeats for SENSOR_SUPPRESS_TTL seconds, or until
+## the engine's change feed shows another value.
+writes = WriteBuffer(store, window=int(os.environ.get("SENSOR_FLUSH_MS", 250)) / 1000,
+                     ttl=float(os.environ.get("SENSOR_SUPPRESS_TTL", 60)))
+engine.on_sensors(writes.observe)
+
+## Returned when a POST body can't be decoded as JSON, form data or msgpack
+BODY_ERROR = ("Invalid data type provided. Please ensure you're setting the " +
+              "Content-Type to application/json, application/x-www-form-urlencoded " +
+              "or application/msgpack.")
+
+## Default and maximum page sizes for the paginated lists
+PAGE_SIZE = int(os.environ.get("PAGE_SIZE", 100))
+PAGE_LIMIT = int(os.environ.get("PAGE_LIMIT", 1000))
+
+## Maximum number of records accepted by /data/sensors/batch
+BATCH_LIMIT = int(os.environ.get("BATCH_LIMIT", 1000))
+
+## Only the elected leader runs the scheduled occupancy work and writes spot
+## free values (see leader.from_env for SCHEDULER_LEADER and SHARDS).
+elector = leader.from_env(db)
+engine.owns = elector.owns
+LEADER_SECONDS = int(os.environ.get("LEADER_SECONDS", 10))
+
+
+def engine_current(spot):
+    """True if the engine's fleet model is current for spot: this process
+        owns the spot and hears every sensor write as it lands. Anything
+        else is read from the store."""
+
+    return spot is not None and engine.listener is not None and elector.owns(spot)
+
+
+def modeled_sensor(id):
+    """Returns sensor id as the fleet model has it, or None if the model
+        isn't current for it."""
+
+    record = engine.fleet.sensor(id)
+    if record is None or not engine_current(record.Spot):
+        return None
+    return record.to_dict()
+
+## Held while a monitor_spots tick runs, so ticks never overlap
+tick_lock = threading.Lock()
+
+## Seconds from importing app to sending the first response
+first_response = None
+
+metrics.registry.gauge("rtdb_cache_hits", "Read-through cache hits.", lambda: rtdb_cache.hits)
+metrics.registry.gauge("rtdb_cache_misses", "Read-through cache misses.", lambda: rtdb_cache.misses)
+metrics.registry.gauge("sensor_writes_suppressed", "Sensor POSTs dropped as repeats of a pending write.",
+                       lambda: writes.suppressed)
+metrics.registry.gauge("sensor_writes_dead_lettered", "Sensor updates dropped after the RTDB rejected them.",
+                       lambda: writes.dead_lettered)
+metrics.registry.gauge("sensor_writes_coalesced", "Sensor POSTs merged into a pending write.", lambda: writes.coalesced)
+metrics.registry.gauge("plates_bloom_rejected", "Plate checks rejected by the Bloom filter.", lambda: plate_index.rejected)
+metrics.registry.gauge("sensor_auth_failures", "Sensor key verifications that failed.", lambda: sensor_keys.failures)
+metrics.registry.gauge("rtdb_degraded", "1 while the RTDB is unreachable and reads come from the snapshot.",
+                       lambda: int(store.degraded))
+metrics.registry.gauge("journal_pending", "Writes queued in the journal.",
+                       lambda: journal.pending() if journal is not None else 0)
+metrics.registry.gauge("cold_start_seconds", "Seconds from importing the app to the first response.",
+                       lambda: first_response or 0)
+metrics.registry.gauge("fleet_sensors", "Sensors in the fleet model.", lambda: len(engine.fleet.sensors.rows))
+metrics.registry.gauge("fleet_spots", "Spots in the fleet model.", lambda: len(engine.fleet.spots.rows))
+metrics.registry.gauge("fleet_bytes", "Bytes held by the fleet model's columns.",
+                       lambda: engine.fleet.sensors.nbytes() + engine.fleet.spots.nbytes())
+metrics.registry.gauge("spot_stream_subscribers", "Open /data/spots/stream connections.", lambda: broadcaster.subscribers)
+metrics.registry.gauge("spot_stream_refused", "Stream connections refused for lack of a thread.", lambda: broadcaster.refused)
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def count_round_trips(response):
+    """Logs the number of RTDB round trips made while serving the request
+        and records the request's latency. Responses served from a warm
+        snapshot carry its age in X-Snapshot-Age."""
+
+    global first_response
+
+    log_request_calls(store, request.endpoint)
+    if "rtdb_snapshot" in g:
+        response.headers["X-Snapshot-Age"] = f"{time.time() - g.rtdb_snapshot:.0f}"
+    if first_response is None:
+        first_response = time.perf_counter() - IMPORT_STARTED
+        logging.info(f"APP > FIRST_RESPONSE | {first_response:.3f} s from import to first response.")
+    if "request_start" in g:
+        metrics.request_latency.observe(time.perf_counter() - g.request_start,
+                                        current_route(), request.method, response.status_code)
+    return response
+
+
+def read_page(domain):
+    """Reads one page of a domain from the ?cursor= and ?limit= arguments
+        with an ordered-by-key query. Returns (items, next cursor or None,
+        limit)."""
+
+    cursor = request.args.get("cursor") or None
+    try:
+        limit = min(max(int(request.args.get("limit", PAGE_SIZE)), 1), PAGE_LIMIT)
+    except ValueError:
+        limit = PAGE_SIZE
+
+    ## One extra child tells us where the next page starts
+    items = as_dict(store.page(domain, cursor, limit + 1))
+    keys = list(items)
+    if len(keys) <= limit:
+        return items, None, limit
+    return {k: items[k] for k in keys[:limit]}, keys[limit], limit
+
+
+def stream_template(name, **context):
+    """Renders a template as a streamed response, so the first rows are sent
+        while the rest of the page is still rendering."""
+
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(name)
+    return Response(stream_with_context(template.stream(context)))
+
+
+def count_skipped_tick(event):
+    """APScheduler listener for ticks that never ran."""
+
+    from apscheduler.events import EVENT_JOB_MISSED
+
+    reason = "missed" if event.code == EVENT_JOB_MISSED else "overlap"
+    metrics.ticks_skipped.inc(reason)
 
 
 ###################################################################
@@ -63,9 +342,21 @@ async def startup():
 
     logging.info("Starting up app...")
 
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(func=monitor_spots, trigger="interval", seconds=10)
-    scheduler.start()
+    ## Preload the hashed sensor keys, so authentication never waits on a read
+    try:
+        sensor_keys.load()
+    except sqlite3.Error as e:
+        logging.error(f"{e} | APP > STARTUP | Unable to load sensor keys from {sensor_keys.path}.")
+
+    ## Answer reads from the last snapshot while the live tree is fetched
+    warm_start()
+
+    ## Writes queued before a restart are replayed before any new write
+    if journal is not None and journal.pending():
+        store.degrade(f"{journal.pending()} journaled write(s)")
+
+    ## The scheduler is imported and started off the request path
+    threading.Thread(target=start_jobs, name="start-jobs", daemon=True).start()
     # with sqlite3.connect("database.db") as con:
     #     cur = con.cursor()
     #     with open('schema.sql') as f:
@@ -74,68 +365,222 @@ async def startup():
 
 
 
-def monitor_spots():
-    """Iterates through every parking spot in the RTDB and updates the spot's free value
-        based on the status of its dependent sensors."""
+def start_jobs():
+    """Starts the background jobs. Leadership is taken here as well, so the
+        first request doesn't wait for the leader's full pass."""
+
+    ## Imported here rather than at the top, to keep it out of the cold start
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES
 
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(func=elect_leader, trigger="interval", seconds=LEADER_SECONDS,
+                      max_instances=1, coalesce=True, next_run_time=datetime.now())
+    scheduler.add_job(func=scheduled_tick, trigger="interval", seconds=10,
+                      max_instances=1, coalesce=True)
+    scheduler.add_job(func=history.flush, trigger="interval", seconds=10, max_instances=1, coalesce=True)
+    scheduler.add_job(func=rollup_history, trigger="interval", minutes=10, max_instances=1, coalesce=True)
+    if snapshot is not None:
+        scheduler.add_job(func=save_snapshot, trigger="interval", seconds=SNAPSHOT_SECONDS,
+                          max_instances=1, coalesce=True)
+    scheduler.add_job(func=catch_up, trigger="interval", seconds=10, max_instances=1,
+                      coalesce=True, next_run_time=datetime.now())
+    scheduler.add_listener(count_skipped_tick, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+    scheduler.start()
+
+
+def warm_start():
+    """Loads the local snapshot, if any, and serves /spots, /sensors and
+        /plates from it until catch_up() has read the live tree. The area
+        counts, spatial index and plate index are seeded from it too."""
+
+    if snapshot is None:
+        return False
+    start = time.perf_counter()
+    saved, data = snapshot.load()
+    if data is None:
+        return False
+
+    store.warm(data, saved)
+    spots = as_dict(data.get("spots"))
+    areas.recount(spots, is_true)
+    spatial.rebuild(spots, is_true)
+    if "plates" in data:
+        plate_index.load(as_dict(data["plates"]))
+    logging.info(f"APP > WARM_START | Loaded a {time.time() - saved:.0f} s old snapshot of "
+                 f"{len(spots)} spot(s) in {time.perf_counter() - start:.3f} s.")
+    return True
+
+
+def catch_up():
+    """Ends a warm start or a degraded spell once the live tree can be read:
+        when the leader has synced, or otherwise after one successful read of
+        /spots. Writes journaled meanwhile are replayed first."""
+
+    if store.snapshot is None and not store.degraded:
+        return
+    if store.degraded or not engine.synced:
+        try:
+            store.get("spots", cached=False)
+        except Exception as e:
+            logging.warning(f"{e} | APP > CATCH_UP | RTDB not reachable yet, still serving the snapshot.")
+            return
     try:
-        spots = db.reference(f"/spots").get()
-        # print(spots)
-        for spot in spots:
-            # print(f"Checking {spot}")
-            flag = False
-            ## Check all of the sensor values
-            for sensor in spots[spot]["sensors"]:
-                # print(f"Sensor is {sensor}")
-                ## Skip if it's referring to itself
-                if sensor == "spot":
-                    continue
-
-                ## Check if sensor value matches the global OCCUPIED state
-                try:
-                    s = db.reference(f"/sensors/{sensor}").get()
-                    # print(f"Returned sensors is {s}")
-                    # print(occ)
-                    if s["type"] in occ:
-                        occ_state = occ[s["type"]]
-                    else:
-                        # print("not in occ")
-                        continue
-                except Exception as e:
-                    logging.info(f"{e} | APP > MONITOR_SPOTS | Invalid sensor type for occupancy array.")
-                    ## sensor["free"] = False  ## Don't do anything!
-                    continue
-
-                # print(spots[spot]["sensors"][sensor]["value"])
-                # print(occ_state)
-                # print(s["value"])
-                # print(occ_state)
-                if s["value"] in occ_state:
-                    ## Change spot to occupied and continue to next spot
-                    spots[spot]["free"] = False
-                    # print("Updating to FALSE")
-                    try:
-                        db.reference(f"/spots/{spot}").set(spots[spot])
-                        flag = True
-                    except Exception as e:
-                        logging.error(f"{e} | APP > MONITOR_SPOTS | Unable to set parking spot to False value.")
-                        ## sensor["free"] = False  ## Don't do anything!
-                    break
-            
-            ## If we get here, we can make it true! (If it's not already)
-            if not flag and not spots[spot]["free"]:
-                ## Change spot to UNoccupied
-                spots[spot]["free"] = True
-                try:
-                    db.reference(f"/spots/{spots[spot]['id']}").set(spots[spot])
-                except Exception as e:
-                    logging.error(f"{e} | APP > MONITOR_SPOTS | Unable to set parking spot to False value.")
+        if not store.recover():
+            return
+    except Exception as e:
+        logging.warning(f"{e} | APP > CATCH_UP | Unable to replay the journal, still serving the snapshot.")
+        return
+    logging.info("APP > CATCH_UP | Caught up with the RTDB, no longer serving the snapshot.")
 
 
+def save_snapshot():
+    """Writes the last known /spots, /sensors and /plates, read through the
+        cache, to the snapshot. Only the leader writes it."""
 
+    if store.snapshot is not None or not elector.leading:
+        return
+    try:
+        data = {"spots": as_dict(store.get("spots")), "sensors": as_dict(store.get("sensors"))}
+        data["plates"] = plate_index.all()
+        size = snapshot.save(data)
+        logging.info(f"APP > SAVE_SNAPSHOT | Wrote {size} bytes to {snapshot.path}.")
     except Exception as e:
-        logging.error(f"{e} | APP > MONITOR_SPOTS | Unable to run scheduled function.")
-    
+        logging.error(f"{e} | APP > SAVE_SNAPSHOT | Unable to write the snapshot.")
+
+
+def elect_leader():
+    """Takes or renews leadership. A new leader runs a full pass and, in
+        events mode, subscribes to /sensors; a process that lost it stops
+        listening. A process that doesn't lead refreshes its model once."""
+
+    if not elector.elect():
+        if engine.listener is not None:
+            engine.close()
+            logging.info("APP > ELECT_LEADER | No longer leading, stopped listening.")
+        engine.synced = 0
+        ## A new follower fills its model right away instead of on the next tick
+        if engine.followed == 0:
+            monitor_spots()
+        return False
+
+    if engine.synced == 0:
+        monitor_spots()
+    if OCCUPANCY_MODE == "events" and engine.listener is None:
+        try:
+            engine.listen(db.reference("/sensors"))
+            logging.info("APP > ELECT_LEADER | Listening for sensor changes.")
+        except Exception as e:
+            logging.error(f"{e} | APP > ELECT_LEADER | Unable to listen on /sensors, polling instead.")
+    return True
+
+
+def scheduled_tick():
+    """Scheduler job for monitor_spots: every 10 s while polling, or every
+        RECONCILE_SECONDS as a sweep while the engine is listening. Between
+        sweeps the leader re-evaluates the model without reading anything.
+        Followers refresh from the RTDB every FOLLOW_SECONDS."""
+
+    if not elector.leading and time.time() - engine.followed < FOLLOW_SECONDS:
+        return
+
+    if elector.leading and engine.listener is not None and time.time() - engine.synced < RECONCILE_SECONDS:
+        if tick_lock.acquire(blocking=False):
+            start = time.perf_counter()
+            try:
+                changes = engine.evaluate()
+                if changes:
+                    metrics.spots_changed.inc(amount=len(changes))
+            finally:
+                metrics.tick_duration.observe(time.perf_counter() - start)
+                tick_lock.release()
+        return
+    monitor_spots()
+
+
+def rollup_history():
+    """Builds the hourly and daily occupancy rollups for completed periods.
+        Only the leader, which writes the transitions, builds them."""
+
+    if not elector.leading:
+        return
+    try:
+        with areas.lock:
+            spot_areas = {spot: state[0] for spot, state in areas.spots.items()}
+        hours = history.rollup_hours(spot_areas)
+        days = history.rollup_days()
+        if hours or days:
+            logging.info(f"APP > ROLLUP_HISTORY | Wrote {hours} hourly and {days} daily rollup(s).")
+    except Exception as e:
+        logging.error(f"{e} | APP > ROLLUP_HISTORY | Unable to build occupancy rollups.")
+
+
+def monitor_spots():
+    """Updates every parking spot's free value based on the status of its
+        dependent sensors. Reads /spots and /sensors once per tick and writes
+        only the spots whose free value changed, in a single multi-path update.
+        In events mode this is the reconciliation sweep for the engine. On a
+        process that doesn't lead, the tick only refreshes the engine's model
+        and the area, spatial and history views from the download."""
+
+    ## Never start a tick while the previous one is running
+    if not tick_lock.acquire(blocking=False):
+        metrics.ticks_skipped.inc("overlap")
+        logging.warning("APP > MONITOR_SPOTS | Previous tick still running, skipping.")
+        return
+
+    start = time.perf_counter()
+    leading = elector.leading
+    try:
+        try:
+            current = None if leading else spot_versions.current()
+            if current is None:
+                spots = as_dict(store.get("spots", cached=False))
+            else:
+                ## Followers reuse the spot set the routes keep per version
+                spots = dict(spot_versions.spots(current[0]))
+            sensors = as_dict(store.get("sensors", cached=False))
+        except Exception as e:
+            logging.error(f"{e} | APP > MONITOR_SPOTS | Unable to read spots and sensors from RTDB.")
+            return
+
+        if leading:
+            ## Recompute every spot in memory and write only the diffs of the
+            ## spots this process owns
+            changes = engine.sync(spots, sensors)
+            if changes:
+                metrics.spots_changed.inc(amount=len(changes))
+                logging.info(f"APP > MONITOR_SPOTS | Updated {len(changes)} parking spot(s).")
+        else:
+            ## Follow the leader's writes without making any
+            changes = engine.follow(spots, sensors)
+
+        ## Full recount of the area aggregates from the download to correct any drift
+        for spot, free in changes.items():
+            if spot in spots:
+                spots[spot] = dict(spots[spot], free=free)
+        drift = areas.recount(spots, is_true)
+        spatial.rebuild(spots, is_true)
+        history.observe(spots, is_true, persist=leading)
+        if drift:
+            logging.info(f"APP > MONITOR_SPOTS | Area counts corrected for {drift} spot(s).")
+        logging.info(f"APP > MONITOR_SPOTS | Cache stats: {rtdb_cache.stats()}")
+        logging.info(f"APP > MONITOR_SPOTS | Write buffer stats: {writes.stats()}")
+    finally:
+        metrics.tick_duration.observe(time.perf_counter() - start)
+        tick_lock.release()
+
+
+###################################################################
+## Prometheus metrics
+@app.route("/metrics")
+def prometheus_metrics():
+    """Returns route latency, datastore call and monitor_spots tick metrics
+        in the Prometheus text format."""
+
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
 ###################################################################
 ## Home Page view
 @app.route("/")
@@ -167,14 +612,21 @@ async def data():
 @app.route("/data/sensor/view")
 @app.route("/data/sensor/view/")
 async def sensor_data_view_home():
-    ## Query for list of sensors:
-    sensors = db.reference('sensors').get()
-    
-    ## Create empty list if none exists
-    if sensors is None:
-        sensors = {}
+    ## Query for one page of sensors:
+    sensors, next, limit = read_page('sensors')
+
+    return stream_template('sensor_data_home.html', sensors=sensors, next=next, limit=limit)
+
+
+## Paginated JSON list of sensors
+@app.route("/data/sensors")
+@app.route("/data/sensors/")
+async def sensors_list():
+    """Returns one page of sensors ordered by id, and the cursor of the next
+        page (None on the last page)."""
 
-    return render_template('sensor_data_home.html', sensors=sensors)
+    sensors, next, limit = read_page("sensors")
+    return {"sensors": sensors, "next": next}
 
 ###################################################################
 ## Data View Page (Human-readable version)
@@ -184,7 +636,7 @@ async def sensor_data_view(id=None):
         a given sensor id."""
 
     ## Check if sensor exists:
-    data = db.reference(f"sensors/{id}").get()
+    data = store.get(f"sensors/{id}")
     if data is None:
         data = {'error': 'Sensor ID does not exist in RTDB.'}
         return render_template('sensor_data_nonexist.html')
@@ -202,34 +654,18 @@ async def sensor_data(id=None):
     if request.method == "GET":
 
         ## Return the sensor data from the given ID
-        data = db.reference(f"sensors/{id}").get()
+        data = writes.overlay(id, store.get(f"sensors/{id}"))
         if data is None:
             data = {'error': 'Sensor ID does not exist in RTDB.'}
         return data
 
     elif request.method == "POST":
         # Get values from POST body:
-        if request.is_json:# is None:
-            data = request.get_json()
-        else:
-            try:
-                data = request.get_data()
-                if type(data) is bytes:
-                    data = data.decode('utf8')
-                if "&" in data:
-                    keys = data.split("&")
-                    data = {}
-                    for k in keys:
-                        d = k.split("=")
-                        data[d[0]] = d[1]
-                else:
-                    data = eval(data)
-            except Exception as e:
-                logging.warning("APP > SENSOR_DATA | Invalid data type " + 
-                    "provided on JSON read.")
-                data = {"error": "Invalid data type provided. Please ensure " + \
-                        "you're setting data type in body to JSON."}
-                return data
+        data = parse_body(request)
+        if data is None:
+            logging.warning("APP > SENSOR_DATA | Invalid data type " + 
+                "provided on body read.")
+            return {"error": BODY_ERROR}
         
         # First, we authenticate
         for key in data:
@@ -237,14 +673,22 @@ async def sensor_data(id=None):
                 ## Attempt to create ID (will error out otherwise):
                 if "id" in data:
                     id = data["id"]
-                # print(await util.exists("sensors", id, db))
-                if not (await util.exists("sensors", id, db)):
+                try:
+                    currData = await util.fetch("sensors", id, store)
+                except Exception as e:
+                    logging.error(f"{e} | APP > SENSOR_DATA | Unable to read {id} before updating it.")
+                    return {"error": util.UNAVAILABLE}, 503
+                if currData is None:
                     ## Confirm all parameters are present:
                     if (await util.verify_parameters(data)):
                         ## Add sensor to the RTDB:
                         # print("carrie underwood")
                         # print(data)
-                        _err, data = await util.add_sensor_to_rtdb(data, db)
+                        _err, data = await util.add_sensor_to_rtdb(data, store)
+                        if util.unavailable(data):
+                            return data, 503
+                        if not _err:
+                            engine.notify(data["id"], data)
                         ## Remove auth key from response
                         if "key" in data:
                             del data["key"]
@@ -254,28 +698,44 @@ async def sensor_data(id=None):
 
                 ## Confirm authentication
                 if (await util.auth_id(id, data[key])):
-                    
-                    ## Get current item:
-                    currData = db.reference(f"sensors/{id}").get()
-                    
+
+                    ## Field names become RTDB keys, so reject any it can't store
+                    bad = [k for k in data if not k or util.INVALID_KEY_CHARS & set(str(k))]
+                    if bad:
+                        return {"error": f"Invalid field name(s): {bad}."}
+
                     ## Compare current spot to new spot, if exists:
+                    relinked = False
                     if "spot" in data:
                         if data["spot"] != currData["spot"]:
-                            resp = await util.update_sensor_spot(data, id, db)
+                            resp = await util.update_sensor_spot(data, id, store)
+                            if util.unavailable(resp):
+                                return resp, 503
                             if "error" in resp:
                                 return resp["error"]
+                            relinked = True
 
                     ## Remove auth key from data
                     if "key" in data:
                         del data["key"]
 
+                    ## Queue the fields; repeats of a pending or written value are dropped
+                    if "spot" in data:
+                        currData["spot"] = data["spot"]
+                    try:
+                        changed = writes.put(id, data)
+                    except Exception as e:
+                        logging.error(f"{e} | APP > SENSOR_DATA | Unable to write sensor {id}.")
+                        return {"error": util.UNAVAILABLE}, 503
+                    currData = writes.overlay(id, currData)
+
                     ## Add to existing object, appending whatever is missing:
                     for i in currData:
                         if i not in data:
                             data[i] = currData[i]
 
-                    ## Update DB value
-                    db.reference(f'sensors/{id}').set(data)
+                    if changed or relinked:
+                        engine.notify(id, data)
                     data['updated'] = 'true'
                     return data
 
@@ -295,17 +755,20 @@ async def sensor_spot(id=None):
         return {"error": "None-type provided for sensor ID"}
 
     if request.method == 'GET':
-        ## Confirm sensor exists:
-        if (await util.exists("sensors", id, db)):
+        ## Confirm sensor exists, from the fleet model when it is current for the sensor:
+        sensor = modeled_sensor(id)
+        if sensor is None:
+            sensor = await util.fetch("sensors", id, store)
+        if sensor is not None:
             try:
                 ## Query for spot in sensor object:
-                spot = db.reference(f"sensors/{id}").get()["spot"]
+                spot = sensor["spot"]
             except Exception as e:
                 logging.warning("APP > SENSOR_SPOT | Sensor spot key does not exist")
                 return {"error": "Sensor spot key does not exist in RTDB."}
             
             ## Return spot:
-            spot = db.reference(f"spots/{spot}").get()
+            spot = store.get(f"spots/{spot}")
             if spot is None:
                 spot = {"error": "Spot does not exist or is not configured."}
             return spot
@@ -315,20 +778,18 @@ async def sensor_spot(id=None):
 
     # Get values from POST body:
     elif request.method == 'POST':
-        content_type = request.headers.get('Content-Type')
-        if (content_type == 'application/json'):
-            data = request.get_json()
-        else:
-            try:
-                data = json.loads(request.data)
-            except Exception as e:
-                logging.warning("APP > SENSOR_DATA | Invalid data type " + 
-                    "provided on JSON read.")
-                data = {"error": "Invalid data type provided. Please ensure" + \
-                        "you're setting data type in body to JSON."}
-                return data
+        data = parse_body(request)
+        if data is None:
+            logging.warning("APP > SENSOR_SPOT | Invalid data type " + 
+                "provided on body read.")
+            return {"error": BODY_ERROR}
         
-        return await util.update_sensor_spot(data, id, db)
+        resp = await util.update_sensor_spot(data, id, store)
+        if util.unavailable(resp):
+            return resp, 503
+        if "error" not in resp:
+            engine.notify(id, resp)
+        return resp
 
 
 
@@ -346,15 +807,10 @@ async def init(id=None):
     ## Check request type and process input:
     if request.method == "POST":
         ## Get values from POST body:
-        content_type = request.headers.get('Content-Type')
-        if (content_type == 'application/json'):
-            data = request.get_json()
-        else:
-            try:
-                data = json.loads(request.data)
-            except Exception as e:
-                print(f"{e} || Exception while processing json from request.data")
-                return {}
+        data = parse_body(request)
+        if data is None:
+            logging.warning("APP > INIT | Invalid data type provided on body read.")
+            return {}
 
         ## Confirm that values from POST body are valid:
         _ok = await util.verify_parameters(data)
@@ -363,7 +819,11 @@ async def init(id=None):
             return {'error': 'Invalid parameters provided.'}
 
         ## Create Sensor object in RTDB and add to keys
-        _err, s = await util.add_sensor_to_rtdb(data, db)
+        _err, s = await util.add_sensor_to_rtdb(data, store)
+        if util.unavailable(s):
+            return s, 503
+        if not _err:
+            engine.notify(s["id"], s)
 
         ## If error occurs, return the error message as a JSON obj
         if _err:
@@ -371,11 +831,41 @@ async def init(id=None):
             return s
 
         ## Otherwise, return the newly created object
-        s["url"] = os.environ.get("FIREBASE_URL")+f"sensors/{s['id']}"
+        s["url"] = os.environ.get("FIREBASE_URL", "")+f"sensors/{s['id']}"
         return s
 
 
 
+###################################################################
+## Batch sensor ingestion for gateways
+@app.route("/data/sensors/batch", methods=["POST"])
+async def sensors_batch():
+    """Accepts an array of sensor records ({id, key, value, ...}), as JSON
+        or msgpack, and commits every valid one in a single multi-path update.
+
+        Returns a status entry for each record, in the order received."""
+
+    data = parse_body(request, types=(dict, list))
+    if isinstance(data, dict):
+        data = data.get("records")
+    if not isinstance(data, list):
+        return {"error": "Batch must be an array of sensor records."}
+    if len(data) > BATCH_LIMIT:
+        return {"error": f"Batch is limited to {BATCH_LIMIT} records."}
+
+    ## Write out buffered single updates first so they can't land on top
+    writes.flush()
+    statuses, sensors = await util.ingest_batch(data, store, modeled_sensor)
+    if sensors:
+        engine.notify_many(sensors)
+
+    ## Nothing was written; the gateway should retry the batch
+    if any(util.unavailable(s) for s in statuses):
+        return {"results": statuses}, 503
+    return {"results": statuses}
+
+
+
 ###################################################################
 ## Spot Home View Page (Human-readable version)
 @app.route("/data/spot")
@@ -383,25 +873,46 @@ async def init(id=None):
 @app.route("/data/spot/view")
 @app.route("/data/spot/view/")
 async def spots_view():
-    """Returns a comprehensive list of all spots in the RTDB."""
+    """Returns a paginated list of the spots in the RTDB."""
 
-    spots = db.reference("spots").get()
+    spots, next, limit = read_page("spots")
 
-    return render_template("spots_view.html", spots=spots)
+    return stream_template("spots_view.html", spots=spots, next=next, limit=limit)
 
 
 
 ###################################################################
 ## Spot JSON Object Return
-@app.route("/data/spot/<id>")
+@app.route("/data/spot/<id>", methods=["GET", "POST"])
 async def spot_obj(id=None):
-    """Returns JSON object of spot information."""
+    """Returns JSON object of spot information. A POST with "lat" and "lon"
+        sets the spot's coordinates, creating the spot if needed; it needs
+        the "key" of the linked sensor named by "sensor", or the admin key."""
     if id is None:
         spot = {}
 
-    if (await util.exists("spots", id, db)):    
-        spot = db.reference(f"/spots/{id}").get()
-    else:
+    if request.method == "POST":
+        data = parse_body(request)
+        if data is None:
+            return {"error": BODY_ERROR}
+        try:
+            authorized = await util.auth_spot(id, data, store)
+        except Exception as e:
+            logging.error(f"{e} | APP > SPOT_OBJ | Unable to read {id} before updating it.")
+            return {"error": util.UNAVAILABLE}, 503
+        if not authorized:
+            return {"error": "No Authentication key was provided to update the spot."}
+        coords = coords_of(data)
+        if coords is None:
+            return {"error": "Valid lat and lon must be provided."}
+
+        _err, spot = await util.locate_spot(id, coords, store)
+        if not _err:
+            spatial.track(id, coords[0], coords[1], is_true(spot.get("free")))
+        return spot
+
+    spot = await util.fetch("spots", id, store)
+    if spot is None:
         spot = {}
 
     return spot
@@ -412,21 +923,21 @@ async def spot_obj(id=None):
 ## Spot JSON Object Return
 @app.route("/data/spot/<id>/free")
 async def spot_free(id=None):
-    """Returns True or False if spot is available."""
+    """Returns "true" or "false" if spot is available."""
     if id is None:
-        free = False
+        return "false"
 
-    if (await util.exists("spots", id, db)):
+    ## The engine's fleet model has the free value of every spot it owns
+    free = engine.fleet.free(id) if engine_current(id) else None
+    if free is None:
         try:  
-            spot = db.reference(f"/spots/{id}").get()
-            free = spot["free"]
+            spot = await util.fetch("spots", id, store)
         except Exception as e:
             logging.warn(f"{e} | APP > SPOT_OBJ | Error getting Spot object from Firebase.")
-            free = False
-    else:
-        free = False
+            return {"error": "Spot data is unavailable right now."}, 503
+        free = spot is not None and is_true(spot.get("free"))
 
-    return free
+    return "true" if free else "false"
 
 
 
@@ -435,15 +946,198 @@ async def spot_free(id=None):
 @app.route("/data/spots")
 @app.route("/data/spots/")
 async def spots_avail():
-    """Returns True or False if spot is available."""
+    """Returns the list of spots. With ?since=<version> only the spots that
+        changed since that version are returned, and If-None-Match with the
+        current ETag gets a 304 when nothing changed. With ?cursor= or
+        ?limit= one page of spots is returned instead."""
 
-    try:  
-        spots = db.reference(f"/spots").get()
+    if "cursor" in request.args or "limit" in request.args:
+        spots, next, limit = read_page("spots")
+        return {"spots": spots, "next": next}
+
+    since = request.args.get("since")
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return {"error": "since must be a version number returned by /data/spots."}
+
+    ## The version is read before the spots, so it never runs ahead of them.
+    ## A warm snapshot or an unreachable datastore gives no version.
+    warm = store.snapshot is not None and "spots" in store.snapshot
+    current = None if warm else spot_versions.current()
+    if current is not None:
+        counter, version = current
+        etag = f"{counter}-{since}" if since is not None else str(counter)
+        headers = {"X-Spots-Version": str(version)}
+        if request.if_none_match.contains(etag):
+            response = Response(status=304, headers=headers)
+            response.set_etag(etag)
+            return response
+
+    try:
+        if current is None:
+            spots = as_dict(store.get("spots"))
+        else:
+            spots = spot_versions.spots(counter)
+            if since is not None:
+                full, changed, deleted = spot_versions.since(since, spots, counter)
     except Exception as e:
+        ## An empty list would tell drivers the lot is empty
         logging.warn(f"{e} | APP > SPOT_OBJ | Error getting Spots list from Firebase.")
-        spots = {}
+        return {"error": "Spot data is unavailable right now."}, 503
 
-    return spots
+    if since is None:
+        response = app.make_response(spots)
+    elif current is None:
+        response = app.make_response({"version": None, "full": True, "spots": spots, "deleted": []})
+    else:
+        response = app.make_response({
+            "version": version,
+            "full": full,
+            "spots": {id: spots[id] for id in changed},
+            "deleted": deleted,
+        })
+
+    if current is not None:
+        response.headers.update(headers)
+        response.set_etag(etag)
+    return response
+
+
+
+###################################################################
+## Closest free spots
+@app.route("/data/spots/nearest")
+async def spots_nearest():
+    """Returns the k closest free spots to ?lat=&lon=, nearest first, with
+        their distance in meters. ?radius= limits the search in meters."""
+
+    coords = coords_of(request.args)
+    if coords is None:
+        return {"error": "Valid lat and lon must be provided."}
+    try:
+        k = min(max(int(request.args.get("k", 5)), 1), 100)
+        radius = request.args.get("radius")
+        radius = float(radius) if radius is not None else None
+    except ValueError:
+        return {"error": "k and radius must be numbers."}
+
+    found = spatial.nearest(coords[0], coords[1], k, radius)
+    return {"spots": [{"id": spot, "lat": lat, "lon": lon, "distance": round(d, 1)}
+                      for d, spot, lat, lon in found]}
+
+
+
+###################################################################
+## Spot availability change stream
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def stream_params(args, last=None):
+    """Returns (Last-Event-ID, event filter) for a stream request from its
+        query arguments and Last-Event-ID header."""
+
+    def split(arg):
+        return [v for v in args.get(arg, "").split(",") if v]
+
+    last = last if last is not None else args.get("last")
+    try:
+        last = int(last) if last is not None else None
+    except ValueError:
+        last = None
+    return last, spot_filter(split("spot"), split("area"))
+
+
+@app.route("/data/spots/stream")
+def spots_stream():
+    """Streams spot free transitions as Server-Sent Events. Optional
+        ?spot=<id>,<id> and ?area=<area>,<area> filters; reconnecting
+        clients resume from their Last-Event-ID. Each client holds a server
+        thread here, so past STREAM_MAX_SUBSCRIBERS they get a 503; under
+        asgi.py the stream is served from the event loop instead."""
+
+    if broadcaster.full():
+        return {"error": "Too many stream subscribers, try again later."}, 503, {"Retry-After": "30"}
+
+    last, match = stream_params(request.args, request.headers.get("Last-Event-ID"))
+    events = broadcaster.subscribe(last, match, blocking=True)
+    return Response(events, content_type="text/event-stream", headers=STREAM_HEADERS)
+
+
+
+###################################################################
+## Occupancy history
+def history_range():
+    """Returns (period, start, end) from the ?period=hour|day, ?from= and
+        ?to= (epoch seconds) arguments, defaulting to the last day of hours
+        or the last 30 days."""
+
+    period = request.args.get("period", "hour")
+    if period not in PERIODS:
+        raise ValueError("period must be hour or day.")
+    end = float(request.args.get("to", time.time()))
+    start = float(request.args.get("from", end - PERIODS[period] * (24 if period == "hour" else 30)))
+    return period, start, end
+
+
+@app.route("/data/spot/<id>/history")
+async def spot_history(id=None):
+    """Returns a spot's free/occupied seconds and utilization per hour or
+        day from the rollups, plus its most recent raw transitions."""
+
+    try:
+        period, start, end = history_range()
+    except ValueError as e:
+        return {"error": f"Invalid range: {e}"}
+
+    return {
+        "id": id,
+        "period": period,
+        "buckets": history.spot(id, start, end, period),
+        "recent": [{"ts": ts, "free": free} for ts, free in history.recent(id)],
+    }
+
+
+@app.route("/data/areas/<area>/utilization")
+async def area_utilization(area=None):
+    """Returns an area's utilization per hour or day from the rollups and
+        its busiest period."""
+
+    try:
+        period, start, end = history_range()
+    except ValueError as e:
+        return {"error": f"Invalid range: {e}"}
+
+    buckets = history.area(area, start, end, period)
+    rated = [b for b in buckets if b["utilization"] is not None]
+    return {
+        "area": area,
+        "period": period,
+        "buckets": buckets,
+        "peak": max(rated, key=lambda b: b["utilization"]) if rated else None,
+    }
+
+
+
+###################################################################
+## Availability per area
+@app.route("/data/areas")
+@app.route("/data/areas/")
+async def areas_summary():
+    """Returns the number of free and total spots in every area and overall."""
+
+    return areas.summary()
+
+
+@app.route("/data/areas/<area>")
+async def area_summary(area=None):
+    """Returns the number of free and total spots in one area."""
+
+    counts = areas.area(area)
+    if counts is None:
+        return {"error": f"Area {area} has no spots."}
+    return counts
 
 
 
@@ -455,9 +1149,8 @@ async def spot_view(id=None):
     if id is None:
         spot = {}
 
-    if (await util.exists("spots", id, db)):    
-        spot = db.reference(f"/spots/{id}").get()
-    else:
+    spot = await util.fetch("spots", id, store)
+    if spot is None:
         spot = {}
 
     return render_template('spot_view.html', spot=spot)
@@ -473,7 +1166,7 @@ async def plates():
     """Returns a list of the plates that are currently in the RTDB."""
 
     try:
-        plates = db.reference(f"/plates").get()
+        plates = plate_index.all()
     except Exception as e:
         logging.warn(f"{e} | APP > PLATES | Error getting Plates list from Firebase.")
         plates = {}
@@ -481,46 +1174,98 @@ async def plates():
 
 
 
+##################################################
+## Plates bulk check
+##
+@app.route("/data/plates/check", methods=["POST"])
+async def plates_check():
+    """Answers whether each plate in a batch ({"plates": [...]} or a bare
+        list) is in the permit list."""
+
+    data = parse_body(request, types=(dict, list))
+    if isinstance(data, dict):
+        data = data.get("plates")
+    if not isinstance(data, list):
+        return {"error": "Check must be an array of plates."}
+    if len(data) > BATCH_LIMIT:
+        return {"error": f"Check is limited to {BATCH_LIMIT} plates."}
+
+    return {"results": plate_index.check([str(p) for p in data])}
+
+
+
+##################################################
+## Plates bulk add and delete
+##
+@app.route("/data/plates/bulk", methods=["POST"])
+async def plates_bulk():
+    """Adds and deletes many plates in one multi-path update. The body has
+        "add", a {plate: object} map or a list of plates, and/or "delete", a
+        list of plates."""
+
+    data = parse_body(request)
+    if data is None:
+        return {"error": BODY_ERROR}
+
+    add = data.get("add") or {}
+    if isinstance(add, list):
+        add = {str(plate): True for plate in add}
+    delete = [str(plate) for plate in data.get("delete") or []]
+    if not isinstance(add, dict):
+        return {"error": "add must be a map of plates to objects or a list of plates."}
+    if len(add) + len(delete) > BATCH_LIMIT:
+        return {"error": f"Bulk updates are limited to {BATCH_LIMIT} plates."}
+    bad = [p for p in list(add) + delete if not p or util.INVALID_KEY_CHARS & set(p)]
+    if bad:
+        return {"error": f"Invalid plate id(s): {bad}"}
+
+    updates = {f"plates/{plate}": obj for plate, obj in add.items()}
+    updates.update({f"plates/{plate}": None for plate in delete})
+    if not updates:
+        return {"added": [], "deleted": []}
+    try:
+        store.update("/", updates)
+    except Exception as e:
+        logging.error(f"{e} | APP > PLATES_BULK | Unable to write {len(updates)} plate(s).")
+        return {"error": "Error updating plates in RTDB."}
+
+    plate_index.deleted(delete)
+    plate_index.added(add)
+    return {"added": list(add), "deleted": delete}
+
+
+
 ##################################################
 ## Plates list
 ##
 @app.route("/data/plates/<id>", methods=["GET", "POST", "DELETE"])
 async def plates_getset(id=None):
-    """Adds or removes a plate to/from the RTDB."""
+    """Returns, adds or removes a plate to/from the RTDB."""
     if id is None:
         return {"error": "None id type provided."}
 
+    if request.method == "GET":
+        plate = plate_index.get(id)
+        if plate is None:
+            return {"error": "Plate does not exist in RTDB."}
+        return {"id": id, "plate": plate}
+
     if request.method == "POST":
 
         # Get values from POST body:
-        if request.is_json:# is None:
-            data = request.get_json()
-        else:
-            try:
-                data = request.get_data()
-                if type(data) is bytes:
-                    data = data.decode('utf8')
-                if "&" in data:
-                    keys = data.split("&")
-                    data = {}
-                    for k in keys:
-                        d = k.split("=")
-                        data[d[0]] = d[1]
-                else:
-                    data = eval(data)
-            except Exception as e:
-                logging.warning("APP > SENSOR_DATA | Invalid data type " + 
-                    "provided on JSON read.")
-                data = {"error": "Invalid data type provided. Please ensure " + \
-                        "you're setting data type in body to JSON."}
-                return data
+        data = parse_body(request)
+        if data is None:
+            logging.warning("APP > PLATES | Invalid data type " + 
+                "provided on body read.")
+            return {"error": BODY_ERROR}
 
         ## Adding a plate:
         try:
-            if (await util.exists("plates", id, db)):
+            if plate_index.get(id) is not None:
                 return {"error": "Plate already exists in RTDB."}
             
-            plates = db.reference(f"/plates/{id}").set(data)
+            store.set(f"plates/{id}", data)
+            plate_index.added({id: data})
         except Exception as e:
             logging.warn(f"{e} | APP > PLATES | Error getting Plates list from Firebase.")
             plates = {}
@@ -528,8 +1273,9 @@ async def plates_getset(id=None):
 
     elif request.method == "DELETE":
         try:
-            if (await util.exists("plates", id, db)):
-                db.reference(f"/plates/{id}").delete()
+            if plate_index.get(id) is not None:
+                store.delete(f"plates/{id}")
+                plate_index.deleted([id])
                 return {"status": f"{id} deleted from RTDB."}
         except Exception as e:
             logging.warn(f"{e} | APP > PLATES | Error deleting {id} from RTDB.")
@@ -0,0 +1,106 @@
+## Python-specific imports
+import threading
+
+
+def area_of(obj):
+    """Returns the area of a spot or sensor object ("area", or the Sensor
+        model's "Area"), or None."""
+
+    if not isinstance(obj, dict):
+        return None
+    area = obj.get("area", obj.get("Area"))
+    if area in (None, ""):
+        return None
+    return str(area)
+
+
+###################################################################
+## Availability aggregates
+class AreaCounts:
+    """Free and total spot counts per area and for the whole lot.
+
+        track() is called with a spot's area and free value whenever either
+        may have changed and adjusts the counters by the difference, so every
+        update and every read is O(1). recount() rebuilds everything from a
+        full snapshot of /spots to correct any drift. Spots without an area
+        are only counted in the global totals."""
+
+    def __init__(self):
+        self.spots = {}
+        self.counts = {}
+        self.free = 0
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def _add(self, area, free, sign):
+        self.total += sign
+        self.free += sign * free
+        if area is None:
+            return
+        counts = self.counts.setdefault(area, [0, 0])
+        counts[0] += sign * free
+        counts[1] += sign
+        if counts[1] == 0:
+            del self.counts[area]
+
+    def track(self, spot, area, free):
+        """Records spot's current area and free value. An area of None keeps
+            the area already known for the spot."""
+
+        free = bool(free)
+        with self.lock:
+            old = self.spots.get(spot)
+            if old is not None:
+                if area is None:
+                    area = old[0]
+                if old == (area, free):
+                    return
+                self._add(old[0], old[1], -1)
+            self.spots[spot] = (area, free)
+            self._add(area, free, 1)
+
+    def discard(self, spot):
+        with self.lock:
+            old = self.spots.pop(spot, None)
+            if old is not None:
+                self._add(old[0], old[1], -1)
+
+    def recount(self, spots, is_free):
+        """Rebuilds the counters from {spot id: spot object}. Returns the
+            number of spots whose tracked state had drifted."""
+
+        fresh = {}
+        for spot, obj in spots.items():
+            if isinstance(obj, dict):
+                fresh[spot] = (area_of(obj), bool(is_free(obj.get("free"))))
+
+        with self.lock:
+            drift = sum(1 for spot, state in fresh.items() if self.spots.get(spot) != state)
+            drift += sum(1 for spot in self.spots if spot not in fresh)
+            self.spots = {}
+            self.counts = {}
+            self.free = self.total = 0
+            for spot, (area, free) in fresh.items():
+                self.spots[spot] = (area, free)
+                self._add(area, free, 1)
+        return drift
+
+    ## Reads ######################################################
+    def area(self, area):
+        """Returns {"area", "free", "total"} for one area, or None."""
+
+        with self.lock:
+            counts = self.counts.get(str(area))
+            if counts is None:
+                return None
+            return {"area": str(area), "free": counts[0], "total": counts[1]}
+
+    def summary(self):
+        """Returns the global counts and the counts of every area."""
+
+        with self.lock:
+            return {
+                "free": self.free,
+                "total": self.total,
+                "areas": {area: {"free": c[0], "total": c[1]} for area, c in self.counts.items()},
+            }
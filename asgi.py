@@ -0,0 +1,80 @@
+## Python-specific imports
+import os
+import asyncio
+from urllib.parse import parse_qsl
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+
+###################################################################
+## Custom imports
+from app import app, broadcaster, stream_params, STREAM_HEADERS
+
+
+## ASGI entry point for the async serving mode:
+##     uvicorn --host 0.0.0.0 --port 8080 asgi:application
+## The server's event loop holds the connections, and each request runs on
+## a thread of its own (at most ASGI_THREADS at once), where its RTDB reads
+## wait on the pooled keep-alive session instead of on one of gunicorn's 8
+## threads. /data/spots/stream is served on the loop itself.
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS", 256))
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi that runs every request in its own ThreadSensitiveContext,
+        the way Django's ASGI handler does. asgiref otherwise runs every
+        thread-sensitive call, so every request, on one shared thread."""
+
+    def __init__(self, wsgi_application, threads=ASGI_THREADS):
+        super().__init__(wsgi_application)
+        self.threads = threads
+        self.slots = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] == "http" and scope["method"] == "GET" and \
+                scope["path"].rstrip("/") == "/data/spots/stream":
+            await self.stream(scope, receive, send)
+            return
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.threads)
+        async with self.slots:
+            async with ThreadSensitiveContext():
+                await super().__call__(scope, receive, send)
+
+
+    async def stream(self, scope, receive, send):
+        """Serves /data/spots/stream on the event loop, so an open stream
+            holds no thread."""
+
+        args = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        last, match = stream_params(args, headers.get("last-event-id"))
+
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream"),
+            *[(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in STREAM_HEADERS.items()],
+        ]})
+        async def disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        events = broadcaster.subscribe_async(last, match)
+        gone = asyncio.ensure_future(disconnect())
+        try:
+            async for message in events:
+                if gone.done():
+                    break
+                await send({"type": "http.response.body", "body": message.encode("utf8"), "more_body": True})
+        finally:
+            gone.cancel()
+            await events.aclose()
+
+
+application = PooledWsgiToAsgi(app)
@@ -0,0 +1,603 @@
+## Python-specific imports
+import os
+import copy
+import time
+import json
+import logging
+import sqlite3
+import threading
+
+
+def split(path):
+    """Returns the non-empty segments of an RTDB path."""
+
+    return [p for p in str(path or "").split("/") if p]
+
+
+def prune(value):
+    """Drops None values and empty objects the way the RTDB does on write."""
+
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            v = prune(v)
+            if v is not None:
+                out[str(k)] = v
+        return out or None
+    if isinstance(value, list):
+        return prune({str(i): v for i, v in enumerate(value)})
+    return value
+
+
+def resolve(value, current, parts=()):
+    """Replaces the RTDB server values in value ({".sv": "timestamp"} and
+        {".sv": {"increment": n}}) the way the RTDB does when the write
+        lands. current(parts) returns the value stored at a path."""
+
+    if not isinstance(value, dict):
+        return value
+    sv = value.get(".sv") if len(value) == 1 else None
+    if sv == "timestamp":
+        return int(time.time() * 1000)
+    if isinstance(sv, dict) and "increment" in sv:
+        base = current(list(parts))
+        return (base if isinstance(base, (int, float)) and not isinstance(base, bool) else 0) + sv["increment"]
+    return {k: resolve(v, current, parts + (str(k),)) for k, v in value.items()}
+
+
+###################################################################
+## Storage backend interface
+class Backend:
+    """Datastore used by the app. reference(path) must return an object with
+        the get/set/update/delete (and optionally listen) operations of a
+        firebase_admin.db.Reference."""
+
+    name = None
+
+    def reference(self, path="/"):
+        raise NotImplementedError
+
+    def unreachable(self, e):
+        """True if the exception e means the datastore couldn't be reached,
+            as opposed to a bad request."""
+
+        return isinstance(e, OSError)
+
+
+class Event:
+    """Change event with the same fields as firebase_admin.db.Event."""
+
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+###################################################################
+## Firebase RTDB
+class FirebaseBackend(Backend):
+    """The Firebase Realtime Database, via firebase_admin. firebase_admin is
+        imported and the app initialized on first use, so a cold start can
+        serve from a snapshot before paying for either. Every HTTP call gives
+        up after timeout seconds (RTDB_TIMEOUT)."""
+
+    name = "firebase"
+
+    def __init__(self, cert=None, url=None, timeout=None):
+        self.cert = cert or os.environ.get("FIREBASE_AUTH_LOC")
+        self.url = url or os.environ.get("FIREBASE_URL")
+        self.timeout = timeout if timeout is not None else float(os.environ.get("RTDB_TIMEOUT", 5))
+        self.app = None
+        self.db = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        """Initializes firebase_admin once and returns its db module."""
+
+        if self.db is not None:
+            return self.db
+        with self.lock:
+            if self.db is None:
+                start = time.perf_counter()
+                import firebase_admin
+                from firebase_admin import credentials
+                from firebase_admin import db
+
+                cred = credentials.Certificate(self.cert)
+                self.app = firebase_admin.initialize_app(cred, {
+                    'databaseURL': self.url,
+                    'httpTimeout': self.timeout,
+                })
+                self.pool(db, int(os.environ.get("RTDB_POOL", 32)))
+                self.db = db
+                logging.info(f"BACKENDS > CONNECT | Firebase ready in {time.perf_counter() - start:.3f} s.")
+        return self.db
+
+    def pool(self, db, size):
+        """Widens the keep-alive connection pool of firebase_admin's HTTP
+            session. requests keeps 10 connections per host by default and
+            drops the rest, so concurrent calls past that would reconnect."""
+
+        import requests
+
+        try:
+            session = db.reference("/")._client.session
+        except AttributeError as e:
+            logging.warning(f"{e} | BACKENDS > POOL | Unable to reach the RTDB session, keeping its pool.")
+            return
+        for prefix, adapter in list(session.adapters.items()):
+            session.mount(prefix, requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=size, max_retries=adapter.max_retries))
+
+    def reference(self, path="/"):
+        return self.connect().reference(path)
+
+    def unreachable(self, e):
+        from firebase_admin import exceptions
+
+        return isinstance(e, (OSError, exceptions.UnavailableError, exceptions.DeadlineExceededError))
+
+
+###################################################################
+## Local stand-ins
+class LocalBackend(Backend):
+    """Base for the in-process backends. Subclasses implement get(path) and
+        write(base, values, event_type); this class turns committed writes
+        into put/patch events for listen()ers, like the RTDB's streaming API."""
+
+    def __init__(self):
+        self.listeners = []
+        self.listen_lock = threading.Lock()
+
+    def reference(self, path="/"):
+        return LocalReference(self, path)
+
+    def page(self, path, start=None, limit=None):
+        """Returns the children of path ordered by key, from key start
+            (inclusive), at most limit of them. Keys are ordered as strings."""
+
+        node = self.get(path)
+        if not isinstance(node, dict):
+            return None
+        keys = sorted(k for k in node if start is None or k >= start)
+        if limit is not None:
+            keys = keys[:limit]
+        return {k: node[k] for k in keys}
+
+    def transaction(self, path, fn):
+        """Replaces the value at path with fn(current value) atomically with
+            respect to other writers in this process. Returns the new value."""
+
+        with self.write_lock:
+            value = fn(self.get(path))
+            self.write(path, {"": value}, "put")
+        return value
+
+    ## Change feed ################################################
+    def listen(self, path, callback):
+        registration = ListenerRegistration(self, split(path), callback)
+        with self.listen_lock:
+            self.listeners.append(registration)
+        callback(Event("put", "/", self.get(path)))
+        return registration
+
+    def _dispatch(self, base, values, event_type):
+        with self.listen_lock:
+            listeners = list(self.listeners)
+
+        for listener in listeners:
+            target = listener.parts
+            patch = {}
+            for key, value in values.items():
+                parts = base + split(key)
+                if parts[:len(target)] == target:
+                    ## Write inside the listened path
+                    patch["/".join(parts[len(target):])] = copy.deepcopy(value)
+                elif target[:len(parts)] == parts:
+                    ## Write above it: resend the listened subtree
+                    patch[""] = None
+            if not patch:
+                continue
+            try:
+                if "" in patch:
+                    listener.callback(Event("put", "/", self.get("/".join(target))))
+                elif event_type == "put" and len(patch) == 1:
+                    key, value = next(iter(patch.items()))
+                    listener.callback(Event("put", "/" + key, value))
+                else:
+                    listener.callback(Event("patch", "/", patch))
+            except Exception as e:
+                logging.error(f"{e} | BACKENDS > DISPATCH | Listener callback failed.")
+
+
+class SQLiteBackend(LocalBackend):
+    """SQLite stand-in for the RTDB, for CI, load tests and air-gapped benches.
+
+        Each top-level domain with a table (spots, sensors, plates) stores one
+        row per child as JSON, with the fields used for lookups copied into
+        indexed columns. Any other top-level key is stored whole in the
+        `tree` table. The database runs in WAL mode with one connection per
+        thread. Writes dispatch in-process change events to listen()ers."""
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS spots (
+            id TEXT PRIMARY KEY,
+            free INTEGER,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS spots_free ON spots(free);
+
+        CREATE TABLE IF NOT EXISTS sensors (
+            id TEXT PRIMARY KEY,
+            spot TEXT,
+            type TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS sensors_spot ON sensors(spot);
+
+        CREATE TABLE IF NOT EXISTS plates (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS tree (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+    """
+
+    ## Indexed columns copied out of each row's JSON
+    COLUMNS = {
+        "spots": ("free",),
+        "sensors": ("spot", "type"),
+        "plates": (),
+    }
+
+    def __init__(self, path=None):
+        super().__init__()
+        self.path = path or os.environ.get("SQLITE_PATH", "rtdb.db")
+        self.local = threading.local()
+        self.write_lock = threading.RLock()
+        self.statements = self._prepare()
+
+        con = self._con()
+        con.executescript(self.SCHEMA)
+        con.commit()
+
+    def _prepare(self):
+        """Builds the fixed SQL statements once; sqlite3 keeps them compiled
+            in each connection's statement cache."""
+
+        stmts = {"tree": {
+            "get": "SELECT data FROM tree WHERE id = ?",
+            "all": "SELECT id, data FROM tree ORDER BY id",
+            "put": "INSERT OR REPLACE INTO tree (id, data) VALUES (?, ?)",
+            "delete": "DELETE FROM tree WHERE id = ?",
+            "clear": "DELETE FROM tree",
+        }}
+        for table, columns in self.COLUMNS.items():
+            cols = ", ".join(("id",) + columns + ("data",))
+            marks = ", ".join("?" * (len(columns) + 2))
+            stmts[table] = {
+                "get": f"SELECT data FROM {table} WHERE id = ?",
+                "all": f"SELECT id, data FROM {table} ORDER BY id",
+                "put": f"INSERT OR REPLACE INTO {table} ({cols}) VALUES ({marks})",
+                "delete": f"DELETE FROM {table} WHERE id = ?",
+                "clear": f"DELETE FROM {table}",
+            }
+        return stmts
+
+    def _con(self):
+        con = getattr(self.local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                  isolation_level=None, cached_statements=256)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self.local.con = con
+        return con
+
+    ## Reads ######################################################
+    def _row(self, domain, id):
+        con = self._con()
+        if domain in self.COLUMNS:
+            row = con.execute(self.statements[domain]["get"], (id,)).fetchone()
+            return json.loads(row[0]) if row else None
+        row = con.execute(self.statements["tree"]["get"], (domain,)).fetchone()
+        tree = json.loads(row[0]) if row else None
+        if id is None:
+            return tree
+        return tree.get(id) if isinstance(tree, dict) else None
+
+    def _all(self, domain):
+        con = self._con()
+        if domain in self.COLUMNS:
+            rows = con.execute(self.statements[domain]["all"]).fetchall()
+            return {id: json.loads(data) for id, data in rows} or None
+        return self._row(domain, None)
+
+    def get(self, path):
+        parts = split(path)
+        if not parts:
+            tree = {}
+            for domain in self.COLUMNS:
+                value = self._all(domain)
+                if value is not None:
+                    tree[domain] = value
+            for id, data in self._con().execute(self.statements["tree"]["all"]).fetchall():
+                tree[id] = json.loads(data)
+            return tree or None
+        if len(parts) == 1:
+            return self._all(parts[0])
+
+        node = self._row(parts[0], parts[1])
+        for key in parts[2:]:
+            if not isinstance(node, dict):
+                return None
+            node = node.get(key)
+        return node
+
+    def page(self, path, start=None, limit=None):
+        parts = split(path)
+        if len(parts) != 1 or parts[0] not in self.COLUMNS:
+            return super().page(path, start, limit)
+
+        ## One indexed range scan for the table-backed domains
+        sql = f"SELECT id, data FROM {parts[0]} WHERE id >= ? ORDER BY id"
+        args = [start if start is not None else ""]
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+        rows = self._con().execute(sql, args).fetchall()
+        return {id: json.loads(data) for id, data in rows}
+
+    def transaction(self, path, fn):
+        """Read-modify-write of path inside one BEGIN IMMEDIATE transaction,
+            so it is atomic across processes sharing the database file."""
+
+        parts = split(path)
+        with self.write_lock:
+            con = self._con()
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                value = fn(self.get(path))
+                self._write(parts, value)
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+        self._dispatch(parts, {"": value}, "put")
+        return value
+
+    ## Writes #####################################################
+    def _put_row(self, domain, id, value):
+        con = self._con()
+        if domain not in self.COLUMNS:
+            tree = self._row(domain, None) or {}
+            if id is None:
+                tree = value
+            elif value is None:
+                tree.pop(id, None)
+            else:
+                tree[id] = value
+            tree = prune(tree)
+            if tree is None:
+                con.execute(self.statements["tree"]["delete"], (domain,))
+            else:
+                con.execute(self.statements["tree"]["put"], (domain, json.dumps(tree)))
+            return
+
+        if value is None:
+            con.execute(self.statements[domain]["delete"], (id,))
+            return
+        columns = []
+        for col in self.COLUMNS[domain]:
+            v = value.get(col) if isinstance(value, dict) else None
+            columns.append(v if isinstance(v, (str, int, float)) or v is None else json.dumps(v))
+        con.execute(self.statements[domain]["put"], (id, *columns, json.dumps(value)))
+
+    def _write(self, parts, value):
+        """Writes value (None deletes) at the given path segments. Must be
+            called inside a transaction."""
+
+        value = prune(copy.deepcopy(value))
+        con = self._con()
+        if not parts:
+            for domain in self.COLUMNS:
+                con.execute(self.statements[domain]["clear"])
+            con.execute(self.statements["tree"]["clear"])
+            for k, v in (value or {}).items():
+                self._write([k], v)
+            return
+
+        domain = parts[0]
+        if len(parts) == 1:
+            if domain in self.COLUMNS:
+                con.execute(self.statements[domain]["clear"])
+                for id, v in (value if isinstance(value, dict) else {}).items():
+                    self._put_row(domain, id, v)
+            else:
+                self._put_row(domain, None, value)
+            return
+
+        id = parts[1]
+        if len(parts) == 2:
+            self._put_row(domain, id, value)
+            return
+
+        ## Deeper writes: read-modify-write of the row
+        row = self._row(domain, id)
+        row = row if isinstance(row, dict) else {}
+        node = row
+        for key in parts[2:-1]:
+            if not isinstance(node.get(key), dict):
+                node[key] = {}
+            node = node[key]
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+        self._put_row(domain, id, prune(row))
+
+    def write(self, base, values, event_type):
+        """Applies {relative path: value} under base in one transaction and
+            notifies listeners."""
+
+        base = split(base)
+        current = lambda parts: self.get("/".join(parts))
+        with self.write_lock:
+            con = self._con()
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                values = {key: resolve(value, current, tuple(base + split(key))) for key, value in values.items()}
+                for key, value in values.items():
+                    self._write(base + split(key), value)
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+        self._dispatch(base, values, event_type)
+
+
+class MemoryBackend(LocalBackend):
+    """Plain in-memory tree, for tests and benchmarks. Values are copied on
+        the way in and out, as they would be over the network."""
+
+    name = "memory"
+
+    def __init__(self, tree=None):
+        super().__init__()
+        self.root = prune(copy.deepcopy(tree)) or {}
+        self.write_lock = threading.RLock()
+
+    def get(self, path):
+        node = self.root
+        for key in split(path):
+            if not isinstance(node, dict):
+                return None
+            node = node.get(key)
+        if node == {}:
+            return None
+        return copy.deepcopy(node)
+
+    def _write(self, parts, value):
+        value = prune(copy.deepcopy(value))
+        if not parts:
+            self.root = value if isinstance(value, dict) else {}
+            return
+
+        node = self.root
+        parents = []
+        for key in parts[:-1]:
+            if not isinstance(node.get(key), dict):
+                node[key] = {}
+            parents.append((node, key))
+            node = node[key]
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+
+        ## Prune parents left empty by a delete
+        for parent, key in reversed(parents):
+            if parent[key]:
+                break
+            del parent[key]
+
+    def write(self, base, values, event_type):
+        base = split(base)
+        current = lambda parts: self.get("/".join(parts))
+        with self.write_lock:
+            values = {key: resolve(value, current, tuple(base + split(key))) for key, value in values.items()}
+            for key, value in values.items():
+                self._write(base + split(key), value)
+        self._dispatch(base, values, event_type)
+
+
+class ListenerRegistration:
+    def __init__(self, backend, parts, callback):
+        self.backend = backend
+        self.parts = parts
+        self.callback = callback
+
+    def close(self):
+        with self.backend.listen_lock:
+            if self in self.backend.listeners:
+                self.backend.listeners.remove(self)
+
+
+class LocalReference:
+    """db.Reference look-alike for the local backends."""
+
+    def __init__(self, backend, path):
+        self.backend = backend
+        self.path = "/".join(split(path))
+
+    def child(self, path):
+        return LocalReference(self.backend, f"{self.path}/{path}")
+
+    def get(self):
+        return self.backend.get(self.path)
+
+    def set(self, value):
+        self.backend.write(self.path, {"": value}, "put")
+
+    def update(self, value):
+        if not isinstance(value, dict) or not value:
+            raise ValueError("Update must be a non-empty dict.")
+        self.backend.write(self.path, value, "patch")
+
+    def delete(self):
+        self.backend.write(self.path, {"": None}, "put")
+
+    def listen(self, callback):
+        return self.backend.listen(self.path, callback)
+
+    def transaction(self, fn):
+        return self.backend.transaction(self.path, fn)
+
+    def order_by_key(self):
+        return LocalQuery(self.backend, self.path)
+
+
+class LocalQuery:
+    """db.Query look-alike supporting order_by_key() with start_at() and
+        limit_to_first()."""
+
+    def __init__(self, backend, path):
+        self.backend = backend
+        self.path = path
+        self.start = None
+        self.limit = None
+
+    def start_at(self, start):
+        self.start = str(start)
+        return self
+
+    def limit_to_first(self, limit):
+        self.limit = int(limit)
+        return self
+
+    def get(self):
+        return self.backend.page(self.path, self.start, self.limit)
+
+
+###################################################################
+## Backend selection
+BACKENDS = {
+    "firebase": FirebaseBackend,
+    "sqlite": SQLiteBackend,
+    "memory": MemoryBackend,
+}
+
+
+def from_env():
+    """Returns the backend named by RTDB_BACKEND (default firebase)."""
+
+    name = os.environ.get("RTDB_BACKEND", "firebase").lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown RTDB_BACKEND {name!r}, expected one of {sorted(BACKENDS)}.")
+    logging.info(f"BACKENDS > Using the {name} storage backend.")
+    return BACKENDS[name]()
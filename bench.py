@@ -0,0 +1,275 @@
+## Python-specific imports
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+from collections import Counter
+
+## The benchmark runs the app against the in-memory backend with the write
+## buffer in write-through mode, so every RTDB call happens inside the timed
+## operation and can be counted.
+os.environ.setdefault("RTDB_BACKEND", "memory")
+os.environ.setdefault("SENSOR_FLUSH_MS", "0")
+os.environ.setdefault("HISTORY_PATH", ":memory:")
+os.environ.setdefault("SCHEDULER_LEADER", "off")
+os.environ.setdefault("KEYS_PATH", ":memory:")
+
+###################################################################
+## Custom imports
+import app as service
+import backends
+import util
+from cache import rtdb_cache
+
+
+## Sensor type spellings seen in the field and the values they report
+TYPES = ["ultrasonic", "us", "usonic", "US", "lidar", "Lidar", "LIDAR"]
+VALUES = ["true", "false", "True", True, False, 1, 0]
+
+
+def make_fleet(n_sensors, seed=0, max_per_spot=4):
+    """Returns a synthetic {"spots": ..., "sensors": ...} tree with n_sensors
+        sensors spread 1 to max_per_spot per spot."""
+
+    rng = random.Random(seed)
+    spots, sensors = {}, {}
+    i = j = 0
+    while i < n_sensors:
+        spot = f"spot{j}"
+        j += 1
+        members = {"spot": spot}
+        for _ in range(min(rng.randint(1, max_per_spot), n_sensors - i)):
+            id = f"sensor{i}"
+            i += 1
+            sensors[id] = {"id": id, "type": rng.choice(TYPES), "value": rng.choice(VALUES), "spot": spot}
+            members[id] = id
+        spots[spot] = {"id": spot, "free": rng.choice([True, False, "true"]), "sensors": members}
+    return {"spots": spots, "sensors": sensors}
+
+
+###################################################################
+## Call counting
+class CountingBackend:
+    """Wraps a backend and counts reference() operations by type."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.counts = Counter()
+
+    def reference(self, path="/"):
+        return CountingReference(self, self.backend.reference(path))
+
+
+class CountingReference:
+    def __init__(self, counter, ref):
+        self.counter = counter
+        self.ref = ref
+
+    def _call(self, op, *args):
+        self.counter.counts[op] += 1
+        return getattr(self.ref, op)(*args)
+
+    def get(self):
+        return self._call("get")
+
+    def set(self, value):
+        return self._call("set", value)
+
+    def update(self, value):
+        return self._call("update", value)
+
+    def delete(self):
+        return self._call("delete")
+
+    def listen(self, callback):
+        return self.ref.listen(callback)
+
+
+###################################################################
+## Benchmarks
+def measure(name, fn, backend, repeat):
+    """Times fn(i) repeat times with a cold cache and returns the timings and
+        the average number of RTDB calls per operation."""
+
+    times = []
+    backend.counts.clear()
+    for i in range(repeat):
+        rtdb_cache.clear()
+        start = time.perf_counter()
+        fn(i)
+        times.append(time.perf_counter() - start)
+
+    calls = {op: n / repeat for op, n in sorted(backend.counts.items())}
+    return {
+        "op": name,
+        "repeat": repeat,
+        "seconds": {
+            "min": min(times),
+            "median": statistics.median(times),
+            "mean": statistics.fmean(times),
+        },
+        "rtdb_calls": calls,
+        "rtdb_calls_total": sum(calls.values()),
+    }
+
+
+def run_size(n_sensors, repeat, seed):
+    fleet = make_fleet(n_sensors, seed)
+    backend = CountingBackend(backends.MemoryBackend(fleet))
+    service.store.db = backend
+    rng = random.Random(seed)
+    sensors = list(fleet["sensors"])
+    spots = list(fleet["spots"])
+    client = service.app.test_client()
+    results = []
+
+    ## Occupancy pass: the first tick writes the randomized free values,
+    ## later ticks have nothing to change
+    results.append(measure("monitor_spots_first_tick", lambda i: service.monitor_spots(), backend, 1))
+    results.append(measure("monitor_spots", lambda i: service.monitor_spots(), backend, repeat))
+    ## Tick between sweeps in events mode: the model alone, nothing is read
+    results.append(measure("engine.evaluate", lambda i: service.engine.evaluate(), backend, repeat))
+
+    def relink(i):
+        with service.app.test_request_context():
+            asyncio.run(util.update_sensor_spot({"spot": rng.choice(spots), "key": "bench"},
+                                                rng.choice(sensors), service.store))
+    results.append(measure("util.update_sensor_spot", relink, backend, repeat))
+
+    def add(i):
+        with service.app.test_request_context():
+            asyncio.run(util.add_sensor_to_rtdb({"id": f"bench{n_sensors}-{i}", "type": rng.choice(TYPES),
+                                                 "spot": rng.choice(spots), "key": "bench"}, service.store))
+    results.append(measure("util.add_sensor_to_rtdb", add, backend, repeat))
+
+    def post(i):
+        client.post(f"/data/sensor/{rng.choice(sensors)}", json={"key": "bench", "value": rng.choice(VALUES)})
+    results.append(measure("POST /data/sensor/<id>", post, backend, repeat))
+
+    for r in results:
+        r["sensors"] = n_sensors
+        r["spots"] = len(spots)
+    return results
+
+
+## Imports the app in a fresh interpreter and serves one request; prints the
+## wall time and the app's own import-to-first-response measurement
+COLD_START = """
+import time
+start = time.perf_counter()
+import app
+app.app.test_client().get("/data/spots")
+print(time.perf_counter() - start, app.first_response)
+"""
+
+
+def run_cold_start(n_sensors, repeat, seed):
+    """Times a fresh process from import to first response, without a
+        snapshot and warm-started from one of n_sensors sensors."""
+
+    import tempfile
+    from snapshot import Snapshot
+
+    fleet = make_fleet(n_sensors, seed)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "snapshot.msgpack")
+        Snapshot(path).save(fleet)
+        for name, snapshot in (("cold start", ""), ("warm start", path)):
+            env = dict(os.environ, SNAPSHOT_PATH=snapshot, SCHEDULER_LEADER="off")
+            wall, first = [], []
+            for _ in range(repeat):
+                out = subprocess.check_output([sys.executable, "-c", COLD_START], env=env,
+                                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                                              stderr=subprocess.DEVNULL)
+                w, f = out.decode().split()[-2:]
+                wall.append(float(w))
+                first.append(float(f))
+            results.append({
+                "op": name,
+                "repeat": repeat,
+                "seconds": {"min": min(wall), "median": statistics.median(wall), "mean": statistics.fmean(wall)},
+                "first_response": statistics.median(first),
+                "rtdb_calls": {},
+                "rtdb_calls_total": 0,
+                "sensors": n_sensors,
+                "spots": len(fleet["spots"]),
+            })
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Prints ops whose median time or RTDB call count grew by more than
+        threshold (a ratio) against a baseline run. Returns the regressions."""
+
+    old = {(r["op"], r["sensors"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        b = old.get((r["op"], r["sensors"]))
+        if b is None:
+            continue
+        time_ratio = r["seconds"]["median"] / max(b["seconds"]["median"], 1e-9)
+        calls_grew = r["rtdb_calls_total"] > b["rtdb_calls_total"]
+        if time_ratio > threshold or calls_grew:
+            regressions.append(r["op"])
+            print(f"REGRESSION {r['op']} @ {r['sensors']} sensors: {time_ratio:.2f}x time, "
+                  f"{b['rtdb_calls_total']} -> {r['rtdb_calls_total']} RTDB calls", file=sys.stderr)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Occupancy engine micro-benchmarks.")
+    parser.add_argument("--sizes", default="100,1000,10000",
+                        help="Comma-separated fleet sizes in sensors, e.g. 100,1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write the JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Median time ratio counted as a regression against --baseline")
+    parser.add_argument("--cold-starts", type=int, default=3,
+                        help="Fresh processes timed from import to first response per size (0 to skip)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    service.app.before_first_request_funcs.clear()  ## No scheduler or listener while timing
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(",") if s]:
+        results.extend(run_size(size, args.repeat, args.seed))
+        if args.cold_starts:
+            results.extend(run_cold_start(size, args.cold_starts, args.seed))
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "backend": "memory",
+        "cache": "cold",
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            if compare(results, json.load(f), args.threshold):
+                sys.exit(1)
@@ -0,0 +1,82 @@
+## Python-specific imports
+import ast
+import json
+import msgpack
+import urllib.parse
+
+
+## Content types accepted for msgpack bodies
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+
+###################################################################
+## Request body decoders
+def decode_json(raw):
+    return json.loads(raw)
+
+
+def decode_form(raw):
+    """Decodes an x-www-form-urlencoded body. Repeated keys keep the last value."""
+
+    if isinstance(raw, bytes):
+        raw = raw.decode("utf8")
+    return dict(urllib.parse.parse_qsl(raw, keep_blank_values=True))
+
+
+def decode_msgpack(raw):
+    return msgpack.unpackb(raw, raw=False)
+
+
+def decode_text(raw):
+    """Decodes a body sent without a usable Content-Type: JSON, a form body,
+        or a Python dict literal as sent by older sensor firmware (parsed with
+        ast.literal_eval, never eval)."""
+
+    text = raw.decode("utf8") if isinstance(raw, bytes) else raw
+    stripped = text.lstrip()
+    if not stripped:
+        raise ValueError("Empty body.")
+    if stripped[0] in "{[":
+        try:
+            return json.loads(text)
+        except ValueError:
+            return ast.literal_eval(stripped)
+    if "=" in text:
+        return decode_form(text)
+    return json.loads(text)
+
+
+DECODERS = {
+    "application/json": decode_json,
+    "application/x-www-form-urlencoded": decode_form,
+}
+DECODERS.update({t: decode_msgpack for t in MSGPACK_TYPES})
+
+
+def decode(content_type, raw):
+    """Decodes a request body by its Content-Type. Raises ValueError if the
+        body can't be decoded."""
+
+    mimetype = (content_type or "").split(";", 1)[0].strip().lower()
+    decoder = DECODERS.get(mimetype)
+    if decoder is None and mimetype.endswith("+json"):
+        decoder = decode_json
+    try:
+        return (decoder or decode_text)(raw)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(str(e)) from e
+
+
+def parse_body(request, types=(dict,)):
+    """Returns the decoded body of a Flask request, or None if it's missing,
+        can't be decoded or isn't one of the given types."""
+
+    try:
+        data = decode(request.content_type, request.get_data(cache=False))
+    except ValueError:
+        return None
+    if not isinstance(data, types):
+        return None
+    return data
@@ -0,0 +1,110 @@
+## Python-specific imports
+import os
+import copy
+import threading
+from cachetools import TTLCache
+
+
+_MISSING = object()
+
+
+def normalize(path):
+    """Returns an RTDB path without leading/trailing or duplicate slashes."""
+
+    return "/".join(p for p in str(path).split("/") if p)
+
+
+###################################################################
+## Read-through cache keyed by RTDB path
+class PathCache:
+    """Size-bounded LRU cache with a TTL, keyed by RTDB path. A cached
+        ancestor also answers reads for its children, and a write to a path
+        invalidates that path, its ancestors and its descendants."""
+
+    def __init__(self, maxsize=1024, ttl=5):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, path, loader):
+        """Returns the value at path, calling loader() on a miss. Values are
+            copied on the way in and out so callers are free to mutate them."""
+
+        path = normalize(path)
+        with self.lock:
+            value = self._lookup(path)
+            if value is not _MISSING:
+                self.hits += 1
+                return copy.deepcopy(value)
+            self.misses += 1
+            generation = self.invalidations
+
+        value = loader()
+        with self.lock:
+            ## Don't cache a read that raced with a write
+            if generation == self.invalidations:
+                self.entries[path] = copy.deepcopy(value)
+        return value
+
+    def _lookup(self, path):
+        value = self.entries.get(path, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        ## Walk down from the closest cached ancestor
+        parts = path.split("/") if path else []
+        for i in range(len(parts) - 1, -1, -1):
+            node = self.entries.get("/".join(parts[:i]), _MISSING)
+            if node is _MISSING:
+                continue
+            for key in parts[i:]:
+                if isinstance(node, dict):
+                    node = node.get(key)
+                elif isinstance(node, list) and key.isdigit() and int(key) < len(node):
+                    node = node[int(key)]
+                else:
+                    node = None
+            return node
+        return _MISSING
+
+    def invalidate(self, path):
+        """Drops the path, every cached ancestor and every cached descendant."""
+
+        path = normalize(path)
+        parts = path.split("/") if path else []
+        with self.lock:
+            for i in range(len(parts) + 1):
+                self.entries.pop("/".join(parts[:i]), None)
+            prefix = path + "/"
+            for key in [k for k in self.entries if not path or k.startswith(prefix)]:
+                self.entries.pop(key, None)
+            self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """Returns the hit/miss counters and current size of the cache."""
+
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "size": len(self.entries),
+                "maxsize": self.entries.maxsize,
+                "ttl": self.entries.ttl,
+                "hit_ratio": (self.hits / total) if total else 0.0,
+            }
+
+
+## Shared cache for the app. CACHE_SIZE is the maximum number of cached
+## paths and CACHE_TTL is in seconds.
+rtdb_cache = PathCache(
+    maxsize=int(os.environ.get("CACHE_SIZE", 1024)),
+    ttl=float(os.environ.get("CACHE_TTL", 5)),
+)
@@ -0,0 +1,301 @@
+## Python-specific imports
+import time
+import atexit
+import logging
+import sqlite3
+import threading
+from array import array
+from contextlib import contextmanager
+
+
+HOUR = 3600
+DAY = 86400
+PERIODS = {"hour": HOUR, "day": DAY}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transitions (spot TEXT NOT NULL, ts REAL NOT NULL, free INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS transitions_ts ON transitions (ts);
+CREATE TABLE IF NOT EXISTS rollups (
+    period TEXT NOT NULL,
+    spot TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    area TEXT,
+    free_s REAL NOT NULL DEFAULT 0,
+    occupied_s REAL NOT NULL DEFAULT 0,
+    transitions INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (period, spot, start)
+);
+CREATE INDEX IF NOT EXISTS rollups_area ON rollups (period, area, start);
+CREATE TABLE IF NOT EXISTS carry (spot TEXT PRIMARY KEY, free INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL);
+"""
+
+
+###################################################################
+## In-memory recent transitions
+class Ring:
+    """Fixed-size ring buffer of (timestamp, free) transitions for one spot,
+        stored in two flat arrays."""
+
+    __slots__ = ("times", "states", "head", "count")
+
+    def __init__(self, size):
+        self.times = array("d", bytes(8 * size))
+        self.states = array("b", bytes(size))
+        self.head = 0
+        self.count = 0
+
+    def append(self, ts, free):
+        self.times[self.head] = ts
+        self.states[self.head] = free
+        self.head = (self.head + 1) % len(self.times)
+        self.count = min(self.count + 1, len(self.times))
+
+    def items(self):
+        """Returns the buffered transitions, oldest first."""
+
+        size = len(self.times)
+        first = (self.head - self.count) % size
+        return [(self.times[(first + i) % size], bool(self.states[(first + i) % size]))
+                for i in range(self.count)]
+
+
+def add_interval(acc, spot, t0, t1, free, step):
+    """Adds the seconds between t0 and t1 to the free or occupied totals of
+        every step-sized bucket they overlap."""
+
+    while t0 < t1:
+        bucket = int(t0 // step) * step
+        stop = min(bucket + step, t1)
+        totals = acc.setdefault((spot, bucket), [0.0, 0.0, 0])
+        totals[0 if free else 1] += stop - t0
+        t0 = stop
+
+
+###################################################################
+## Occupancy history
+class History:
+    """Time series of every spot's free transitions.
+
+        record() appends transitions to a per-spot Ring in memory and to a
+        pending list that flush() writes to SQLite in one transaction.
+        rollup_hours() turns the raw transitions of every completed hour into
+        per-spot free/occupied seconds and a transition count, replacing
+        rather than adding to the rows of those hours, and
+        rollup_days() sums completed days of hourly rollups. Range queries
+        read only the rollup rows. Raw transitions and hourly rollups are
+        pruned once they are older than their retention."""
+
+    def __init__(self, path="history.db", ring=64, raw_days=7, hourly_days=31):
+        self.path = path
+        self.ring = ring
+        self.raw_days = raw_days
+        self.hourly_days = hourly_days
+        self.rings = {}
+        self.last = {}
+        self.pending = []
+        self.lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        with self.con:
+            self.con.executescript(SCHEMA)
+        self._load()
+        atexit.register(self.flush)
+
+    def _load(self):
+        """Restores the last known state of every spot."""
+
+        self.last = {spot: bool(free) for spot, free in self.con.execute("SELECT spot, free FROM carry")}
+        rows = self.con.execute("SELECT spot, free, MAX(ts) FROM transitions GROUP BY spot").fetchall()
+        self.last.update({spot: bool(free) for spot, free, _ in rows})
+
+    ## Writes #####################################################
+    def record(self, changes, now=None, persist=True):
+        """Appends a transition for every spot in {spot id: free} whose
+            state differs from the last one recorded. Without persist the
+            transitions only go to the ring buffers, for a process that
+            shares the database with the one that writes it."""
+
+        now = time.time() if now is None else now
+        with self.lock:
+            for spot, free in changes.items():
+                free = bool(free)
+                if self.last.get(spot) == free:
+                    continue
+                self.last[spot] = free
+                ring = self.rings.get(spot)
+                if ring is None:
+                    ring = self.rings[spot] = Ring(self.ring)
+                ring.append(now, free)
+                if persist:
+                    self.pending.append((spot, now, int(free)))
+
+    def observe(self, spots, is_free, now=None, persist=True):
+        """record() for a full {spot id: spot object} snapshot, so spots that
+            changed while nothing was recording are caught up. A spot seen
+            for the first time only seeds its last state; nothing is known
+            about when it got there."""
+
+        states = {spot: is_free(obj.get("free")) for spot, obj in spots.items() if isinstance(obj, dict)}
+        with self.lock:
+            for spot, free in states.items():
+                self.last.setdefault(spot, bool(free))
+        self.record(states, now, persist)
+
+    def flush(self):
+        """Writes pending transitions to SQLite. Returns the number written."""
+
+        with self.lock:
+            pending, self.pending = self.pending, []
+        if not pending:
+            return 0
+        try:
+            with self.db_lock, self.con:
+                self.con.executemany("INSERT INTO transitions (spot, ts, free) VALUES (?, ?, ?)", pending)
+        except sqlite3.Error as e:
+            logging.error(f"{e} | HISTORY > FLUSH | Unable to write {len(pending)} transition(s).")
+            with self.lock:
+                self.pending = pending + self.pending
+            return 0
+        return len(pending)
+
+    ## Rollups ####################################################
+    @contextmanager
+    def _immediate(self):
+        """Runs a block in one write transaction, taken before anything is
+            read so two workers sharing the file roll up each window once."""
+
+        self.con.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.con.rollback()
+            raise
+        self.con.commit()
+
+    def _meta(self, key):
+        row = self.con.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def rollup_hours(self, areas=None, now=None):
+        """Rolls up every completed hour since the last run. areas maps spot
+            ids to the area stored with their rows. Returns the number of
+            rows written."""
+
+        self.flush()
+        with self.db_lock, self._immediate():
+            return self._rollup_hours(areas or {}, int((time.time() if now is None else now) // HOUR) * HOUR)
+
+    def _rollup_hours(self, areas, end):
+        start = self._meta("hourly")
+        if start is None:
+            first = self.con.execute("SELECT MIN(ts) FROM transitions").fetchone()[0]
+            if first is None:
+                return 0
+            start = int(first // HOUR) * HOUR
+        start = int(start)
+        if start >= end:
+            return 0
+
+        carry = {spot: bool(free) for spot, free in self.con.execute("SELECT spot, free FROM carry")}
+        acc = {}
+        cursor = {}
+        rows = self.con.execute("SELECT spot, ts, free FROM transitions WHERE ts >= ? AND ts < ? "
+                                "ORDER BY spot, ts", (start, end))
+        for spot, ts, free in rows:
+            t, state = cursor.get(spot, (start, carry.get(spot)))
+            if state is not None:
+                add_interval(acc, spot, t, ts, state, HOUR)
+            acc.setdefault((spot, int(ts // HOUR) * HOUR), [0.0, 0.0, 0])[2] += 1
+            cursor[spot] = (ts, bool(free))
+
+        ## Carry every spot's state to the end of the window
+        for spot, state in carry.items():
+            cursor.setdefault(spot, (start, state))
+        for spot, (t, state) in cursor.items():
+            add_interval(acc, spot, t, end, state, HOUR)
+            carry[spot] = state
+
+        ## Windows are whole hours, so every bucket is computed in full and replaced
+        self.con.executemany(
+            "INSERT OR REPLACE INTO rollups (period, spot, start, area, free_s, occupied_s, transitions) "
+            "VALUES ('hour', ?, ?, ?, ?, ?, ?)",
+            [(spot, bucket, areas.get(spot), f, o, n) for (spot, bucket), (f, o, n) in acc.items()])
+        self.con.executemany("INSERT OR REPLACE INTO carry (spot, free) VALUES (?, ?)",
+                             [(spot, int(state)) for spot, state in carry.items()])
+        self.con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('hourly', ?)", (end,))
+        self.con.execute("DELETE FROM transitions WHERE ts < ?", (end - self.raw_days * DAY,))
+        self.con.execute("DELETE FROM rollups WHERE period = 'hour' AND start < ?",
+                         (end - self.hourly_days * DAY,))
+        return len(acc)
+
+    def rollup_days(self, now=None):
+        """Sums the hourly rollups of every completed day since the last run
+            into daily rows. Returns the number of rows written."""
+
+        with self.db_lock, self._immediate():
+            return self._rollup_days(time.time() if now is None else now)
+
+    def _rollup_days(self, now):
+        hourly = self._meta("hourly")
+        if hourly is None:
+            return 0
+        end = int(min(now, hourly) // DAY) * DAY
+        start = self._meta("daily")
+        if start is None:
+            first = self.con.execute("SELECT MIN(start) FROM rollups WHERE period = 'hour'").fetchone()[0]
+            if first is None:
+                return 0
+            start = int(first // DAY) * DAY
+        if start >= end:
+            return 0
+
+        cur = self.con.execute(
+            "INSERT OR REPLACE INTO rollups (period, spot, start, area, free_s, occupied_s, transitions) "
+            "SELECT 'day', spot, (start / ?) * ?, MAX(area), SUM(free_s), SUM(occupied_s), SUM(transitions) "
+            "FROM rollups WHERE period = 'hour' AND start >= ? AND start < ? GROUP BY spot, start / ?",
+            (DAY, DAY, start, end, DAY))
+        self.con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('daily', ?)", (end,))
+        return cur.rowcount
+
+    ## Queries ####################################################
+    def recent(self, spot):
+        """Returns the transitions of a spot still in its ring buffer."""
+
+        with self.lock:
+            ring = self.rings.get(spot)
+            return ring.items() if ring is not None else []
+
+    def spot(self, spot, start, end, period="hour"):
+        """Returns the rollup buckets of one spot in [start, end)."""
+
+        with self.db_lock:
+            rows = self.con.execute(
+                "SELECT start, free_s, occupied_s, transitions FROM rollups "
+                "WHERE period = ? AND spot = ? AND start >= ? AND start < ? ORDER BY start",
+                (period, spot, start, end)).fetchall()
+        return [bucket(*row) for row in rows]
+
+    def area(self, area, start, end, period="hour"):
+        """Returns the rollup buckets of every spot in an area in [start,
+            end), summed per bucket."""
+
+        with self.db_lock:
+            rows = self.con.execute(
+                "SELECT start, SUM(free_s), SUM(occupied_s), SUM(transitions), COUNT(*) FROM rollups "
+                "WHERE period = ? AND area = ? AND start >= ? AND start < ? GROUP BY start ORDER BY start",
+                (period, str(area), start, end)).fetchall()
+        return [dict(bucket(*row[:4]), spots=row[4]) for row in rows]
+
+
+def bucket(start, free_s, occupied_s, transitions):
+    total = free_s + occupied_s
+    return {
+        "start": start,
+        "free_seconds": round(free_s, 1),
+        "occupied_seconds": round(occupied_s, 1),
+        "utilization": round(occupied_s / total, 4) if total else None,
+        "transitions": transitions,
+    }
@@ -0,0 +1,156 @@
+## Python-specific imports
+import json
+import time
+import logging
+import sqlite3
+import threading
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    op TEXT NOT NULL,
+    path TEXT NOT NULL,
+    value TEXT,
+    claimed REAL
+);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    seq INTEGER PRIMARY KEY,
+    created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    op TEXT NOT NULL,
+    path TEXT NOT NULL,
+    value TEXT,
+    error TEXT
+);
+"""
+
+
+###################################################################
+## Durable write journal
+class Journal:
+    """First-in first-out queue of RTDB writes, kept in SQLite while the
+        datastore is unreachable.
+
+        append() commits each write before returning, so a write the app
+        acknowledged survives a restart. replay() sends the entries back in
+        order and deletes each one once its write went through. An entry is
+        claimed for lease seconds before it is sent, and nothing is claimed
+        while another claim is live, so workers sharing the file replay one
+        entry at a time without holding a transaction open over the network.
+        Entries the datastore rejects for any reason other than being
+        unreachable are moved to the dead_letters table."""
+
+    def __init__(self, path="journal.db", lease=60):
+        self.path = path
+        self.lease = lease
+        self.con = None
+        self.appended = 0
+        self.replayed = 0
+        self.dead_lettered = 0
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        if self.con is None:
+            self.con = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                       isolation_level=None)
+            self.con.execute("PRAGMA journal_mode=WAL")
+            self.con.executescript(SCHEMA)
+            columns = [row[1] for row in self.con.execute("PRAGMA table_info(journal)")]
+            if "claimed" not in columns:
+                self.con.execute("ALTER TABLE journal ADD COLUMN claimed REAL")
+        return self.con
+
+    def append(self, op, path, value=None):
+        """Queues one set, update or delete of path."""
+
+        value = json.dumps(value)
+        with self.lock:
+            self._connect().execute("INSERT INTO journal (op, path, value) VALUES (?, ?, ?)",
+                                    (op, path, value))
+            self.appended += 1
+
+    def pending(self):
+        """Returns the number of queued writes."""
+
+        with self.lock:
+            return self._connect().execute("SELECT COUNT(*) FROM journal").fetchone()[0]
+
+    def _claim(self):
+        """Claims the oldest entry. Returns it, or None if the journal is
+            empty or another replay holds a live claim."""
+
+        now = time.time()
+        with self.lock:
+            con = self._connect()
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                if con.execute("SELECT 1 FROM journal WHERE claimed > ? LIMIT 1", (now - self.lease,)).fetchone():
+                    row = None
+                else:
+                    row = con.execute("SELECT seq, op, path, value FROM journal ORDER BY seq LIMIT 1").fetchone()
+                    if row is not None:
+                        con.execute("UPDATE journal SET claimed = ? WHERE seq = ?", (now, row[0]))
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+        return row
+
+    def _finish(self, seq, error=None):
+        """Deletes a replayed entry, or moves a rejected one to dead_letters."""
+
+        with self.lock:
+            con = self._connect()
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                if error is not None:
+                    con.execute("INSERT OR REPLACE INTO dead_letters (seq, op, path, value, error) "
+                                "SELECT seq, op, path, value, ? FROM journal WHERE seq = ?", (error, seq))
+                con.execute("DELETE FROM journal WHERE seq = ?", (seq,))
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+
+    def _release(self, seq):
+        with self.lock:
+            self._connect().execute("UPDATE journal SET claimed = NULL WHERE seq = ?", (seq,))
+
+    def replay(self, apply, unreachable):
+        """Calls apply(op, path, value) for every queued write, oldest first.
+            An entry that fails with an error unreachable(e) accepts stays
+            queued and the error is re-raised; any other failure is
+            dead-lettered and the replay goes on. Returns the number of
+            writes replayed."""
+
+        count = 0
+        while True:
+            row = self._claim()
+            if row is None:
+                break
+            seq, op, path, value = row
+            try:
+                apply(op, path, json.loads(value))
+            except Exception as e:
+                if unreachable(e):
+                    self._release(seq)
+                    raise
+                logging.error(f"{e} | JOURNAL > REPLAY | Dead-lettering {op} of {path}.")
+                self._finish(seq, str(e))
+                self.dead_lettered += 1
+                continue
+            self._finish(seq)
+            count += 1
+            self.replayed += 1
+        if count:
+            logging.info(f"JOURNAL > REPLAY | Replayed {count} write(s) from {self.path}.")
+        return count
+
+    def stats(self):
+        return {
+            "pending": self.pending(),
+            "appended": self.appended,
+            "replayed": self.replayed,
+            "dead_lettered": self.dead_lettered,
+        }
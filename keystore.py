@@ -0,0 +1,314 @@
+## Python-specific imports
+import os
+import hmac
+import hashlib
+import logging
+import sqlite3
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+
+
+ALGORITHM = "pbkdf2_sha256"
+
+## Stored in place of a hash while it is being derived: "pending$<time>$<nonce>"
+PENDING = "pending$"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS keys (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sensorid TEXT UNIQUE NOT NULL,
+    keyhash TEXT
+);
+"""
+
+
+def hash_key(key, iterations, salt=None):
+    """Returns the stored form of a key: "pbkdf2_sha256$iterations$salt$hash"."""
+
+    salt = salt if salt is not None else os.urandom(16).hex()
+    digest = hashlib.pbkdf2_hmac("sha256", str(key).encode("utf8"), salt.encode("utf8"), iterations)
+    return f"{ALGORITHM}${iterations}${salt}${digest.hex()}"
+
+
+def check_key(key, stored):
+    """Re-derives key with the parameters of a stored hash and compares the
+        two in constant time."""
+
+    try:
+        algorithm, iterations, salt, _ = stored.split("$")
+        iterations = int(iterations)
+    except (AttributeError, ValueError):
+        return False
+    if algorithm != ALGORITHM:
+        return False
+    return hmac.compare_digest(hash_key(key, iterations, salt), stored)
+
+
+###################################################################
+## Sensor key store
+class KeyStore:
+    """Sensor id -> hashed key map preloaded from the keys table.
+
+        Keys are stored as salted PBKDF2 hashes, so checking a key costs one
+        slow derivation. Once a key has been checked, an HMAC of it under a
+        per-process secret is cached, and later requests with the same id
+        are verified against that in microseconds; a different key for the
+        same id is rejected without deriving anything. Wrong keys for ids
+        without a cached fingerprint are remembered for a while so they
+        can't be replayed to burn CPU. Ids missing from the map are looked up
+        in the table, which picks up sensors provisioned by other workers;
+        an id that isn't there is not looked up again for absent_ttl
+        seconds.
+
+        provision() reserves the id with a pending marker and derives the
+        hash on a background pool, so creating a sensor costs one insert.
+        The provisioning process verifies the key from its fingerprint
+        meanwhile; other workers refuse it until the hash lands. A marker
+        older than stale seconds (its process died) can be provisioned
+        again.
+
+        Ids without a stored key are accepted unless strict is set, as
+        before real keys existed. With tofu set, the first key presented for
+        such an id is provisioned as its key instead (trust on first use)."""
+
+    def __init__(self, path="database.db", iterations=100000, strict=False, tofu=False, threads=4,
+                 absent_ttl=5, stale=60):
+        self.path = path
+        self.threads = threads
+        self.pool = None
+        self.stale = stale
+        self.absent = TTLCache(maxsize=4096, ttl=absent_ttl)
+        self.hashing = 0
+        self.iterations = iterations
+        self.strict = strict
+        self.tofu = tofu
+        self.hashes = {}
+        self.verified = {}
+        self.rejected = TTLCache(maxsize=4096, ttl=300)
+        self.secret = os.urandom(32)
+        self.con = None
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Builds the store from KEYS_PATH, KEY_ITERATIONS, AUTH_STRICT and
+            AUTH_TOFU."""
+
+        return cls(path=os.environ.get("KEYS_PATH", "database.db"),
+                   iterations=int(os.environ.get("KEY_ITERATIONS", 100000)),
+                   strict=os.environ.get("AUTH_STRICT", "0") == "1",
+                   tofu=os.environ.get("AUTH_TOFU", "0") == "1")
+
+    def _connect(self):
+        if self.con is None:
+            self.con = sqlite3.connect(self.path, check_same_thread=False)
+            self.con.executescript(SCHEMA)
+            columns = [row[1] for row in self.con.execute("PRAGMA table_info(keys)")]
+            if "keyhash" not in columns:
+                self.con.execute("ALTER TABLE keys ADD COLUMN keyhash TEXT")
+            self.hashes = {id: h for id, h in self.con.execute(
+                "SELECT sensorid, keyhash FROM keys WHERE keyhash IS NOT NULL")}
+            logging.info(f"KEYSTORE > LOAD | Loaded {len(self.hashes)} sensor key(s).")
+        return self.con
+
+    def load(self):
+        """Opens the table and preloads every stored hash."""
+
+        with self.lock:
+            self._connect()
+
+    def _fingerprint(self, id, key):
+        return hmac.new(self.secret, f"{id}\0{key}".encode("utf8"), hashlib.sha256).digest()
+
+    def _lookup(self, ids, fresh=False):
+        """Reads the hashes of ids missing from the map, or still pending,
+            into it. Ids found missing recently are skipped unless fresh."""
+
+        missing = [id for id in ids if (id not in self.hashes and (fresh or id not in self.absent))
+                   or self.hashes.get(id, "").startswith(PENDING)]
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            rows = self._connect().execute(
+                f"SELECT sensorid, keyhash FROM keys WHERE keyhash IS NOT NULL AND sensorid IN "
+                f"({','.join('?' * len(chunk))})", chunk)
+            self.hashes.update(rows)
+        for id in missing:
+            if id not in self.hashes:
+                self.absent[id] = True
+
+    ## Verification ###############################################
+    def verify(self, id, key):
+        """True if key is the key of sensor id."""
+
+        return self.verify_many([(id, key)])[0]
+
+    def verify_many(self, pairs):
+        """Verifies a batch of (id, key) pairs with at most one table read.
+            Returns a list of bools in the same order."""
+
+        results = [False] * len(pairs)
+        slow = []
+        claims = []
+        with self.lock:
+            self._connect()
+            self._lookup({str(id) for id, key in pairs if key is not None})
+            for i, (id, key) in enumerate(pairs):
+                id = str(id)
+                stored = self.hashes.get(id)
+                if key is None:
+                    continue
+                if stored is None:
+                    if self.tofu:
+                        claims.append((i, id, key))
+                    else:
+                        results[i] = not self.strict
+                    continue
+                fingerprint = self._fingerprint(id, key)
+                cached = self.verified.get(id)
+                if cached is not None:
+                    results[i] = hmac.compare_digest(fingerprint, cached)
+                elif stored.startswith(PENDING):
+                    ## Provisioned by another worker, hash not written yet
+                    continue
+                elif fingerprint not in self.rejected:
+                    slow.append((i, id, key, stored, fingerprint))
+
+        ## Derive outside the lock, so one slow check doesn't hold up the rest
+        derived = {}
+        for i, id, key, stored, fingerprint in slow:
+            if fingerprint not in derived:
+                derived[fingerprint] = check_key(key, stored)
+            results[i] = derived[fingerprint]
+
+        ## Trust on first use: provision the first key of each id, then accept
+        ## only keys matching the one that was stored
+        if claims:
+            self.provision_many([(id, key) for _, id, key in claims])
+            with self.lock:
+                for i, id, key in claims:
+                    cached = self.verified.get(id)
+                    results[i] = cached is not None and hmac.compare_digest(self._fingerprint(id, key), cached)
+
+        with self.lock:
+            for i, id, key, stored, fingerprint in slow:
+                if results[i]:
+                    self.verified[id] = fingerprint
+                else:
+                    self.rejected[fingerprint] = True
+            self.failures += results.count(False)
+        return results
+
+    ## Provisioning ###############################################
+    def known(self, id):
+        with self.lock:
+            self._connect()
+            self._lookup([str(id)], fresh=True)
+            return str(id) in self.hashes
+
+    def provision(self, id, key):
+        """Stores the hash of a new sensor's key. Returns False if the id
+            already has one."""
+
+        return self.provision_many([(id, key)])[0]
+
+    def provision_many(self, pairs):
+        """provision() for a batch of (id, key) pairs, reserved in one
+            transaction. Returns a list of bools in the same order; only the
+            first pair of a repeated id is stored."""
+
+        pairs = [(str(id), key) for id, key in pairs]
+        with self.lock:
+            con = self._connect()
+            self._lookup({id for id, _ in pairs}, fresh=True)
+            new = {}
+            for id, key in pairs:
+                stored = self.hashes.get(id)
+                if stored is None or self._stale(stored):
+                    new.setdefault(id, key)
+            if not new:
+                return [False] * len(pairs)
+
+            markers = {id: f"{PENDING}{time.time()}${os.urandom(8).hex()}" for id in new}
+            ids = list(markers)
+            with con:
+                con.executemany("INSERT INTO keys (sensorid, keyhash) VALUES (?, ?) "
+                                "ON CONFLICT (sensorid) DO UPDATE SET keyhash = excluded.keyhash "
+                                "WHERE keys.keyhash IS NULL OR (keys.keyhash LIKE 'pending$%' AND "
+                                "CAST(substr(keys.keyhash, 9, instr(substr(keys.keyhash, 9), '$') - 1) AS REAL) < ?)",
+                                [(id, marker, time.time() - self.stale) for id, marker in markers.items()])
+            ## Another worker may have provisioned an id first
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                self.hashes.update(con.execute(
+                    f"SELECT sensorid, keyhash FROM keys WHERE sensorid IN ({','.join('?' * len(chunk))})", chunk))
+            done = {id for id in ids if self.hashes.get(id) == markers[id]}
+            for id in done:
+                self.verified[id] = self._fingerprint(id, new[id])
+                self.absent.pop(id, None)
+            if done and self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="keys")
+            self.hashing += len(done)
+
+        ## Derive the hashes in the background (PBKDF2 releases the GIL)
+        for id in done:
+            self.pool.submit(self._derive, id, new[id], markers[id])
+        if done:
+            logging.info(f"KEYSTORE > PROVISION | Reserved the key(s) of {len(done)} sensor(s).")
+        results = []
+        for id, _ in pairs:
+            results.append(id in done)
+            done.discard(id)
+        return results
+
+    def _stale(self, stored):
+        """True if stored is a pending marker left by a process that died."""
+
+        if not stored.startswith(PENDING):
+            return False
+        try:
+            return float(stored.split("$")[1]) < time.time() - self.stale
+        except (IndexError, ValueError):
+            return True
+
+    def _derive(self, id, key, marker):
+        """Replaces the pending marker of id with the hash of key."""
+
+        stored = hash_key(key, self.iterations)
+        try:
+            with self.lock:
+                con = self._connect()
+                with con:
+                    cur = con.execute("UPDATE keys SET keyhash = ? WHERE sensorid = ? AND keyhash = ?",
+                                      (stored, id, marker))
+                if cur.rowcount:
+                    self.hashes[id] = stored
+                else:
+                    logging.warning(f"KEYSTORE > DERIVE | The key of {id} was reprovisioned meanwhile.")
+                    self.verified.pop(id, None)
+                    self.hashes.pop(id, None)
+        except sqlite3.Error as e:
+            logging.error(f"{e} | KEYSTORE > DERIVE | Unable to store the key of {id}.")
+        finally:
+            with self.lock:
+                self.hashing -= 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "keys": len(self.hashes),
+                "verified": len(self.verified),
+                "rejected": len(self.rejected),
+                "failures": self.failures,
+                "hashing": self.hashing,
+            }
+
+
+## Shared key store. KEYS_PATH is the SQLite database holding the keys table,
+## KEY_ITERATIONS the PBKDF2 cost of new hashes, AUTH_STRICT=1 rejects ids
+## that have no stored key and AUTH_TOFU=1 stores the first key presented for
+## them. The table is opened on first use.
+sensor_keys = KeyStore.from_env()
@@ -0,0 +1,178 @@
+## Python-specific imports
+import os
+import time
+import uuid
+import zlib
+import atexit
+import socket
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  ## Windows: only the datastore lease is available
+    fcntl = None
+
+
+def shard_of(id, shards):
+    """Stable shard number of an id; hash() is salted per process."""
+
+    return zlib.crc32(str(id).encode("utf8")) % shards
+
+
+###################################################################
+## Locks
+class FileLock:
+    """Non-blocking exclusive flock() on a file. Works across the gunicorn
+        workers of one host; the OS drops it if the process dies."""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def acquire(self):
+        """Takes or keeps the lock. Returns True if this process holds it."""
+
+        if self.fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self.fd = fd
+        return True
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+class LeaseLock:
+    """Lease node in the datastore, {owner, expires}, taken and renewed with a
+        transaction. Works across hosts; a dead leader's lease expires after
+        ttl seconds."""
+
+    def __init__(self, db, path, ttl=30, owner=None):
+        self.db = db
+        self.path = path
+        self.ttl = ttl
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def acquire(self):
+        now = time.time()
+
+        def take(current):
+            if isinstance(current, dict) and current.get("owner") != self.owner \
+                    and current.get("expires", 0) > now:
+                return current
+            return {"owner": self.owner, "expires": now + self.ttl}
+
+        lease = self.db.reference(self.path).transaction(take)
+        return isinstance(lease, dict) and lease.get("owner") == self.owner
+
+    def release(self):
+        def drop(current):
+            if isinstance(current, dict) and current.get("owner") == self.owner:
+                return None
+            return current
+
+        try:
+            self.db.reference(self.path).transaction(drop)
+        except Exception as e:
+            logging.warning(f"{e} | LEADER > RELEASE | Unable to release {self.path}.")
+
+
+###################################################################
+## Leader election
+class Elector:
+    """Decides which process runs the scheduled occupancy work.
+
+        With shards > 1 there is one lock per shard, owning the spots whose
+        id hashes to it. elect() renews the shards held and takes any that
+        are free or expired, so every shard has a leader as long as one
+        process is alive; it's called periodically, and leading and owns()
+        are what the tick and the engine check. In "off" mode every process
+        leads every spot, as before."""
+
+    def __init__(self, locks=None, shards=1):
+        self.locks = locks
+        self.shards = shards
+        self.held = set() if locks else {0}
+        self.lock = threading.Lock()
+        atexit.register(self.resign)
+
+    @property
+    def leading(self):
+        return bool(self.held)
+
+    def elect(self):
+        """Renews the shards held and takes the free ones. Returns True if
+            this process leads any."""
+
+        if not self.locks:
+            return True
+        with self.lock:
+            for shard in sorted(self.held):
+                try:
+                    if self.locks[shard].acquire():
+                        continue
+                except Exception as e:
+                    logging.error(f"{e} | LEADER > ELECT | Unable to renew shard {shard}.")
+                logging.warning(f"LEADER > ELECT | Lost leadership of shard {shard}.")
+                self.held.discard(shard)
+
+            for shard, lock in enumerate(self.locks):
+                if shard in self.held:
+                    continue
+                try:
+                    if lock.acquire():
+                        self.held.add(shard)
+                        logging.info(f"LEADER > ELECT | Leading shard {shard} of {self.shards}.")
+                except Exception as e:
+                    logging.error(f"{e} | LEADER > ELECT | Unable to take shard {shard}.")
+            return bool(self.held)
+
+    def resign(self):
+        with self.lock:
+            if self.locks:
+                for shard in self.held:
+                    self.locks[shard].release()
+                self.held = set()
+
+    def owns(self, spot):
+        """True if this process is responsible for the given spot."""
+
+        held = self.held
+        if not held:
+            return False
+        return self.shards == 1 or shard_of(spot, self.shards) in held
+
+
+def from_env(db):
+    """Builds the Elector from SCHEDULER_LEADER: "file" (flock on
+        LEADER_LOCK), "lease" (node under /leases with a LEASE_SECONDS ttl),
+        "off", or "auto" (lease for firebase, file otherwise). SHARDS splits
+        the spots across that many leaders."""
+
+    mode = os.environ.get("SCHEDULER_LEADER", "auto").lower()
+    shards = max(int(os.environ.get("SHARDS", 1)), 1)
+    if mode == "auto":
+        mode = "lease" if getattr(db, "name", None) == "firebase" or fcntl is None else "file"
+    if mode == "off":
+        return Elector(None, 1)
+
+    if mode == "file":
+        base = os.environ.get("LEADER_LOCK", "/tmp/eel5632-scheduler.lock")
+        locks = [FileLock(f"{base}.{i}" if shards > 1 else base) for i in range(shards)]
+    elif mode == "lease":
+        ttl = float(os.environ.get("LEASE_SECONDS", 30))
+        locks = [LeaseLock(db, f"leases/scheduler/{i}", ttl) for i in range(shards)]
+    else:
+        raise ValueError(f"Unknown SCHEDULER_LEADER {mode!r}, expected auto, file, lease or off.")
+    return Elector(locks, shards)
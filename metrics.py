@@ -0,0 +1,153 @@
+## Python-specific imports
+import bisect
+import threading
+
+
+## Default latency buckets in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+###################################################################
+## Metric types
+class Counter:
+    """Monotonic counter, optionally split by label values."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        if not items and not self.labels:
+            items = [((), 0)]
+        return [f"{self.name}{_labels(self.labels, k)} {v}" for k, v in items]
+
+
+class Gauge:
+    """Value read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self):
+        try:
+            return [f"{self.name} {float(self.read())}"]
+        except Exception:
+            return []
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by label values.
+        observe() is one bisect and a few additions under a lock."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        with self.lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self.series.items())
+        lines = []
+        names = self.labels + ("le",)
+        for labels, (counts, total, count) in items:
+            running = 0
+            for bound, n in zip(self.buckets, counts):
+                running += n
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (bound,))} {running}")
+            lines.append(f"{self.name}_bucket{_labels(names, labels + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labels, labels)} {count}")
+        return lines
+
+
+###################################################################
+## Registry
+class Registry:
+    """Holds the app's metrics and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.add(Counter(name, help, labels))
+
+    def gauge(self, name, help, read):
+        return self.add(Gauge(name, help, read))
+
+    def histogram(self, name, help, labels=(), buckets=BUCKETS):
+        return self.add(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = Registry()
+
+## HTTP
+request_latency = registry.histogram("http_request_duration_seconds",
+    "Time spent serving a request, by route.", ("route", "method", "status"))
+
+## Datastore
+rtdb_calls = registry.counter("rtdb_calls_total",
+    "Datastore calls, by the route that made them and operation.", ("route", "op"))
+rtdb_latency = registry.histogram("rtdb_call_duration_seconds",
+    "Datastore call latency, by the route that made it and operation.", ("route", "op"))
+
+## Occupancy ticks
+tick_duration = registry.histogram("monitor_spots_duration_seconds",
+    "Duration of a monitor_spots tick.", buckets=BUCKETS + (30.0, 60.0))
+spots_changed = registry.counter("monitor_spots_changed_total",
+    "Spots whose free value was changed by monitor_spots.")
+ticks_skipped = registry.counter("monitor_spots_skipped_total",
+    "Ticks that were skipped, by reason (overlap or missed).", ("reason",))
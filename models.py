@@ -1,4 +1,32 @@
+## Python-specific imports
+import math
+import threading
+import numpy as np
+
+###################################################################
+## Custom imports
+from rules import RuleSet, UNKNOWN, type_code, parse_value, parse_rule, combine, members
+
+
+def is_true(value):
+    """Normalizes the mixed 'true'/True free values stored in the RTDB."""
+
+    if isinstance(value, str):
+        return value.lower() == "true"
+    return bool(value)
+
+
+def same(a, b):
+    """Equality that tells True from 1, so a changed reading is never missed."""
+
+    return type(a) is type(b) and a == b
+
+
+###################################################################
+## Records
 class Sensor:
+    __slots__ = ("id", "type", "Area", "value", "Spot")
+
     def __init__(self, id=None, type=None, Area=None, value=None, Spot=None):
         self.id=id
         self.type=type
@@ -6,4 +34,361 @@ class Sensor:
         self.value=value
         self.Spot=Spot
 
+    @classmethod
+    def from_dict(cls, id, obj):
+        return cls(id, obj.get("type"), obj.get("area", obj.get("Area")), obj.get("value"), obj.get("spot"))
+
+    def matches(self, obj):
+        """True if the sensor object in the RTDB has the same fields."""
+
+        value = obj.get("value")
+        if self.value != value or type(self.value) is not type(value) or self.type != obj.get("type") \
+                or self.Spot != obj.get("spot"):
+            return False
+        area = obj.get("area")
+        return same(self.Area, area if area is not None else obj.get("Area"))
+
+    def to_dict(self):
+        fields = {"id": self.id, "type": self.type, "area": self.Area, "value": self.value, "spot": self.Spot}
+        return {k: v for k, v in fields.items() if v is not None}
+
+
+class Spot:
+    __slots__ = ("id", "area", "rule", "sensors")
+
+    def __init__(self, id=None, area=None, rule=None, sensors=()):
+        self.id=id
+        self.area=area
+        self.rule=rule
+        self.sensors=sensors
+
+
+###################################################################
+## Columnar storage
+class Columns:
+    """Interns ids to row numbers and keeps one NumPy column per field. The
+        columns grow by doubling and released rows are reused, so a steady
+        fleet allocates nothing."""
+
+    def __init__(self, fields, capacity=256):
+        self.fields = fields
+        self.capacity = capacity
+        self.rows = {}
+        self.records = []
+        self.vacant = []
+        for name, (dtype, default) in fields.items():
+            setattr(self, name, np.full(capacity, default, dtype=dtype))
+
+    def __len__(self):
+        """Number of rows in use or vacant; columns are only valid up to it."""
+
+        return len(self.records)
+
+    def intern(self, id):
+        row = self.rows.get(id)
+        if row is not None:
+            return row
+        if self.vacant:
+            row = self.vacant.pop()
+        else:
+            row = len(self.records)
+            self.records.append(None)
+            if row >= self.capacity:
+                self._grow()
+        self.rows[id] = row
+        return row
+
+    def release(self, id):
+        row = self.rows.pop(id, None)
+        if row is None:
+            return
+        self.records[row] = None
+        for name, (dtype, default) in self.fields.items():
+            getattr(self, name)[row] = default
+        self.vacant.append(row)
+
+    def _grow(self):
+        size = self.capacity * 2
+        for name, (dtype, default) in self.fields.items():
+            column = np.full(size, default, dtype=dtype)
+            column[:self.capacity] = getattr(self, name)
+            setattr(self, name, column)
+        self.capacity = size
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.fields)
+
+
+###################################################################
+## Fleet model
+class Fleet:
+    """Typed in-memory model of the sensors and spots, stored by column.
+
+        Sensor rows hold the type code, parsed reading (distance and boolean
+        flag) and the row of the spot the sensor votes for; spot rows hold
+        the stored free value (-1 if unset) and the parsed rule. Each row
+        also keeps its Sensor or Spot record, which is compared against the
+        RTDB object so that load() only re-parses what changed. evaluate()
+        feeds the columns straight to RuleSet.evaluate_columns, so a tick
+        doesn't rebuild per-link lists. A sensor votes for the spot that
+        lists it; sensors listed but not in /sensors keep a placeholder row
+        with an UNKNOWN type."""
+
+    def __init__(self, rules=None, capacity=256):
+        self.rules = rules if rules is not None else RuleSet.from_env()
+        self.sensors = Columns({
+            "type": (np.int16, UNKNOWN),
+            "value": (np.float64, math.nan),
+            "flag": (bool, False),
+            "spot": (np.int32, -1),
+        }, capacity)
+        self.spots = Columns({
+            "free": (np.int8, -1),
+            "mode": (np.int8, 0),
+            "n": (np.int32, 1),
+            "threshold": (np.float64, math.nan),
+            "live": (bool, False),
+        }, capacity)
+        self.lock = threading.Lock()
+
+    ## Updates ####################################################
+    def load(self, spots, sensors):
+        """Refreshes the model from {spot id: object} and {sensor id: object}
+            snapshots, dropping the ids no longer in them. Returns {spot id:
+            free} for the known spots whose stored free value changed."""
+
+        with self.lock:
+            changed = {}
+            rows, free = self.spots.rows, self.spots.free
+            for spot, obj in spots.items():
+                row = rows.get(spot)
+                before = free[row] if row is not None else -1
+                self._set_spot(spot, obj)
+                row = rows.get(spot)
+                if row is not None and before >= 0 and free[row] >= 0 and free[row] != before:
+                    changed[spot] = bool(free[row])
+            rows, records = self.sensors.rows, self.sensors.records
+            for sensor, obj in sensors.items():
+                ## Unchanged sensors are the common case: skip them without a call
+                row = rows.get(sensor)
+                if row is not None and records[row] is not None and isinstance(obj, dict) \
+                        and records[row].matches(obj):
+                    continue
+                self._set_sensor(sensor, obj)
+
+            if len(self.spots.rows) != len(spots):
+                for spot in [s for s in self.spots.rows if s not in spots]:
+                    self._drop_spot(spot)
+            known = len(self.sensors.rows) - sum(1 for r in self.sensors.rows.values()
+                                                  if self.sensors.records[r] is None)
+            if known != len(sensors):
+                for sensor in [s for s, r in self.sensors.rows.items()
+                               if self.sensors.records[r] is not None and s not in sensors]:
+                    self._drop_sensor(sensor)
+            return changed
+
+    def set_sensor(self, id, obj):
+        """Updates or, for a non-dict object, drops one sensor."""
+
+        with self.lock:
+            self._set_sensor(id, obj)
+
+    def set_spot(self, id, obj):
+        """Updates or, for a non-dict object, drops one spot."""
+
+        with self.lock:
+            self._set_spot(id, obj)
+
+    def set_free(self, id, free):
+        with self.lock:
+            row = self.spots.rows.get(id)
+            if row is not None:
+                self.spots.free[row] = bool(free)
+
+    def move(self, sensor, old, new, area=None):
+        """Moves a sensor from the members of spot old to those of spot new,
+            creating new if it isn't known yet. A spot without an area takes
+            the sensor's."""
+
+        with self.lock:
+            row = self.spots.rows.get(old) if old is not None else None
+            record = self.spots.records[row] if row is not None else None
+            if record is not None and sensor in record.sensors:
+                sensors = tuple(s for s in record.sensors if s != sensor)
+                self._relink(row, record.sensors, sensors)
+                record.sensors = sensors
+
+            if new in (None, ""):
+                return
+            row = self.spots.intern(new)
+            record = self.spots.records[row]
+            if record is None:
+                record = self.spots.records[row] = Spot(new, area, None, ())
+                self.spots.mode[row], self.spots.n[row], self.spots.threshold[row] = parse_rule(None)
+                self.spots.live[row] = True
+            elif record.area is None:
+                record.area = area
+            if sensor not in record.sensors:
+                sensors = record.sensors + (sensor,)
+                self._relink(row, record.sensors, sensors)
+                record.sensors = sensors
+
+    def _set_sensor(self, id, obj):
+        if not isinstance(obj, dict):
+            self._drop_sensor(id)
+            return
+        row = self.sensors.intern(id)
+        record = self.sensors.records[row]
+        if record is not None and record.matches(obj):
+            return
+        self.sensors.records[row] = Sensor.from_dict(id, obj)
+        self.sensors.type[row] = type_code(obj.get("type"))
+        self.sensors.value[row], self.sensors.flag[row] = parse_value(obj.get("value"))
+
+    def _drop_sensor(self, id):
+        row = self.sensors.rows.get(id)
+        if row is None:
+            return
+        if self.sensors.spot[row] < 0:
+            self.sensors.release(id)
+            return
+        ## Still listed by a spot: keep the link, forget the reading
+        self.sensors.records[row] = None
+        self.sensors.type[row] = UNKNOWN
+        self.sensors.value[row] = math.nan
+        self.sensors.flag[row] = False
+
+    def _set_spot(self, id, obj):
+        if not isinstance(obj, dict):
+            self._drop_spot(id)
+            return
+        row = self.spots.intern(id)
+        free = obj.get("free")
+        self.spots.free[row] = -1 if free is None else is_true(free)
+        self.spots.live[row] = True
+
+        record = self.spots.records[row]
+        rule = obj.get("rule")
+        sensors = tuple(members(obj))
+        area = obj.get("area")
+        if record is not None and record.sensors == sensors and record.rule == rule:
+            record.area = area
+            return
+        self.spots.mode[row], self.spots.n[row], self.spots.threshold[row] = parse_rule(rule)
+        self._relink(row, record.sensors if record is not None else (), sensors)
+        self.spots.records[row] = Spot(id, area, rule, sensors)
+
+    def _drop_spot(self, id):
+        row = self.spots.rows.get(id)
+        if row is None:
+            return
+        record = self.spots.records[row]
+        if record is not None:
+            self._relink(row, record.sensors, ())
+        self.spots.release(id)
+
+    def _relink(self, row, old, new):
+        for sensor in old:
+            s = self.sensors.rows.get(sensor)
+            if s is not None and self.sensors.spot[s] == row:
+                self.sensors.spot[s] = -1
+                if self.sensors.records[s] is None:
+                    self.sensors.release(sensor)
+        for sensor in new:
+            ## intern() may grow the columns, so look the column up after it
+            s = self.sensors.intern(sensor)
+            self.sensors.spot[s] = row
+
+    ## Evaluation #################################################
+    def evaluate(self):
+        """Returns the evaluated free value of every spot row."""
+
+        with self.lock:
+            return self._evaluate()
+
+    def _evaluate(self):
+        n, m = len(self.sensors), len(self.spots)
+        s = self.sensors
+        links = np.flatnonzero((s.spot[:n] >= 0) & (s.type[:n] != UNKNOWN))
+        return self.rules.evaluate_columns(s.type[links], s.value[links], s.flag[links], s.spot[links],
+                                           self.spots.mode[:m], self.spots.n[:m], self.spots.threshold[:m])
+
+    def changed(self):
+        """Returns {spot id: free} for the spots whose evaluated free value
+            differs from the stored one."""
+
+        with self.lock:
+            m = len(self.spots)
+            free = self._evaluate()
+            rows = np.flatnonzero(self.spots.live[:m] & (self.spots.free[:m] != free))
+            return {self.spots.records[r].id: bool(free[r]) for r in rows}
+
+    def occupied(self, id):
+        """Scalar evaluation of one spot, or None if it isn't in the model."""
+
+        with self.lock:
+            row = self.spots.rows.get(id)
+            if row is None or self.spots.records[row] is None:
+                return None
+            s = self.sensors
+            threshold = float(self.spots.threshold[row])
+            votes = count = 0
+            for sensor in self.spots.records[row].sensors:
+                r = s.rows.get(sensor)
+                if r is None or s.spot[r] != row or s.type[r] == UNKNOWN:
+                    continue
+                count += 1
+                votes += self.rules.sensor_occupied(int(s.type[r]), float(s.value[r]), bool(s.flag[r]), threshold)
+            return combine(int(self.spots.mode[row]), int(self.spots.n[row]), votes, count)
+
+    ## Reads ######################################################
+    def sensor(self, id):
+        """Returns the Sensor record of an id, or None."""
+
+        with self.lock:
+            row = self.sensors.rows.get(id)
+            return self.sensors.records[row] if row is not None else None
+
+    def spot(self, id):
+        """Returns the Spot record of an id, or None."""
+
+        with self.lock:
+            row = self.spots.rows.get(id)
+            return self.spots.records[row] if row is not None else None
+
+    def areas(self, ids):
+        """Returns {spot id: area} for the given spots."""
+
+        with self.lock:
+            records = self.spots.records
+            rows = self.spots.rows
+            return {id: records[rows[id]].area if id in rows and records[rows[id]] is not None else None
+                    for id in ids}
+
+    def spot_of(self, id):
+        """Returns the id of the spot a sensor votes for, or None."""
+
+        with self.lock:
+            row = self.sensors.rows.get(id)
+            if row is None or self.sensors.spot[row] < 0:
+                return None
+            record = self.spots.records[self.sensors.spot[row]]
+            return record.id if record is not None else None
+
+    def free(self, id):
+        """Returns the stored free value of a spot, or None if unknown."""
+
+        with self.lock:
+            row = self.spots.rows.get(id)
+            if row is None or self.spots.free[row] < 0:
+                return None
+            return bool(self.spots.free[row])
 
+    def stats(self):
+        with self.lock:
+            return {
+                "sensors": len(self.sensors.rows),
+                "spots": len(self.spots.rows),
+                "capacity": [self.sensors.capacity, self.spots.capacity],
+                "bytes": self.sensors.nbytes() + self.spots.nbytes(),
+            }
@@ -0,0 +1,270 @@
+## Python-specific imports
+import time
+import logging
+import threading
+
+###################################################################
+## Custom imports
+from rules import RuleSet
+from areas import area_of
+from models import Fleet, is_true
+
+
+def as_dict(tree):
+    """Returns an RTDB subtree as a dict. The RTDB hands back a list when
+        every key is a sequential integer, so those are re-keyed by index."""
+
+    if tree is None:
+        return {}
+    if isinstance(tree, list):
+        return {str(i): v for i, v in enumerate(tree) if v is not None}
+    return tree
+
+
+###################################################################
+## Incremental occupancy engine
+class OccupancyEngine:
+    """Keeps the columnar Fleet model of /spots and /sensors up to date, so
+        that a sensor change only re-evaluates the spot that sensor belongs
+        to. The Fleet is the only copy of the state: its records hold the
+        fields occupancy needs and its columns the parsed readings, rules
+        and stored free values.
+
+        Changes arrive either from an RTDB listen() on /sensors or from
+        notify() for in-process writes. sync() reconciles the model with a
+        full download of /spots and /sensors, updating only the rows that
+        differ, and evaluate() re-evaluates every spot straight from the
+        columns with RuleSet.evaluate_columns. Callbacks registered with
+        on_change() are called with every batch of free transitions once it
+        has been written, those registered with on_relink() whenever a
+        sensor moves between spots, and those registered with on_sensors()
+        with the sensor objects every change touched. If owns is set, only the spots it
+        returns True for are written. A process that doesn't lead keeps its
+        model current with follow(), which never writes."""
+
+    def __init__(self, db, cache=None, rules=None):
+        self.db = db
+        self.cache = cache
+        self.rules = rules if rules is not None else RuleSet.from_env()
+        self.listener = None
+        self.callbacks = []
+        self.relink_callbacks = []
+        self.sensor_callbacks = []
+        self.fleet = Fleet(self.rules)
+        self.owns = None
+        self.synced = 0
+        self.followed = 0
+        self.lock = threading.RLock()
+
+    ## Full pass ##################################################
+    def sync(self, spots, sensors):
+        """Reconciles the model with a full download of /spots and /sensors
+            and writes every spot whose free value is out of date. Returns
+            the dict of changed spot ids to their new free value."""
+
+        with self.lock:
+            self.fleet.load(as_dict(spots), as_dict(sensors))
+            self.synced = time.time()
+            return self._commit(self.fleet.changed())
+
+    def follow(self, spots, sensors):
+        """Refreshes the model from a full download without writing anything,
+            for a process that isn't the leader. The free values the leader
+            changed since the last refresh are passed to the change
+            callbacks and returned."""
+
+        with self.lock:
+            changes = self.fleet.load(as_dict(spots), as_dict(sensors))
+            self.followed = time.time()
+            self._announce(changes)
+            return changes
+
+    def evaluate(self):
+        """Re-evaluates every spot from the model, without reading anything,
+            and writes the ones whose free value is out of date."""
+
+        with self.lock:
+            return self._commit(self.fleet.changed())
+
+    ## Incremental updates ########################################
+    def listen(self, ref):
+        """Subscribes to RTDB change events under the given /sensors reference."""
+
+        self.listener = ref.listen(self.handle_event)
+        return self.listener
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+
+    def on_change(self, callback):
+        """Registers callback(changes, areas), called after each write with
+            {spot id: free} and {spot id: area} for the changed spots."""
+
+        self.callbacks.append(callback)
+        return callback
+
+    def on_relink(self, callback):
+        """Registers callback(sensor, old, new, states), called after a
+            sensor moved from spot old to spot new in the model, with
+            {spot id: (area, free)} for the two spots."""
+
+        self.relink_callbacks.append(callback)
+        return callback
+
+    def on_sensors(self, callback):
+        """Registers callback(sensors), called with {sensor id: object (None
+            if deleted)} for the sensors each change event touched."""
+
+        self.sensor_callbacks.append(callback)
+        return callback
+
+    def handle_event(self, event):
+        """Callback for firebase_admin listen() events on /sensors."""
+
+        try:
+            self.apply(event.event_type, event.path, event.data)
+        except Exception as e:
+            logging.error(f"{e} | OCCUPANCY > HANDLE_EVENT | Unable to apply {event.event_type} at {event.path}.")
+
+    def notify(self, id, sensor):
+        """In-process change feed: records that sensors/{id} is now the given
+            object (None if deleted) and re-evaluates the spots it touches."""
+
+        return self.apply("put", f"/{id}", sensor)
+
+    def notify_many(self, sensors):
+        """notify() for several sensors at once, committed in one write."""
+
+        return self.apply("patch", "/", sensors)
+
+    def apply(self, event_type, path, data):
+        """Applies a put/patch at a path relative to /sensors and re-evaluates
+            only the spots touched by the changed sensors."""
+
+        parts = [p for p in (path or "/").split("/") if p]
+        if self.cache is not None:
+            self.cache.invalidate("sensors/" + "/".join(parts))
+
+        with self.lock:
+            ## Full replacement of /sensors (first event after listen())
+            if not parts and event_type == "put":
+                data = as_dict(data)
+                writes = [([sensor], data.get(sensor)) for sensor in set(self.fleet.sensors.rows) | set(data)]
+            ## Otherwise split the event into (sensor id, sub-path, value) writes
+            elif event_type == "patch":
+                writes = [(parts + [p for p in k.split("/") if p], v) for k, v in as_dict(data).items()]
+            else:
+                writes = [(parts, data)]
+
+            ## Rebuild each touched sensor's object from its record
+            objects = {}
+            for keys, value in writes:
+                if not keys:
+                    continue
+                sensor = keys[0]
+                if sensor not in objects:
+                    record = self.fleet.sensor(sensor)
+                    objects[sensor] = record.to_dict() if record is not None else None
+                objects[sensor] = _write(objects[sensor], keys[1:], value)
+
+            for callback in self.sensor_callbacks:
+                try:
+                    callback(objects)
+                except Exception as e:
+                    logging.error(f"{e} | OCCUPANCY > APPLY | Sensor callback failed.")
+
+            touched = set()
+            for sensor, obj in objects.items():
+                record = self.fleet.sensor(sensor)
+                old = record.Spot if record is not None else None
+                new = obj.get("spot") if isinstance(obj, dict) else None
+                self.fleet.set_sensor(sensor, obj)
+                touched.add(self.fleet.spot_of(sensor))
+                if new != old:
+                    self._relink(sensor, old, new, area_of(obj) if isinstance(obj, dict) else None)
+                    touched |= {old, new}
+            return self._commit(self._evaluate(touched))
+
+    def _relink(self, sensor, old, new, area):
+        """Moves a sensor between spots in the model when its spot field changed."""
+
+        if new in (None, "") or self.fleet.sensor(sensor) is None:
+            new = None
+        self.fleet.move(sensor, old, new, area)
+        states = {}
+        for spot in (old, new):
+            record = self.fleet.spot(spot) if spot is not None else None
+            if record is not None:
+                states[spot] = (record.area, bool(self.fleet.free(spot)))
+        for callback in self.relink_callbacks:
+            try:
+                callback(sensor, old, new, states)
+            except Exception as e:
+                logging.error(f"{e} | OCCUPANCY > RELINK | Relink callback failed for {sensor}.")
+
+    def _evaluate(self, spots):
+        """Scalar evaluation of the given spots. Returns {spot id: free} for
+            those whose evaluated free value differs from the stored one."""
+
+        changes = {}
+        for spot in spots:
+            if spot is None:
+                continue
+            occupied = self.fleet.occupied(spot)
+            if occupied is None:
+                continue
+            free = not occupied
+            if self.fleet.free(spot) != free:
+                changes[spot] = free
+        return changes
+
+    def _commit(self, changes):
+        """Writes the changed free values of the spots this process owns in
+            one multi-path update. Returns the changes that were written."""
+
+        if self.owns is not None:
+            changes = {spot: free for spot, free in changes.items() if self.owns(spot)}
+        if not changes:
+            return changes
+
+        try:
+            self.db.reference("/").update({f"spots/{spot}/free": free for spot, free in changes.items()})
+        except Exception as e:
+            logging.error(f"{e} | OCCUPANCY > COMMIT | Unable to update {len(changes)} parking spot(s).")
+            return {}
+
+        for spot, free in changes.items():
+            self.fleet.set_free(spot, free)
+        self._announce(changes)
+        return changes
+
+    def _announce(self, changes):
+        if not changes:
+            return
+        areas = self.fleet.areas(changes)
+        for callback in self.callbacks:
+            try:
+                callback(changes, areas)
+            except Exception as e:
+                logging.error(f"{e} | OCCUPANCY > COMMIT | Change callback failed.")
+
+
+def _write(obj, keys, value):
+    """Returns obj with value set at the nested keys (None deletes),
+        creating or pruning parents."""
+
+    if not keys:
+        return value
+    obj = dict(obj) if isinstance(obj, dict) else {}
+    node = obj
+    for k in keys[:-1]:
+        child = node.get(k)
+        node[k] = dict(child) if isinstance(child, dict) else {}
+        node = node[k]
+    if value is None:
+        node.pop(keys[-1], None)
+    else:
+        node[keys[-1]] = value
+    return obj
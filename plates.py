@@ -0,0 +1,154 @@
+## Python-specific imports
+import math
+import time
+import hashlib
+import logging
+import threading
+
+###################################################################
+## Custom imports
+from occupancy import as_dict
+
+
+def normalize(plate):
+    """Returns the form plates are compared in: upper case without spaces
+        or dashes, so "abc-123" from a camera matches "ABC123"."""
+
+    return str(plate).upper().replace(" ", "").replace("-", "")
+
+
+###################################################################
+## Bloom filter
+class BloomFilter:
+    """Fixed-size Bloom filter over strings. Sized for capacity items at the
+        given false-positive rate; positions come from one blake2b digest
+        split into two hashes (double hashing)."""
+
+    def __init__(self, capacity=1024, error=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error) / math.log(2) ** 2), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for p in self._positions(item):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+
+###################################################################
+## Plate index
+class PlateIndex:
+    """In-memory copy of /plates for permit checks.
+
+        The whole tree is loaded with one read and reloaded once it is older
+        than refresh seconds. Writes made through the app update the index in
+        place. Plate ids are kept exactly as written; only check() compares
+        normalized plates, rejecting unknown ones with the Bloom filter and
+        confirming the rest against the set of normalized ids. The
+        filter is rebuilt with every reload, so deleted plates don't keep
+        bits set for long."""
+
+    def __init__(self, db, refresh=60, error=0.01):
+        self.db = db
+        self.refresh = refresh
+        self.error = error
+        self.plates = {}
+        self.keys = {}
+        self.bloom = BloomFilter(1, error)
+        self.loaded = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def load(self, plates=None):
+        """Reloads the index from /plates, or from the given {plate id:
+            object}."""
+
+        if plates is None:
+            plates = as_dict(self.db.get("plates", cached=False))
+        keys = {}
+        for plate in plates:
+            keys.setdefault(normalize(plate), set()).add(plate)
+        bloom = BloomFilter(2 * len(keys) + 1024, self.error)
+        for key in keys:
+            bloom.add(key)
+        with self.lock:
+            self.plates, self.keys, self.bloom = plates, keys, bloom
+            self.loaded = time.time()
+        logging.info(f"PLATES > LOAD | Indexed {len(plates)} plate(s).")
+
+    def _fresh(self):
+        if time.time() - self.loaded > self.refresh:
+            try:
+                self.load()
+            except Exception as e:
+                logging.error(f"{e} | PLATES > LOAD | Unable to reload plates, serving the last copy.")
+
+    ## Reads ######################################################
+    def all(self):
+        self._fresh()
+        with self.lock:
+            return dict(self.plates)
+
+    def get(self, plate):
+        """Returns the object of plate id, or None."""
+
+        self._fresh()
+        with self.lock:
+            return self.plates.get(plate)
+
+    def check(self, plates):
+        """Returns {plate: bool} for every plate in the batch."""
+
+        self._fresh()
+        results = {}
+        with self.lock:
+            for plate in plates:
+                key = normalize(plate)
+                if key not in self.bloom:
+                    self.rejected += 1
+                    results[plate] = False
+                else:
+                    results[plate] = key in self.keys
+        return results
+
+    ## Writes #####################################################
+    def added(self, plates):
+        """Records {plate id: object} written through the app."""
+
+        with self.lock:
+            for plate, data in plates.items():
+                self.plates[plate] = data
+                self.keys.setdefault(normalize(plate), set()).add(plate)
+                self.bloom.add(normalize(plate))
+
+    def deleted(self, plates):
+        """Records plate ids deleted through the app."""
+
+        with self.lock:
+            for plate in plates:
+                self.plates.pop(plate, None)
+                ids = self.keys.get(normalize(plate))
+                if ids is not None:
+                    ids.discard(plate)
+                    if not ids:
+                        del self.keys[normalize(plate)]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "plates": len(self.plates),
+                "bloom_bits": self.bloom.size,
+                "bloom_hashes": self.bloom.hashes,
+                "rejected": self.rejected,
+                "age": time.time() - self.loaded if self.loaded else None,
+            }
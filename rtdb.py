@@ -0,0 +1,453 @@
+## Python-specific imports
+import copy
+import time
+import asyncio
+import logging
+import threading
+import functools
+import contextvars
+
+## Flask imports
+from flask import g, request, has_request_context
+
+###################################################################
+## Custom imports
+from cache import normalize
+from occupancy import as_dict
+
+
+_MISSING = object()
+
+## Characters the RTDB doesn't accept in a key
+INVALID_PATH_CHARS = set(".$#[]")
+
+
+def validate(op, path, value):
+    """Raises ValueError if the RTDB would reject the write, so a write that
+        can never succeed isn't journaled."""
+
+    def check(key):
+        if not key or INVALID_PATH_CHARS & set(key):
+            raise ValueError(f"Invalid RTDB key {key!r} in {op} of /{path}.")
+
+    def walk(node):
+        ## Server values ({".sv": ...}) are resolved by the datastore
+        if isinstance(node, dict) and list(node) == [".sv"]:
+            return
+        if isinstance(node, dict):
+            for key, child in node.items():
+                check(str(key))
+                walk(child)
+        elif isinstance(node, list):
+            for child in node:
+                walk(child)
+
+    for key in path.split("/") if path else []:
+        check(key)
+    if op == "update":
+        if not isinstance(value, dict) or not value:
+            raise ValueError(f"Update of /{path} must be a non-empty dict.")
+        for key, child in value.items():
+            for part in str(key).split("/"):
+                check(part)
+            walk(child)
+    else:
+        walk(value)
+
+
+###################################################################
+## Data access layer for the RTDB
+class Store:
+    """Single entry point for RTDB access from the routes and util. Mirrors
+        firebase_admin.db.reference(), so it can be passed anywhere a `db`
+        is expected."""
+
+    def __init__(self, db, cache=None, observer=None, pool=None, fallback=None, journal=None,
+                 stamp=None):
+        self.db = db
+        ## stamp(paths) returns extra leaves written along with paths
+        self.stamp = stamp
+        ## Shared PathCache behind the per-request memo in flask.g
+        self.cache = cache
+        ## observer(op, seconds) is called after every datastore call
+        self.observer = observer
+        ## Thread pool of get_async() and fetch_async()
+        self.pool = pool
+        self.fallback = fallback
+        self.journal = journal
+        self.snapshot = None
+        self.snapshot_saved = None
+        self.degraded = False
+        self.lock = threading.Lock()
+
+    ## Request scope ##############################################
+    def _memo(self):
+        if not has_request_context():
+            return None
+        if "rtdb_memo" not in g:
+            g.rtdb_memo = {}
+            g.rtdb_calls = 0
+        return g.rtdb_memo
+
+    def _call(self, op, path, *args):
+        """Makes one datastore call, counting and timing it."""
+
+        return self._run(op, path, lambda ref: getattr(ref, op)(*args))
+
+    def _run(self, op, path, fn):
+        """Calls fn(reference) as one counted and timed datastore call."""
+
+        if has_request_context():
+            self._memo()
+            g.rtdb_calls += 1
+        start = time.perf_counter()
+        try:
+            return fn(self.db.reference(f"/{path}"))
+        finally:
+            if self.observer is not None:
+                self.observer(op, time.perf_counter() - start)
+
+    def calls(self):
+        """Returns the number of RTDB round trips made by the current request."""
+
+        if has_request_context():
+            return g.get("rtdb_calls", 0)
+        return 0
+
+    ## Warm start #################################################
+    def warm(self, data, saved):
+        """Serves reads of the {domain: tree} snapshot taken at time saved."""
+
+        self.snapshot = dict(data)
+        self.snapshot_saved = saved
+
+    def cool(self):
+        """Goes back to reading everything from the datastore."""
+
+        self.snapshot = None
+
+    def _reading(self):
+        """True inside a request that only reads."""
+
+        return has_request_context() and request.method in ("GET", "HEAD")
+
+    def _warm(self, path):
+        """Returns (True, value) if path is answered by the snapshot. After
+            warm() the snapshot's domains are served without a datastore call
+            until cool() or a write to them. Only GET and HEAD requests are
+            served from it (and from the shared cache), so a read-modify-write
+            never merges onto stale data; while degraded every request is, so
+            a write's read-before-write succeeds and the write is journaled."""
+
+        if not (self.degraded or self._reading()):
+            return False, None
+        snapshot = self.snapshot
+        parts = path.split("/") if path else []
+        if snapshot is None or not parts or parts[0] not in snapshot:
+            return False, None
+        node = snapshot
+        for part in parts:
+            if isinstance(node, list) and part.isdigit() and int(part) < len(node):
+                node = node[int(part)]
+            elif isinstance(node, dict):
+                node = node.get(part)
+            else:
+                node = None
+            if node is None:
+                break
+        if has_request_context():
+            g.rtdb_snapshot = self.snapshot_saved
+        return True, copy.deepcopy(node)
+
+    ## Degraded mode ##############################################
+    def unreachable(self, e):
+        """True if e means the datastore couldn't be reached in time."""
+
+        check = getattr(self.db, "unreachable", None)
+        return check is not None and check(e)
+
+    def degrade(self, reason):
+        """Starts serving the fallback snapshot and journaling writes. Called
+            when a call fails because the datastore is unreachable: the store
+            warms itself from fallback.load() if it isn't warm, and recover()
+            replays the journal once the datastore answers again."""
+
+        with self.lock:
+            if self.degraded:
+                return
+            self.degraded = True
+            if self.snapshot is None and self.fallback is not None:
+                saved, data = self.fallback.load()
+                if data is not None:
+                    self.warm(data, saved)
+        logging.warning(f"{reason} | RTDB > DEGRADE | RTDB unreachable, serving the snapshot "
+                        f"and journaling writes.")
+
+    def recover(self):
+        """Replays the journal and leaves degraded mode. Returns False if
+            writes were queued meanwhile by another worker and are still
+            pending; a failed replay raises."""
+
+        if self.journal is not None:
+            self.journal.replay(self._replay, self.unreachable)
+        with self.lock:
+            if self.journal is not None and self.journal.pending():
+                return False
+            self.degraded = False
+            self.cool()
+        return True
+
+    def _replay(self, op, path, value):
+        self._call(op, path, *(() if op == "delete" else (value,)))
+        self._forget(path)
+
+    def _fail_over(self, e, path):
+        """Returns (True, value) if a read of path that failed with e can
+            be answered by the snapshot."""
+
+        if not self.unreachable(e):
+            return False, None
+        self.degrade(e)
+        return self._warm(path)
+
+    def _journal(self, op, path, value, paths):
+        """Queues a write while degraded. Call with the lock held."""
+
+        if self.journal is None:
+            return False
+        self.journal.append(op, path, value)
+        for p, v in paths.items():
+            self._patch(p, v)
+            self._forget(p)
+        return True
+
+    def _patch(self, path, value):
+        """Applies a journaled write of value (None deletes) to the snapshot."""
+
+        snapshot = self.snapshot
+        parts = path.split("/") if path else []
+        if snapshot is None or not parts or parts[0] not in snapshot:
+            return
+        node = snapshot
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = as_dict(child) if isinstance(child, list) else {}
+                node[part] = child
+            node = child
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = copy.deepcopy(value)
+
+    ## Reads ######################################################
+    def get(self, path, cached=True):
+        """Returns the object at path, or None if it doesn't exist. With
+            cached=False the request memo, cache and snapshot are bypassed."""
+
+        path = normalize(path)
+        if not cached:
+            return self._call("get", path)
+
+        warm, value = self._warm(path)
+        if warm:
+            return value
+
+        memo = self._memo()
+        if memo is not None and path in memo:
+            return copy.deepcopy(memo[path])
+
+        try:
+            value = self._load(path)
+        except Exception as e:
+            warm, value = self._fail_over(e, path)
+            if not warm:
+                raise
+            return value
+        if memo is not None:
+            memo[path] = copy.deepcopy(value)
+        return value
+
+    def _load(self, path):
+        def loader():
+            return self._call("get", path)
+
+        if self.cache is None or not self._reading():
+            return loader()
+        return self.cache.get(path, loader)
+
+    def fetch(self, domain, id):
+        """Returns the object at {domain}/{id}, or None if it doesn't exist."""
+
+        if id is None:
+            return None
+        return self.get(f"{domain}/{id}")
+
+    async def get_async(self, path, cached=True):
+        """get() on the store's thread pool, for use with asyncio.gather. The
+            read runs in a copy of the caller's context, so the request memo
+            and round-trip count still apply."""
+
+        call = functools.partial(contextvars.copy_context().run, self.get, path, cached)
+        return await asyncio.get_running_loop().run_in_executor(self.pool, call)
+
+    async def fetch_async(self, domain, id):
+        if id is None:
+            return None
+        return await self.get_async(f"{domain}/{id}")
+
+    def page(self, path, start=None, limit=None):
+        """Returns up to limit children of path ordered by key, starting at
+            key start (inclusive), with one ordered-by-key query. Pages bypass
+            the memo and cache, but not a warm snapshot."""
+
+        def query(ref):
+            q = ref.order_by_key()
+            if start is not None:
+                q = q.start_at(start)
+            if limit is not None:
+                q = q.limit_to_first(limit)
+            return q.get()
+
+        path = normalize(path)
+        warm, node = self._warm(path)
+        if not warm:
+            try:
+                return self._run("query", path, query)
+            except Exception as e:
+                warm, node = self._fail_over(e, path)
+                if not warm:
+                    raise
+        node = as_dict(node)
+        keys = sorted(k for k in node if start is None or k >= start)
+        return {k: node[k] for k in keys[:limit]}
+
+    ## Writes #####################################################
+    def set(self, path, value):
+        path = normalize(path)
+        self._write("set", path, value, {path: value})
+
+    def update(self, path, value):
+        """Multi-path update of the children of path given as relative keys."""
+
+        base = normalize(path)
+        self._write("update", base, value, {f"{base}/{key}" if base else key: v for key, v in value.items()})
+
+    def delete(self, path):
+        path = normalize(path)
+        self._write("delete", path, None, {path: None})
+
+    def _write(self, op, path, value, paths):
+        """Makes one write, or journals it while the datastore is
+            unreachable. paths maps every path written to its new value.
+            stamp()'s leaves turn the write into one multi-path update of the
+            root. The write is validated first, so one the RTDB would reject
+            is never journaled; a journaled write is applied to the snapshot
+            so it can be read back, and the memo and cache are invalidated."""
+
+        if self.stamp is not None and (path or op == "update"):
+            extra = self.stamp(paths)
+            if extra:
+                paths = dict(paths, **extra)
+                op, path, value = "update", "", dict(paths)
+        validate(op, path, value)
+        with self.lock:
+            if self.degraded and self._journal(op, path, value, paths):
+                return
+        try:
+            self._call(op, path, *(() if op == "delete" else (value,)))
+        except Exception as e:
+            if self.journal is None or not self.unreachable(e):
+                raise
+            self.degrade(e)
+            with self.lock:
+                self._journal(op, path, value, paths)
+            return
+        for p in paths:
+            self.invalidate(p)
+
+    def invalidate(self, path):
+        """Drops a path (and its ancestors and descendants) from the request
+            memo, the shared cache and a warm snapshot."""
+
+        path = normalize(path)
+        snapshot = self.snapshot
+        if snapshot is not None:
+            if path:
+                snapshot.pop(path.split("/")[0], None)
+            else:
+                snapshot.clear()
+        self._forget(path)
+
+    def _forget(self, path):
+        path = normalize(path)
+        memo = self._memo()
+        if memo is not None:
+            prefix = path + "/"
+            for key in list(memo):
+                if not path or key == path or key.startswith(prefix) or path.startswith(key + "/") or not key:
+                    del memo[key]
+        if self.cache is not None:
+            self.cache.invalidate(path)
+
+    def reference(self, path="/"):
+        return Reference(self, path)
+
+
+class Reference:
+    """Minimal stand-in for firebase_admin.db.Reference that routes every
+        call through a Store."""
+
+    def __init__(self, store, path):
+        self.store = store
+        self.path = normalize(path)
+
+    def child(self, path):
+        return Reference(self.store, f"{self.path}/{path}")
+
+    def get(self):
+        return self.store.get(self.path)
+
+    def set(self, value):
+        return self.store.set(self.path, value)
+
+    def update(self, value):
+        return self.store.update(self.path, value)
+
+    def delete(self):
+        return self.store.delete(self.path)
+
+    def listen(self, callback):
+        return self.store.db.reference(f"/{self.path}").listen(callback)
+
+    def order_by_key(self):
+        return Query(self.store, self.path)
+
+
+class Query:
+    """Ordered-by-key query on a Reference, run through Store.page()."""
+
+    def __init__(self, store, path):
+        self.store = store
+        self.path = path
+        self.start = None
+        self.limit = None
+
+    def start_at(self, start):
+        self.start = start
+        return self
+
+    def limit_to_first(self, limit):
+        self.limit = limit
+        return self
+
+    def get(self):
+        return self.store.page(self.path, self.start, self.limit)
+
+
+def log_request_calls(store, endpoint):
+    """Logs how many RTDB round trips the current request made."""
+
+    calls = store.calls()
+    logging.info(f"RTDB > {endpoint} | {calls} round trip(s) this request.")
+    return calls
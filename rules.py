@@ -0,0 +1,247 @@
+## Python-specific imports
+import os
+import json
+import math
+import numpy as np
+
+
+###################################################################
+## Sensor types
+## Every spelling of a sensor type is normalized once to an integer code,
+## which indexes the per-type rule arrays below.
+UNKNOWN, ULTRASONIC, LIDAR = 0, 1, 2
+
+TYPE_CODES = {
+    "ultrasonic": ULTRASONIC,
+    "us": ULTRASONIC,
+    "usonic": ULTRASONIC,
+    "lidar": LIDAR,
+}
+
+
+def register_type(name, code):
+    """Adds a sensor type spelling (case-insensitive) for an existing or new code."""
+
+    TYPE_CODES[str(name).lower()] = int(code)
+
+
+def type_code(stype):
+    """Returns the integer code for a sensor type, or UNKNOWN."""
+
+    if stype is None:
+        return UNKNOWN
+    return TYPE_CODES.get(str(stype).lower(), UNKNOWN)
+
+
+###################################################################
+## Sensor values
+## Readings that mean OCCUPIED under the boolean rule (the original occ table)
+OCCUPIED_VALUES = ("True", "true", 1, True)
+
+
+def parse_value(value):
+    """Returns (distance, flag) for a sensor reading. distance is the value
+        as a float for numeric readings (NaN for booleans and other strings)
+        and flag is whether it means OCCUPIED under the boolean rule."""
+
+    flag = value in OCCUPIED_VALUES
+    if isinstance(value, bool) or value is None:
+        return (math.nan, flag)
+    if isinstance(value, (int, float)):
+        return (float(value), flag)
+    if isinstance(value, str):
+        try:
+            return (float(value), flag)
+        except ValueError:
+            pass
+    return (math.nan, flag)
+
+
+###################################################################
+## Spot rules
+## How the occupied votes of a spot's sensors are combined
+ANY, ALL, MAJORITY, ATLEAST = 0, 1, 2, 3
+MODES = {"any": ANY, "all": ALL, "majority": MAJORITY, "atleast": ATLEAST}
+
+
+def parse_rule(rule):
+    """Returns (mode, n, threshold) from a spot's optional "rule" field,
+        either a mode name or {"mode": ..., "n": ..., "threshold": ...}.
+        With no rule a spot is occupied if any sensor says so."""
+
+    if rule is None:
+        return (ANY, 1, math.nan)
+    if isinstance(rule, str):
+        rule = {"mode": rule}
+    if not isinstance(rule, dict):
+        return (ANY, 1, math.nan)
+
+    mode = MODES.get(str(rule.get("mode", "any")).lower(), ANY)
+    try:
+        n = max(int(rule.get("n", 1)), 1)
+    except (TypeError, ValueError):
+        n = 1
+    try:
+        threshold = float(rule["threshold"]) if rule.get("threshold") is not None else math.nan
+    except (TypeError, ValueError):
+        threshold = math.nan
+    return (mode, n, threshold)
+
+
+def combine(mode, n, votes, count):
+    """Scalar version of the vote combination used by RuleSet.evaluate()."""
+
+    if count == 0:
+        return False
+    if mode == ALL:
+        return votes == count
+    if mode == MAJORITY:
+        return votes * 2 > count
+    if mode == ATLEAST:
+        return votes >= n
+    return votes >= 1
+
+
+def members(spot):
+    """Yields the sensor ids linked to a spot, skipping its self-reference."""
+
+    sensors = spot.get("sensors")
+    if isinstance(sensors, list):
+        sensors = {str(i): v for i, v in enumerate(sensors) if v is not None}
+    for sensor in sensors or {}:
+        if sensor != "spot":
+            yield sensor
+
+
+###################################################################
+## Rule engine
+class RuleSet:
+    """Occupancy rules for the whole fleet.
+
+        A sensor reading counts as OCCUPIED either by the boolean rule
+        (value in OCCUPIED_VALUES) or, when a distance threshold applies to
+        it, by value <= threshold. Thresholds come from the spot's rule or
+        from the per-type defaults. A spot's votes are then combined with
+        its any/all/majority/atleast-N mode.
+
+        evaluate() runs over columnar NumPy arrays for every spot at once;
+        occupied() is the equivalent scalar path for a single spot."""
+
+    def __init__(self, thresholds=None):
+        self.thresholds = {}
+        for stype, threshold in (thresholds or {}).items():
+            self.set_threshold(stype, threshold)
+
+    @classmethod
+    def from_env(cls):
+        """Builds the rules from OCCUPANCY_THRESHOLDS, a JSON object of sensor
+            type to distance threshold, e.g. {"lidar": 150}."""
+
+        return cls(json.loads(os.environ.get("OCCUPANCY_THRESHOLDS", "{}") or "{}"))
+
+    def set_threshold(self, stype, threshold):
+        code = type_code(stype)
+        if code != UNKNOWN:
+            self.thresholds[code] = float(threshold)
+
+    def _type_thresholds(self, size=0):
+        size = max([size, max(TYPE_CODES.values(), default=0) + 1] + [c + 1 for c in self.thresholds])
+        arr = np.full(size, np.nan)
+        for code, threshold in self.thresholds.items():
+            arr[code] = threshold
+        return arr
+
+    ## Scalar path ################################################
+    def sensor_occupied(self, code, distance, flag, threshold=math.nan):
+        if math.isnan(threshold):
+            threshold = self.thresholds.get(code, math.nan)
+        if not math.isnan(threshold) and not math.isnan(distance):
+            return distance <= threshold
+        return flag
+
+    def occupied(self, spot, sensors):
+        """Returns True if the spot is occupied under its rule."""
+
+        mode, n, threshold = parse_rule(spot.get("rule"))
+        votes = count = 0
+        for sensor in members(spot):
+            s = sensors.get(sensor)
+            if not isinstance(s, dict):
+                continue
+            code = type_code(s.get("type"))
+            if code == UNKNOWN:
+                continue
+            distance, flag = parse_value(s.get("value"))
+            count += 1
+            votes += self.sensor_occupied(code, distance, flag, threshold)
+        return combine(mode, n, votes, count)
+
+    ## Vectorized path ############################################
+    def columns(self, spots, sensors):
+        """Flattens spots and sensors into columnar arrays: one row per
+            (sensor, spot) link with type code, distance, flag and spot
+            index, plus per-spot mode, n and threshold."""
+
+        ids = list(spots)
+        codes, distances, flags, spot_idx = [], [], [], []
+        modes = np.zeros(len(ids), dtype=np.int8)
+        ns = np.ones(len(ids), dtype=np.int32)
+        thresholds = np.full(len(ids), np.nan)
+
+        for i, spot in enumerate(ids):
+            obj = spots[spot]
+            modes[i], ns[i], thresholds[i] = parse_rule(obj.get("rule"))
+            for sensor in members(obj):
+                s = sensors.get(sensor)
+                if not isinstance(s, dict):
+                    continue
+                code = type_code(s.get("type"))
+                if code == UNKNOWN:
+                    continue
+                distance, flag = parse_value(s.get("value"))
+                codes.append(code)
+                distances.append(distance)
+                flags.append(flag)
+                spot_idx.append(i)
+
+        return {
+            "ids": ids,
+            "code": np.asarray(codes, dtype=np.int16),
+            "distance": np.asarray(distances, dtype=np.float64),
+            "flag": np.asarray(flags, dtype=bool),
+            "spot": np.asarray(spot_idx, dtype=np.int32),
+            "mode": modes,
+            "n": ns,
+            "threshold": thresholds,
+        }
+
+    def evaluate_columns(self, code, distance, flag, spot, mode, n, threshold):
+        """Returns the free vector for every spot from columnar arrays."""
+
+        nspots = len(mode)
+        if nspots == 0:
+            return np.zeros(0, dtype=bool)
+
+        ## Per-sensor OCCUPIED votes
+        type_thr = self._type_thresholds(int(code.max()) + 1 if len(code) else 0)
+        thr = threshold[spot]
+        thr = np.where(np.isnan(thr), type_thr[code], thr)
+        use_thr = ~np.isnan(thr) & ~np.isnan(distance)
+        occupied = np.where(use_thr, distance <= np.nan_to_num(thr), flag)
+
+        ## Combine the votes per spot
+        votes = np.bincount(spot, weights=occupied, minlength=nspots)
+        count = np.bincount(spot, minlength=nspots)
+        result = np.where(mode == ALL, votes == count,
+                 np.where(mode == MAJORITY, votes * 2 > count,
+                 np.where(mode == ATLEAST, votes >= n, votes >= 1)))
+        result &= count > 0
+        return ~result
+
+    def evaluate(self, spots, sensors):
+        """Returns {spot id: free} for every spot in one vectorized pass."""
+
+        cols = self.columns(spots, sensors)
+        free = self.evaluate_columns(cols["code"], cols["distance"], cols["flag"], cols["spot"],
+                                     cols["mode"], cols["n"], cols["threshold"])
+        return dict(zip(cols["ids"], free.tolist()))
@@ -4,7 +4,8 @@ DROP TABLE IF EXISTS sensors;
 CREATE TABLE keys (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    sensorid TEXT UNIQUE NOT NULL
+    sensorid TEXT UNIQUE NOT NULL,
+    keyhash TEXT
 );
 
 CREATE TABLE sensors (
@@ -0,0 +1,53 @@
+## Python-specific imports
+import os
+import mmap
+import time
+import logging
+import msgpack
+
+
+###################################################################
+## Local state snapshot
+class Snapshot:
+    """Last known copy of some RTDB domains in a local msgpack file.
+
+        save() writes {"saved": timestamp, "data": {domain: tree}} to a
+        temporary file and renames it over the old one, so a reader never
+        sees a partial file. load() maps the file read-only and unpacks
+        straight from the mapping, without reading it into a bytes copy
+        first."""
+
+    def __init__(self, path="snapshot.msgpack"):
+        self.path = path
+        self.saved = None
+
+    def save(self, data, now=None):
+        """Writes {domain: tree} with the current time. Returns the size in bytes."""
+
+        now = time.time() if now is None else now
+        packed = msgpack.packb({"saved": now, "data": data}, use_bin_type=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(packed)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.saved = now
+        return len(packed)
+
+    def load(self):
+        """Returns (saved timestamp, {domain: tree}), or (None, None) if
+            there is no usable snapshot."""
+
+        try:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                state = msgpack.unpackb(mm, raw=False, strict_map_key=False)
+        except FileNotFoundError:
+            return None, None
+        except (OSError, ValueError, msgpack.UnpackException) as e:
+            logging.warning(f"{e} | SNAPSHOT > LOAD | Ignoring unreadable snapshot {self.path}.")
+            return None, None
+        if not isinstance(state, dict) or not isinstance(state.get("data"), dict):
+            return None, None
+        self.saved = state.get("saved")
+        return self.saved, state["data"]
@@ -0,0 +1,181 @@
+## Python-specific imports
+import math
+import heapq
+import threading
+
+
+## Mean Earth radius in meters
+EARTH_RADIUS = 6371008.8
+## Meters per degree of latitude
+DEGREE = math.pi / 180 * EARTH_RADIUS
+
+
+def coords_of(obj):
+    """Returns (lat, lon) from an object's "lat" and "lon" fields, or None if
+        they are missing or out of range."""
+
+    if not isinstance(obj, dict):
+        return None
+    try:
+        lat, lon = float(obj["lat"]), float(obj["lon"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return (lat, lon)
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """Equirectangular distance in meters, accurate at parking-lot scale."""
+
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return EARTH_RADIUS * math.hypot(x, y)
+
+
+###################################################################
+## Grid index of free spots
+class GridIndex:
+    """Uniform lat/lon grid over the spots that have coordinates. Only free
+        spots are kept in the cells, so nearest() searches outward ring by
+        ring from the query's cell and stops as soon as the k best spots are
+        closer than anything in the next ring could be. With the default
+        cell of 0.001 degrees (about 110 m) a query touches only a handful
+        of cells however many spots the lot has."""
+
+    def __init__(self, cell=0.001):
+        self.cell = cell
+        self.points = {}
+        self.cells = {}
+        self.extent = None
+        self.lock = threading.Lock()
+
+    def _key(self, lat, lon):
+        return (math.floor(lat / self.cell), math.floor(lon / self.cell))
+
+    def _grow(self, key):
+        if self.extent is None:
+            self.extent = [key[0], key[0], key[1], key[1]]
+            return
+        self.extent[0] = min(self.extent[0], key[0])
+        self.extent[1] = max(self.extent[1], key[0])
+        self.extent[2] = min(self.extent[2], key[1])
+        self.extent[3] = max(self.extent[3], key[1])
+
+    def _unlink(self, spot):
+        point = self.points.pop(spot, None)
+        if point is not None and point[2]:
+            key = self._key(point[0], point[1])
+            members = self.cells.get(key)
+            if members is not None:
+                members.discard(spot)
+                if not members:
+                    del self.cells[key]
+        return point
+
+    def _link(self, spot, lat, lon, free):
+        self.points[spot] = (lat, lon, free)
+        if free:
+            key = self._key(lat, lon)
+            self.cells.setdefault(key, set()).add(spot)
+            self._grow(key)
+
+    ## Updates ####################################################
+    def track(self, spot, lat, lon, free):
+        """Adds or moves a spot, with its current free value."""
+
+        with self.lock:
+            self._unlink(spot)
+            self._link(spot, lat, lon, bool(free))
+
+    def set_free(self, spot, free):
+        """Updates a spot's free value. Spots without coordinates are ignored."""
+
+        with self.lock:
+            point = self.points.get(spot)
+            if point is None or point[2] == bool(free):
+                return
+            self._unlink(spot)
+            self._link(spot, point[0], point[1], bool(free))
+
+    def discard(self, spot):
+        with self.lock:
+            self._unlink(spot)
+
+    def rebuild(self, spots, is_free):
+        """Replaces the index with every spot in {spot id: spot object} that
+            has coordinates."""
+
+        with self.lock:
+            self.points = {}
+            self.cells = {}
+            self.extent = None
+            for spot, obj in spots.items():
+                coords = coords_of(obj)
+                if coords is not None:
+                    self._link(spot, coords[0], coords[1], bool(is_free(obj.get("free"))))
+
+    ## Queries ####################################################
+    def _ring(self, ci, cj, r):
+        """Yields the cells at Chebyshev distance r from (ci, cj) that lie
+            inside the extent of the index."""
+
+        imin, imax, jmin, jmax = self.extent
+        if r == 0:
+            yield (ci, cj)
+            return
+        for j in (cj - r, cj + r):
+            if jmin <= j <= jmax:
+                for i in range(max(ci - r, imin), min(ci + r, imax) + 1):
+                    yield (i, j)
+        for i in (ci - r, ci + r):
+            if imin <= i <= imax:
+                for j in range(max(cj - r + 1, jmin), min(cj + r - 1, jmax) + 1):
+                    yield (i, j)
+
+    def nearest(self, lat, lon, k=5, radius=None):
+        """Returns up to k (meters, spot, lat, lon) tuples for the closest
+            free spots, nearest first, optionally within radius meters."""
+
+        with self.lock:
+            if self.extent is None or k <= 0:
+                return []
+            ci, cj = self._key(lat, lon)
+            ## Rings closer or further than the extent of the index are empty
+            imin, imax, jmin, jmax = self.extent
+            first = max(imin - ci, ci - imax, jmin - cj, cj - jmax, 0)
+            last = max(abs(ci - imin), abs(ci - imax), abs(cj - jmin), abs(cj - jmax))
+            ## Smallest width of a cell in meters, to bound unseen rings
+            width = self.cell * DEGREE * max(math.cos(math.radians(min(abs(lat) + self.cell, 90))), 1e-6)
+
+            best = []
+            r = first
+            while r <= last:
+                for key in self._ring(ci, cj, r):
+                    for spot in self.cells.get(key, ()):
+                        slat, slon, _ = self.points[spot]
+                        d = distance(lat, lon, slat, slon)
+                        if radius is not None and d > radius:
+                            continue
+                        item = (-d, spot, slat, slon)
+                        if len(best) < k:
+                            heapq.heappush(best, item)
+                        elif item > best[0]:
+                            heapq.heapreplace(best, item)
+                ## Anything in ring r + 1 is at least r cells away
+                bound = r * width
+                if len(best) == k and -best[0][0] <= bound:
+                    break
+                if radius is not None and bound > radius:
+                    break
+                r += 1
+
+        return sorted((-d, spot, slat, slon) for d, spot, slat, slon in best)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "spots": len(self.points),
+                "free": sum(len(c) for c in self.cells.values()),
+                "cells": len(self.cells),
+            }
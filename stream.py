@@ -0,0 +1,185 @@
+## Python-specific imports
+import json
+import asyncio
+import itertools
+import threading
+from collections import deque
+
+
+def format_event(seq, event, data):
+    """Returns one Server-Sent Events message."""
+
+    return f"id: {seq}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+###################################################################
+## Fan-out of spot availability changes
+class Broadcaster:
+    """Fans out spot free transitions to any number of SSE subscribers.
+
+        The occupancy engine publishes into a fixed-size ring buffer of
+        numbered events. Each subscriber holds a cursor into the buffer, so
+        there is no per-client queue, and a client that reconnects with
+        Last-Event-ID is replayed whatever it missed that is still in the
+        buffer. A client that fell further behind than the buffer gets a
+        "reset" event telling it to refetch /data/spots.
+
+        subscribe() is a plain generator that waits on a Condition, so it
+        holds a server thread for as long as the client stays connected;
+        at most max_blocking of those are let in. subscribe_async() waits on an
+        asyncio.Event woken from publish(), for serving from an event loop
+        without a thread per client."""
+
+    def __init__(self, size=1024, heartbeat=15, max_blocking=4):
+        self.events = deque(maxlen=size)
+        self.seq = 0
+        self.heartbeat = heartbeat
+        self.max_blocking = max_blocking
+        self.cond = threading.Condition()
+        self.waiters = set()
+        self.subscribers = 0
+        self.blocking = 0
+        self.refused = 0
+        self.published = 0
+
+    def publish(self, changes, areas=None):
+        """Adds {spot id: free} transitions to the buffer and wakes every
+            subscriber. areas is {spot id: area}, used to tag each event
+            with the spot's area."""
+
+        if not changes:
+            return
+        areas = areas or {}
+        with self.cond:
+            for spot, free in changes.items():
+                self.seq += 1
+                self.events.append((self.seq, {"id": spot, "free": free, "area": areas.get(spot)}))
+            self.published += len(changes)
+            self.cond.notify_all()
+            waiters = list(self.waiters)
+        for loop, wake in waiters:
+            try:
+                loop.call_soon_threadsafe(wake.set)
+            except RuntimeError:
+                ## The subscriber's loop is closed; its finally drops it
+                pass
+
+    def _since(self, cursor):
+        """Returns (events after cursor, whether some were already dropped).
+            Must be called with the condition held."""
+
+        if not self.events or cursor >= self.seq:
+            return [], False
+        first = self.events[0][0]
+        if cursor < first - 1:
+            return list(self.events), True
+        return list(itertools.islice(self.events, cursor - first + 1, None)), False
+
+    def _messages(self, events, dropped, cursor, match):
+        """Returns the SSE messages for one wake-up of a subscriber."""
+
+        if dropped:
+            return [format_event(cursor, "reset", {"reason": "Fell behind, refetch /data/spots."})]
+        if not events:
+            return [": keepalive\n\n"]
+        return [format_event(seq, "free", data) for seq, data in events if match is None or match(data)]
+
+    def full(self):
+        """True if every blocking subscribe() slot is taken."""
+
+        with self.cond:
+            if self.blocking < self.max_blocking:
+                return False
+            self.refused += 1
+            return True
+
+    def subscribe(self, last=None, match=None, blocking=False):
+        """Generator of SSE messages for one client. last is the client's
+            Last-Event-ID (None to start from now) and match an optional
+            filter called with each event. A blocking subscriber takes one
+            of the max_blocking slots, or is told to retry later if they
+            were all taken meanwhile."""
+
+        with self.cond:
+            refused = blocking and self.blocking >= self.max_blocking
+            if refused:
+                self.refused += 1
+            else:
+                cursor = self.seq if last is None else min(last, self.seq)
+                self.subscribers += 1
+                self.blocking += blocking
+        if refused:
+            yield f"retry: {int(self.heartbeat * 2000)}\n: Too many subscribers.\n\n"
+            return
+
+        try:
+            yield f"retry: 3000\nid: {cursor}\n\n"
+            while True:
+                with self.cond:
+                    if cursor >= self.seq:
+                        self.cond.wait(self.heartbeat)
+                    events, dropped = self._since(cursor)
+                    cursor = self.seq
+                yield from self._messages(events, dropped, cursor, match)
+        finally:
+            with self.cond:
+                self.subscribers -= 1
+                if blocking:
+                    self.blocking -= 1
+
+    async def subscribe_async(self, last=None, match=None):
+        """subscribe() for an asyncio event loop. Waiting for events doesn't
+            hold a thread."""
+
+        wake = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), wake)
+        with self.cond:
+            cursor = self.seq if last is None else min(last, self.seq)
+            self.subscribers += 1
+            self.waiters.add(waiter)
+
+        try:
+            yield f"retry: 3000\nid: {cursor}\n\n"
+            while True:
+                ## Cleared before checking, so a publish in between still wakes us
+                with self.cond:
+                    wake.clear()
+                    idle = cursor >= self.seq
+                if idle:
+                    try:
+                        await asyncio.wait_for(wake.wait(), self.heartbeat)
+                    except asyncio.TimeoutError:
+                        pass
+                with self.cond:
+                    events, dropped = self._since(cursor)
+                    cursor = self.seq
+                for message in self._messages(events, dropped, cursor, match):
+                    yield message
+        finally:
+            with self.cond:
+                self.subscribers -= 1
+                self.waiters.discard(waiter)
+
+    def stats(self):
+        return {
+            "subscribers": self.subscribers,
+            "blocking": self.blocking,
+            "refused": self.refused,
+            "published": self.published,
+            "buffered": len(self.events),
+            "seq": self.seq,
+        }
+
+
+def spot_filter(spots=None, areas=None):
+    """Returns a match() for subscribe() that keeps events for the given
+        spot ids and/or areas, or None to keep everything."""
+
+    spots = set(spots or ())
+    areas = set(areas or ())
+    if not spots and not areas:
+        return None
+
+    def match(data):
+        return data["id"] in spots or (data.get("area") is not None and str(data["area"]) in areas)
+    return match
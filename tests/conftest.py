@@ -0,0 +1,13 @@
+## Python-specific imports
+import os
+import sys
+
+## The app's modules are flat at the top of the repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+## Run against the in-memory datastore and throwaway SQLite files
+os.environ.setdefault("RTDB_BACKEND", "memory")
+os.environ.setdefault("SCHEDULER_LEADER", "off")
+os.environ.setdefault("HISTORY_PATH", ":memory:")
+os.environ.setdefault("KEYS_PATH", ":memory:")
+os.environ.setdefault("SENSOR_FLUSH_MS", "0")
@@ -0,0 +1,63 @@
+## Python-specific imports
+import pytest
+
+###################################################################
+## Custom imports
+from history import DAY, HOUR, History
+
+
+## Midnight of some UTC day, so hours and days line up with it
+START = 20000 * DAY
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = History(str(tmp_path / "history.db"))
+    history.record({"s1": True}, now=START)
+    history.record({"s1": False}, now=START + 900)
+    history.record({"s1": True}, now=START + 2700)
+    return history
+
+
+def test_hourly_rollup_splits_free_and_occupied_time(history):
+    assert history.rollup_hours({"s1": "north"}, now=START + HOUR) == 1
+    assert history.spot("s1", START, START + HOUR) == [{
+        "start": START, "free_seconds": 1800.0, "occupied_seconds": 1800.0,
+        "utilization": 0.5, "transitions": 3,
+    }]
+
+
+def test_state_is_carried_into_hours_without_transitions(history):
+    history.rollup_hours(now=START + HOUR)
+    history.record({"s1": False}, now=START + HOUR + 1800)
+    history.rollup_hours(now=START + 3 * HOUR)
+
+    buckets = history.spot("s1", START + HOUR, START + 3 * HOUR)
+    assert [(b["free_seconds"], b["occupied_seconds"]) for b in buckets] == [(1800.0, 1800.0), (0.0, 3600.0)]
+
+
+def test_rollups_run_once_across_workers(history, tmp_path):
+    assert history.rollup_hours(now=START + HOUR) == 1
+    ## A second worker sharing the file finds the hour already rolled up
+    other = History(str(tmp_path / "history.db"))
+    assert other.rollup_hours(now=START + HOUR) == 0
+    assert len(other.spot("s1", START, START + DAY)) == 1
+
+
+def test_daily_rollup_sums_the_hours(history):
+    history.rollup_hours({"s1": "north"}, now=START + DAY)
+    assert history.rollup_days(now=START + DAY) == 1
+    assert history.rollup_days(now=START + DAY) == 0
+
+    day = history.spot("s1", START, START + DAY, period="day")
+    assert day == [{
+        "start": START, "free_seconds": 1800.0 + 23 * 3600, "occupied_seconds": 1800.0,
+        "utilization": round(1800 / DAY, 4), "transitions": 3,
+    }]
+    assert history.area("north", START, START + DAY, period="day")[0]["spots"] == 1
+
+
+def test_followers_only_fill_their_ring_buffers(history):
+    history.record({"s2": False}, now=START, persist=False)
+    assert history.recent("s2") == [(START, False)]
+    assert all(spot != "s2" for spot, _, _ in history.pending)
@@ -0,0 +1,74 @@
+## Python-specific imports
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+
+###################################################################
+## Custom imports
+from keystore import PENDING, KeyStore
+
+
+def settle(keys):
+    """Waits for the background hashing of provisioned keys."""
+
+    if keys.pool is not None:
+        keys.pool.shutdown(wait=True)
+        keys.pool = None
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "keys.db")
+
+
+def test_provisioned_key_verifies(path):
+    keys = KeyStore(path, iterations=1000)
+    assert keys.provision("a", "secret")
+    assert keys.verify("a", "secret")
+    assert not keys.verify("a", "wrong")
+    assert not keys.provision("a", "other")
+
+    settle(keys)
+    assert keys.hashes["a"].startswith("pbkdf2_sha256$1000$")
+    assert keys.verify("a", "secret")
+
+
+def test_other_workers_wait_for_the_hash(path):
+    keys = KeyStore(path, iterations=1000)
+    other = KeyStore(path, iterations=1000)
+    ## Hold the hashing back until the other worker has looked
+    hold = threading.Event()
+    keys.pool = ThreadPoolExecutor(max_workers=1)
+    keys.pool.submit(hold.wait)
+    keys.provision("a", "secret")
+    assert keys.hashes["a"].startswith(PENDING)
+    assert keys.verify("a", "secret")
+    assert not other.verify("a", "secret")
+
+    hold.set()
+    settle(keys)
+    assert other.verify("a", "secret")
+    assert not other.verify("a", "wrong")
+
+
+def test_provision_many_stores_the_first_key_of_each_id(path):
+    keys = KeyStore(path, iterations=1000)
+    keys.provision("taken", "k")
+    assert keys.provision_many([("a", "k1"), ("a", "k2"), ("taken", "x"), ("b", "k3")]) == [True, False, False, True]
+    assert keys.verify_many([("a", "k1"), ("a", "k2"), ("b", "k3"), ("taken", "x")]) == [True, False, True, False]
+
+
+def test_ids_without_a_key_depend_on_strict(path):
+    assert KeyStore(path, iterations=1000).verify("legacy", "anything")
+    assert not KeyStore(path, iterations=1000, strict=True).verify("legacy", "anything")
+    assert not KeyStore(path, iterations=1000).verify("legacy", None)
+
+
+def test_trust_on_first_use_keeps_the_first_key(path):
+    keys = KeyStore(path, iterations=1000, strict=True, tofu=True)
+    assert keys.verify("legacy", "first")
+    assert not keys.verify("legacy", "second")
+    assert keys.verify("legacy", "first")
+
+    settle(keys)
+    assert KeyStore(path, iterations=1000, strict=True).verify("legacy", "first")
@@ -0,0 +1,98 @@
+## Python-specific imports
+import pytest
+
+###################################################################
+## Custom imports
+from backends import MemoryBackend
+from models import Fleet
+from occupancy import OccupancyEngine
+from rtdb import Store
+
+
+SPOTS = {
+    "s1": {"free": True, "sensors": {"a": "a", "b": "b"}, "area": "north"},
+    "s2": {"free": True, "sensors": {"c": "c"}, "rule": "all"},
+}
+SENSORS = {
+    "a": {"type": "ultrasonic", "value": "false", "spot": "s1"},
+    "b": {"type": "ultrasonic", "value": "false", "spot": "s1"},
+    "c": {"type": "ultrasonic", "value": "true", "spot": "s2"},
+}
+
+
+###################################################################
+## Columnar fleet
+def test_fleet_evaluates_spots_from_their_sensors():
+    fleet = Fleet()
+    fleet.load(SPOTS, SENSORS)
+    assert fleet.changed() == {"s2": False}
+    assert fleet.occupied("s1") is False
+    assert fleet.occupied("s2") is True
+    assert fleet.spot_of("a") == "s1"
+
+
+def test_fleet_load_reports_stored_changes_and_drops_missing_ids():
+    fleet = Fleet()
+    fleet.load(SPOTS, SENSORS)
+    changed = fleet.load({"s1": dict(SPOTS["s1"], free=False)}, {"a": SENSORS["a"]})
+    assert changed == {"s1": False}
+    assert fleet.spot("s2") is None
+    assert fleet.sensor("c") is None
+    assert fleet.sensor("a").to_dict() == {"id": "a", "type": "ultrasonic", "value": "false", "spot": "s1"}
+
+
+def test_fleet_rows_are_reused_as_it_grows():
+    fleet = Fleet(capacity=2)
+    spots = {f"s{i}": {"free": True, "sensors": {f"x{i}": f"x{i}"}} for i in range(10)}
+    sensors = {f"x{i}": {"type": "ultrasonic", "value": "true", "spot": f"s{i}"} for i in range(10)}
+    fleet.load(spots, sensors)
+    assert fleet.sensors.capacity >= 10
+    assert len(fleet.changed()) == 10
+
+    fleet.load({"s0": spots["s0"]}, {"x0": sensors["x0"]})
+    fleet.load(spots, sensors)
+    assert len(fleet.sensors.rows) == 10
+
+
+###################################################################
+## Occupancy engine
+@pytest.fixture
+def engine():
+    db = MemoryBackend({"spots": SPOTS, "sensors": SENSORS})
+    engine = OccupancyEngine(Store(db))
+    engine.sync(db.get("spots"), db.get("sensors"))
+    return db, engine
+
+
+def test_sync_writes_only_out_of_date_spots(engine):
+    db, engine = engine
+    assert db.get("spots/s2/free") is False
+    assert db.get("spots/s1/free") is True
+
+
+def test_notify_reevaluates_the_touched_spot(engine):
+    db, engine = engine
+    changes = []
+    engine.on_change(lambda c, areas: changes.append((c, areas)))
+
+    assert engine.notify("a", dict(SENSORS["a"], value="true")) == {"s1": False}
+    assert db.get("spots/s1/free") is False
+    assert changes == [({"s1": False}, {"s1": "north"})]
+
+
+def test_relinked_sensor_votes_for_its_new_spot(engine):
+    db, engine = engine
+    relinks = []
+    engine.on_relink(lambda sensor, old, new, states: relinks.append((sensor, old, new)))
+
+    engine.notify("c", dict(SENSORS["c"], spot="s1"))
+    assert relinks == [("c", "s2", "s1")]
+    assert db.get("spots/s1/free") is False
+    assert db.get("spots/s2/free") is True
+
+
+def test_only_owned_spots_are_written(engine):
+    db, engine = engine
+    engine.owns = lambda spot: spot != "s1"
+    assert engine.notify("a", dict(SENSORS["a"], value="true")) == {}
+    assert db.get("spots/s1/free") is True
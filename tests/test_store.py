@@ -0,0 +1,177 @@
+## Python-specific imports
+import time
+import pytest
+from flask import Flask
+
+###################################################################
+## Custom imports
+from backends import MemoryBackend
+from journal import Journal
+from rtdb import Store
+from snapshot import Snapshot
+from versions import SpotVersions
+
+
+class FlakyBackend(MemoryBackend):
+    """MemoryBackend that can be taken down, failing like a lost connection."""
+
+    def __init__(self, tree=None):
+        super().__init__(tree)
+        self.down = False
+
+    def reference(self, path="/"):
+        if self.down:
+            raise ConnectionError("datastore down")
+        return super().reference(path)
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+@pytest.fixture
+def degradable(tmp_path):
+    db = FlakyBackend({"spots": {"s1": {"free": True}, "s2": {"free": False}}})
+    snapshot = Snapshot(str(tmp_path / "snapshot.msgpack"))
+    snapshot.save({"spots": db.get("spots")})
+    journal = Journal(str(tmp_path / "journal.db"))
+    return db, Store(db, fallback=snapshot, journal=journal), journal
+
+
+###################################################################
+## Degraded mode and journal replay
+def test_writes_are_journaled_and_replayed_in_order(degradable):
+    db, store, journal = degradable
+    db.down = True
+
+    store.update("spots/s1", {"free": False})
+    store.set("spots/s3", {"free": True})
+    store.delete("spots/s2")
+    assert store.degraded
+    assert journal.pending() == 3
+    ## Journaled writes can be read back from the snapshot
+    assert store.get("spots/s3") == {"free": True}
+
+    db.down = False
+    assert store.recover()
+    assert not store.degraded
+    assert journal.pending() == 0
+    assert db.get("spots") == {"s1": {"free": False}, "s3": {"free": True}}
+
+
+def test_replay_stops_while_unreachable(degradable):
+    db, store, journal = degradable
+    db.down = True
+    store.set("spots/s1/free", False)
+
+    with pytest.raises(ConnectionError):
+        store.recover()
+    assert store.degraded
+    assert journal.pending() == 1
+
+
+def test_rejected_writes_are_dead_lettered(degradable):
+    db, store, journal = degradable
+    journal.append("set", "spots/s4", {"free": True})
+    journal.append("update", "spots/s5", "not a dict")
+    journal.append("set", "spots/s6", {"free": False})
+
+    assert journal.replay(store._replay, store.unreachable) == 2
+    assert journal.stats()["dead_lettered"] == 1
+    assert db.get("spots/s4") == {"free": True}
+    assert db.get("spots/s6") == {"free": False}
+    dead = journal._connect().execute("SELECT path FROM dead_letters").fetchall()
+    assert dead == [("spots/s5",)]
+
+
+def test_invalid_writes_are_never_journaled(degradable):
+    db, store, journal = degradable
+    db.down = True
+    with pytest.raises(ValueError):
+        store.set("spots/bad.key", 1)
+    assert journal.pending() == 0
+
+
+def test_read_before_write_uses_the_snapshot_only_while_degraded(app, degradable):
+    db, store, journal = degradable
+    store.warm({"spots": {"s1": {"free": "stale"}}}, 0)
+    with app.test_request_context("/", method="POST"):
+        assert store.get("spots/s1") == {"free": True}
+
+    db.down = True
+    store.degrade("test")
+    with app.test_request_context("/", method="POST"):
+        assert store.get("spots/s1") == {"free": "stale"}
+
+
+###################################################################
+## Spot versions
+@pytest.fixture
+def versioned():
+    store = Store(MemoryBackend({"spots": {"s1": {"free": True}, "s2": {"free": True}}}))
+    versions = SpotVersions(store)
+    store.stamp = versions.stamps
+    return store, versions
+
+
+def test_writes_to_spots_move_the_version(versioned):
+    store, versions = versioned
+    assert versions.current() == (0, 0)
+
+    store.update("spots/s1", {"free": False})
+    counter, latest = versions.current()
+    assert counter == 1 and latest > 0
+
+    ## Writes outside /spots leave it alone
+    store.set("sensors/a", {"value": 1})
+    assert versions.current() == (counter, latest)
+
+
+def test_since_lists_changed_and_deleted_spots(versioned):
+    store, versions = versioned
+    store.update("spots/s1", {"free": False})
+    counter, latest = versions.current()
+    ## Stamps are in milliseconds
+    time.sleep(0.005)
+
+    store.update("/", {"spots/s2/free": False, "spots/s1": None})
+    counter, _ = versions.current()
+    full, changed, deleted = versions.since(latest + 1, versions.spots(counter), counter)
+    assert not full
+    assert changed == ["s2"]
+    assert deleted == ["s1"]
+
+
+def test_replacing_the_set_returns_everything(versioned):
+    store, versions = versioned
+    store.update("spots/s1", {"free": False})
+    _, latest = versions.current()
+    time.sleep(0.005)
+
+    store.set("spots", {"s7": {"free": True}, "s8": {"free": True}})
+    counter, _ = versions.current()
+    full, changed, deleted = versions.since(latest, versions.spots(counter), counter)
+    assert full
+    assert sorted(changed) == ["s7", "s8"]
+
+    ## The version returned with the new set doesn't get it again
+    counter, latest = versions.current()
+    assert versions.since(latest, versions.spots(counter), counter) == (False, [], [])
+
+
+def test_spot_set_is_downloaded_once_per_version(versioned):
+    store, versions = versioned
+    calls = []
+    get = store.db.get
+    store.db.get = lambda path: (calls.append(path), get(path))[1]
+
+    counter, _ = versions.current()
+    for _ in range(3):
+        versions.spots(counter)
+    assert calls.count("spots") == 1
+
+    store.update("spots/s1", {"free": False})
+    counter, _ = versions.current()
+    assert versions.spots(counter)["s1"] == {"free": False}
+    assert calls.count("spots") == 2
@@ -0,0 +1,55 @@
+## Python-specific imports
+import pytest
+
+###################################################################
+## Custom imports
+from backends import MemoryBackend
+from rtdb import Store
+from writebuffer import WriteBuffer
+
+
+@pytest.fixture
+def db():
+    return Store(MemoryBackend({"sensors": {"a": {"type": "ultrasonic", "value": 1}}}))
+
+
+def test_repeats_of_a_written_value_are_suppressed(db):
+    writes = WriteBuffer(db, window=0)
+    assert writes.put("a", {"value": 2})
+    assert not writes.put("a", {"value": 2})
+    assert writes.put("a", {"value": 3})
+    assert db.get("sensors/a/value") == 3
+    assert writes.stats()["suppressed"] == 1
+
+
+def test_another_writer_makes_the_value_worth_writing_again(db):
+    writes = WriteBuffer(db, window=0)
+    writes.put("a", {"value": 2})
+    db.set("sensors/a/value", 5)
+    writes.observe({"a": {"type": "ultrasonic", "value": 5}})
+
+    assert writes.put("a", {"value": 2})
+    assert db.get("sensors/a/value") == 2
+
+
+def test_pending_updates_are_coalesced_into_one_write(db):
+    writes = WriteBuffer(db, window=60)
+    writes.put("a", {"value": 2})
+    writes.put("a", {"value": 3})
+    writes.put("b", {"value": 4})
+    assert writes.overlay("a", {"type": "ultrasonic", "value": 1}) == {"type": "ultrasonic", "value": 3}
+
+    assert writes.flush() == 2
+    assert db.get("sensors/a/value") == 3
+    assert db.get("sensors/b/value") == 4
+    assert writes.stats()["coalesced"] == 1
+
+
+def test_rejected_sensors_are_dead_lettered(db):
+    writes = WriteBuffer(db, window=60)
+    writes.put("a", {"value": 2})
+    writes.put("b", {"bad.field": 1})
+
+    assert writes.flush() == 1
+    assert db.get("sensors/a/value") == 2
+    assert [id for id, fields, error in writes.dead] == ["b"]
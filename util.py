@@ -1,10 +1,30 @@
 ## Python-specific imports
+import os
+import hmac
 import asyncio
 import logging
 
 ###################################################################
 ## Custom imports
 from models import Sensor
+from areas import area_of
+from keystore import sensor_keys
+
+## Verify multi-path writes with a read-back when running in debug mode
+DEBUG = os.environ.get("FLASK_DEBUG", "0") == "1"
+
+## Operator key accepted for changes to any spot, e.g. one no sensor is linked to yet
+ADMIN_KEY = os.environ.get("ADMIN_KEY", "")
+
+## Error returned when the datastore can't be read or written; routes answer
+## it with a 503
+UNAVAILABLE = "Sensor data is unavailable right now, try again later."
+
+
+def unavailable(result):
+    """True if result is the UNAVAILABLE error."""
+
+    return isinstance(result, dict) and result.get("error") == UNAVAILABLE
 
 async def verify_parameters(data):
     """Verifies that the provided data is enough to create an
@@ -33,28 +53,48 @@ async def verify_parameters(data):
 
 async def add_sensor_to_rtdb(sensor, db):
     """Adds the Sensor provided to the RTDB and includes its key
-        in the keys db of SQLite and MySQL auth"""
+        in the keys db of SQLite and MySQL auth. The sensor and its
+        spot link are written in a single multi-path update."""
 
     _err = False
 
+    ## Read the sensor and the spot it links to concurrently; link_paths
+    ## gets the spot from the request memo
+    spot = sensor.get("spot")
+    try:
+        current, _ = await asyncio.gather(fetch("sensors", sensor["id"], db),
+                                          fetch("spots", spot if spot not in (None, "") else None, db))
+    except Exception as e:
+        logging.error(f"{e} | UTIL > ADD_SENSOR_TO_RTDB | Unable to read {sensor['id']}.")
+        return (True, {"error": UNAVAILABLE})
+
     ## Confirm ID is not already in RTDB and insert
-    if db.reference(f'sensors/{sensor["id"]}').get() is None:
-        if "key" in sensor:
-            k = sensor["key"]
-            del sensor["key"]
-        db.reference(f'sensors/{sensor["id"]}').set(sensor)
-        logging.info(f'UTIL > Added {sensor["id"]} to RTDB.')
-
-        ## TODO: Update parking spot, if existing, to include this sensor
-        if "spot" in sensor:
-            # # print("updating sensor spot")
-            ## Add back key temporarily
-            sensor["key"] = k
-            await update_sensor_spot(sensor, sensor["id"], db)
-
-        ## TODO: Add Auth key to data structure
-        
-        return (_err, db.reference(f'sensors/{sensor["id"]}').get())
+    if current is None:
+        id = sensor["id"]
+        k = sensor.pop("key", None)
+        updates = {f"sensors/{id}": sensor}
+
+        ## Store the new sensor's key; an id that already has one must match it.
+        ## Without an accepted key nothing is written.
+        if k is None:
+            return (True, {'error': 'No auth key provided in JSON object.'})
+        if not (sensor_keys.provision(id, k) or (await auth_id(id, k))):
+            return (True, {'error': 'Improper authentication key was provided for given sensor.'})
+
+        ## Link the parking spot, creating it if needed, in the same update
+        spot = sensor.get("spot")
+        try:
+            if spot not in (None, ""):
+                updates.update(await link_paths(id, spot, None, db, area_of(sensor)))
+            db.reference("/").update(updates)
+        except Exception as e:
+            logging.error(f"{e} | UTIL > ADD_SENSOR_TO_RTDB | Unable to add {id}.")
+            return (True, {"error": UNAVAILABLE})
+        logging.info(f'UTIL > Added {id} to RTDB.')
+        if DEBUG:
+            await verify_link(id, spot, db)
+
+        return (_err, sensor)
     
     ## Otherwise, return an error code and error out
     _err = True
@@ -62,8 +102,8 @@ async def add_sensor_to_rtdb(sensor, db):
 
 
 
-async def add_spot_to_rtdb(spot, db):
-    """Adds the Spot provided to the RTDB"""
+async def add_spot_to_rtdb(spot, db, coords=None):
+    """Adds the Spot provided to the RTDB, with optional (lat, lon) coordinates."""
 
     _err = False
 
@@ -72,114 +112,299 @@ async def add_spot_to_rtdb(spot, db):
         'free': 'true',
         'sensors': {"spot": spot},
     }
+    if coords is not None:
+        data['lat'], data['lon'] = coords
 
     ## Confirm ID is not already in RTDB and insert
-    if db.reference(f'spots/{spot}').get() is None:
+    if (await fetch("spots", spot, db)) is None:
         try:
             db.reference(f'spots/{spot}').set(data)
         except Exception as e:
             # # print(e)
             return (True, {'error': 'Error when adding new spot to RTDB.'})
         logging.info(f'UTIL > Added {spot} to RTDB.')        
-        return (_err, db.reference(f'spots/{spot}').get())
+        return (_err, data)
     
     ## Otherwise, return an error code and error out
     _err = True
     return (_err, {'error': f'{spot} already exists in RTDB.'})
 
 
+async def locate_spot(spot, coords, db):
+    """Sets the (lat, lon) coordinates of a spot, creating the spot if it
+        doesn't exist. Returns (_err, spot object)."""
+
+    current = await fetch("spots", spot, db)
+    if current is None:
+        return await add_spot_to_rtdb(spot, db, coords)
+
+    try:
+        db.reference(f"spots/{spot}").update({"lat": coords[0], "lon": coords[1]})
+    except Exception as e:
+        logging.error(f"{e} | UTIL > LOCATE_SPOT | Unable to set the coordinates of {spot}.")
+        return (True, {'error': 'Error when updating spot in RTDB.'})
+    current['lat'], current['lon'] = coords
+    return (False, current)
+
+
 ## Authenticate with a given id
 async def auth_id(id, key):
-    """Authenticates a given key to the applicable ID provided."""
+    """Authenticates a given key to the applicable ID provided, against the
+        in-memory key store (no datastore round trip)."""
 
     ## No key provided, error out:
     if key is None:
         return False
 
+    return sensor_keys.verify(id, key)
 
-    ## TODO: Set up Auth structure and confirm it contains the key
 
-    ## Temporarily assign this as True
-    return True
+async def auth_spot(id, data, db):
+    """Authenticates a change to spot id: data["key"] must be ADMIN_KEY, or
+        the key of the sensor named by data["sensor"], which must be linked
+        to the spot."""
+
+    key = data.get("key")
+    if key is None:
+        return False
+    if ADMIN_KEY and hmac.compare_digest(str(key).encode("utf8"), ADMIN_KEY.encode("utf8")):
+        return True
+
+    sensor = data.get("sensor")
+    if sensor in (None, ""):
+        return False
+    spot = await fetch("spots", id, db)
+    linked = spot.get("sensors") if isinstance(spot, dict) else None
+    if not isinstance(linked, (dict, list)) or str(sensor) not in [str(s) for s in linked]:
+        return False
+    return await auth_id(str(sensor), key)
+
+
+async def auth_ids(pairs):
+    """auth_id() for a batch of (id, key) pairs. Returns a list of bools."""
+
+    return sensor_keys.verify_many(pairs)
+
+
+async def fetch(domain="sensors", id=None, db=None):
+    """Returns the object for a given ID in the provided DB, or None if it
+        doesn't exist. Use this instead of exists() followed by a get().
+        Independent fetches can be awaited together with asyncio.gather."""
+
+    ## If ID or db is none, error out:
+    if id is None or db is None:
+        return None
+
+    ## Make query to RTDB, off the event loop when the db supports it
+    if hasattr(db, "fetch_async"):
+        return await db.fetch_async(domain, id)
+    return db.reference(f'{domain}/{id}').get()
 
 
 async def exists(domain="sensors", id=None, db=None):
     """Returns True if a given sensor ID exists in the provided DB, otherwise False."""
 
-    ## If ID is none, error out:
-    if id is None:
-        return False
+    return (await fetch(domain, id, db)) is not None
 
-    ## If db is none, error out:
-    if db is None:
-        return False
 
-    ## Make query to RTDB
-    if db.reference(f'{domain}/{id}').get() is None:
-        return False
+async def link_paths(id, spot, oldSpot, db, area=None):
+    """Returns the leaf paths that move sensor id from oldSpot to spot, for
+        use in a single multi-path update. Creates the spot if needed, and
+        gives the spot the sensor's area if it doesn't have one yet."""
+
+    paths = {f"spots/{spot}/sensors/{id}": id}
+
+    ## Create the spot with the same layout as add_spot_to_rtdb
+    spotObj = await fetch("spots", spot, db)
+    if spotObj is None:
+        paths[f"spots/{spot}/id"] = spot
+        paths[f"spots/{spot}/free"] = 'true'
+        paths[f"spots/{spot}/sensors/spot"] = spot
+    if area is not None and area_of(spotObj) is None:
+        paths[f"spots/{spot}/area"] = area
+
+    ## Unlink current spot, if applicable
+    if oldSpot not in (None, "") and oldSpot != spot:
+        paths[f"spots/{oldSpot}/sensors/{id}"] = None
+
+    return paths
 
+
+async def verify_link(id, spot, db):
+    """Debug-only read-back confirming a sensor/spot link was written."""
+
+    sensor, spotObj = await asyncio.gather(fetch("sensors", id, db), fetch("spots", spot, db))
+    if sensor is None or sensor.get("spot") != spot or \
+            spotObj is None or id not in spotObj.get("sensors", {}):
+        logging.error(f"UTIL > VERIFY_LINK | {id} is not linked to spot {spot} after update.")
+        return False
     return True
 
 
 async def update_sensor_spot(data, id, db):
-    ## Confirm sensor ID exists
-    if not (await exists("sensors", id, db)):
+    """Moves a sensor to the spot given in data. The sensor's spot, the old
+        spot's and the new spot's sensor entries are all written in one
+        multi-path update of their leaf paths."""
+
+    ## Confirm sensor ID exists, reading the new spot for link_paths alongside
+    spot = data.get("spot")
+    try:
+        sensor, _ = await asyncio.gather(fetch("sensors", id, db),
+                                         fetch("spots", spot if spot not in (None, "") else None, db))
+    except Exception as e:
+        logging.error(f"{e} | UTIL > UPDATE_SENSOR_SPOT | Unable to read {id}.")
+        return {"error": UNAVAILABLE}
+    if sensor is None:
         return {"error": "Sensor ID does not exist."}
-    # # print("past 1")
     ## Check for Auth Key in obj:
     if "key" not in data:
-        # # print(data)
         return {"error": "No auth key provided in JSON object."}
-    # # print("past 2")
     ## Confirm auth key:
     if not (await auth_id(id, data["key"])):
         return {"error": "Improper authentication key was provided for given sensor."}
-    # # print("past 3")
     ## Confirm spot is provided in data:
-    if "spot" not in data:
+    if data.get("spot") in (None, ""):
         return {"error": "No spot provided in JSON object."}
-    # # print("past 4")
     spot = data["spot"]
-    _err = False
-    ## Confirm spot exists, if not make one
-    if not (await exists("spots", spot, db)):
-        # # print("Adding to rtdb")
-        _err, spot = await add_spot_to_rtdb(spot, db)
-    else:
-        # # print("spot exists")
-        spot = db.reference(f"spots/{spot}").get()
-        # # print(spot)
-
-    if _err:
-        return {"error": "Error getting spot data. Please confirm it exists in RTDB."}
-    # # print("past 5")
-    ## Add sensor ID to sensors object in spot
-    spot['sensors'][id] = id
-    # # print(spot)
-    ## Reference sensor object:
-    sensor = db.reference(f"sensors/{id}").get()
-    # # print(sensor)
-    ## Unlink current spot, if applicable
-    oldSpot = sensor["spot"]
-    # # print(oldSpot)
-    if (await exists("spots", oldSpot, db)):
-        # # print("old spot exists, ulinking:")
-        oldSpotObj = db.reference(f"spots/{oldSpot}").get()
-        if id in oldSpotObj["sensors"]:
-            del oldSpotObj["sensors"][id]
-        db.reference(f"spots/{oldSpot}").set(oldSpotObj)
-
-    sensor["spot"] = spot["id"] # Set spot id to sensor's spot parameter
-    # # print(sensor)
-    ## remove auth key if exists
-    if "key" in sensor:
-        # # print("deleting key")
-        del sensor["key"]
-
-    ## setting:
-    # # print("setting these puppies")
-    # # print(sensor)
-    # print(spot)
-    db.reference(f"sensors/{id}").set(sensor)
-    db.reference(f"spots/{spot['id']}").set(spot)
-    return sensor
\ No newline at end of file
+
+    try:
+        updates = await link_paths(id, spot, sensor.get("spot"), db, area_of(data) or area_of(sensor))
+        updates[f"sensors/{id}/spot"] = spot
+        ## remove auth key if exists
+        if "key" in sensor:
+            updates[f"sensors/{id}/key"] = None
+            del sensor["key"]
+        db.reference("/").update(updates)
+    except Exception as e:
+        logging.error(f"{e} | UTIL > UPDATE_SENSOR_SPOT | Unable to relink {id} to {spot}.")
+        return {"error": UNAVAILABLE}
+    if DEBUG:
+        await verify_link(id, spot, db)
+
+    sensor["spot"] = spot # Set spot id to sensor's spot parameter
+    return sensor
+
+## Characters the RTDB doesn't allow in keys
+INVALID_KEY_CHARS = set(".$#[]/")
+
+
+async def ingest_batch(records, db, modeled=None):
+    """Validates a batch of sensor records with the same rules as a single
+        sensor POST and commits every valid record in one multi-path update.
+        modeled(id) returns a sensor from a current in-memory model, or None
+        to read it from db.
+
+        Returns (statuses, sensors): one status dict per record, in order, and
+        the resulting objects of every sensor that was written."""
+
+    statuses = []
+    updates = {}
+    sensors = {}
+    created = set()
+
+    ## Take the batch's sensors from the model, read only the rest, together,
+    ## and check every key at once
+    ids = list(dict.fromkeys(str(r["id"]) for r in records if isinstance(r, dict)
+                             and r.get("id") not in (None, "") and not INVALID_KEY_CHARS & set(str(r["id"]))))
+    current = {id: modeled(id) for id in ids} if modeled is not None else {}
+    current = {id: obj for id, obj in current.items() if obj is not None}
+    ## The model doesn't keep a legacy plain-text key, so clear it blindly
+    from_model = set(current)
+    try:
+        ids = [id for id in ids if id not in current]
+        current.update(zip(ids, await asyncio.gather(*(fetch("sensors", id, db) for id in ids))))
+        keys = {}
+        ## New sensors aren't checked here: they are provisioned below, as in
+        ## the single path
+        authorized = await auth_ids([(str(r.get("id")), r.get("key"))
+                                     if isinstance(r, dict) and current.get(str(r.get("id"))) is not None
+                                     else ("", None) for r in records])
+
+        for i, record in enumerate(records):
+            if not isinstance(record, dict) or record.get("id") in (None, ""):
+                statuses.append({"index": i, "status": "error", "error": "Record must be an object with an id."})
+                continue
+            id = str(record["id"])
+            if INVALID_KEY_CHARS & set(id) or any(INVALID_KEY_CHARS & set(str(k)) for k in record):
+                statuses.append({"index": i, "id": id, "status": "error", "error": "Invalid characters in id or field name."})
+                continue
+            if current.get(id) is None:
+                if record.get("key") is None:
+                    statuses.append({"index": i, "id": id, "status": "error", "error": "No auth key provided in JSON object."})
+                    continue
+            elif not authorized[i]:
+                statuses.append({"index": i, "id": id, "status": "error", "error": "No Authentication key was provided to update the sensor values."})
+                continue
+
+            fields = {k: v for k, v in record.items() if k != "key" and v is not None}
+            fields["id"] = id
+            existing = sensors.get(id, current.get(id))
+
+            ## New sensor: same requirements as /data/sensor/init
+            if existing is None:
+                if not (await verify_parameters(fields)):
+                    statuses.append({"index": i, "id": id, "status": "error", "error": "Invalid parameters provided in JSON object."})
+                    continue
+                updates[f"sensors/{id}"] = fields
+                keys[id] = record["key"]
+                if fields["spot"] != "":
+                    updates.update(await link_paths(id, fields["spot"], None, db, area_of(fields)))
+                sensors[id] = dict(fields)
+                created.add(id)
+                statuses.append({"index": i, "id": id, "status": "created"})
+                continue
+
+            ## A sensor created earlier in the batch needs the key it was created with
+            if id in keys and record.get("key") != keys[id]:
+                statuses.append({"index": i, "id": id, "status": "error", "error": "Improper authentication key was provided for given sensor."})
+                continue
+
+            ## Existing sensor: relink if the spot changed, then merge the fields
+            if fields.get("spot") not in (None, "") and fields["spot"] != existing.get("spot"):
+                updates.update(await link_paths(id, fields["spot"], existing.get("spot"), db,
+                                                area_of(fields) or area_of(existing)))
+
+            merged = dict(existing)
+            merged.update(fields)
+            merged.pop("key", None)
+            if id in created:
+                updates[f"sensors/{id}"] = merged
+            else:
+                for k, v in fields.items():
+                    updates[f"sensors/{id}/{k}"] = v
+                if "key" in existing or id in from_model:
+                    updates[f"sensors/{id}/key"] = None
+            sensors[id] = merged
+            statuses.append({"index": i, "id": id, "status": "updated"})
+    except Exception as e:
+        ## Nothing has been written or provisioned yet
+        logging.error(f"{e} | UTIL > INGEST_BATCH | Unable to read the batch's sensors and spots.")
+        return ([{"index": i, "status": "error", "error": UNAVAILABLE} for i in range(len(records))], {})
+
+    ## Hash and store the new sensors' keys in one batch, off the event loop;
+    ## a sensor another worker provisioned first keeps only a matching key
+    provisioned = await asyncio.to_thread(sensor_keys.provision_many, keys.items())
+    lost = [id for id, ok in zip(keys, provisioned) if not ok and not (await auth_id(id, keys[id]))]
+    for id in lost:
+        for path in [p for p in updates if p == f"sensors/{id}" or p.startswith(f"sensors/{id}/")
+                     or p.endswith(f"/sensors/{id}")]:
+            del updates[path]
+        sensors.pop(id, None)
+        for s in statuses:
+            if s.get("id") == id and s["status"] != "error":
+                s["status"] = "error"
+                s["error"] = "Improper authentication key was provided for given sensor."
+
+    if updates:
+        try:
+            db.reference("/").update(updates)
+        except Exception as e:
+            logging.error(f"{e} | UTIL > INGEST_BATCH | Unable to commit {len(updates)} path(s).")
+            for s in statuses:
+                if s["status"] != "error":
+                    s["status"] = "error"
+                    s["error"] = UNAVAILABLE
+            return (statuses, {})
+
+    return (statuses, sensors)
+
@@ -0,0 +1,111 @@
+## Python-specific imports
+import logging
+import threading
+
+###################################################################
+## Custom imports
+from occupancy import as_dict
+
+
+## RTDB server values, resolved by the datastore when the write lands
+TIMESTAMP = {".sv": "timestamp"}
+INCREMENT = {".sv": {"increment": 1}}
+
+
+###################################################################
+## Versioned view of the spot set
+class SpotVersions:
+    """Version of the spot set kept in the datastore next to it, under
+        root, so every worker reads the same one.
+
+        Every write that touches /spots carries stamps(), in the same
+        multi-path update: counter goes up by one and latest and the
+        changed spots' ids/{id} entries get the server's timestamp. The
+        counter is the ETag of the set; latest is the version clients send
+        back as ?since=, and since() lists the spots stamped at or after it.
+        Both sit in one small head node, read without the cache. A write of
+        the whole set stamps reset instead, and a version older than reset
+        gets the full set. The spot set and the stamps are downloaded once
+        per counter value and reused until it moves."""
+
+    def __init__(self, store=None, root="spot_versions"):
+        self.store = store
+        self.root = root
+        self.tree = None
+        self.stamped = None
+        self.lock = threading.Lock()
+
+    def stamps(self, paths):
+        """Returns the version leaves to write along with a write of paths."""
+
+        ids = set()
+        for path in paths:
+            parts = path.split("/") if path else []
+            if parts and parts[0] != "spots":
+                continue
+            if len(parts) < 2:
+                ids = None
+                break
+            ids.add(parts[1])
+        else:
+            if not ids:
+                return {}
+
+        stamps = {f"{self.root}/head/counter": INCREMENT, f"{self.root}/head/latest": TIMESTAMP}
+        if ids is None:
+            stamps[f"{self.root}/reset"] = TIMESTAMP
+            stamps[f"{self.root}/ids"] = None
+        else:
+            stamps.update({f"{self.root}/ids/{id}": TIMESTAMP for id in ids})
+        return stamps
+
+    def current(self):
+        """Returns (counter, latest) as stored, or None if the datastore
+            can't be read."""
+
+        try:
+            head = self.store.get(f"{self.root}/head", cached=False) or {}
+        except Exception as e:
+            logging.warning(f"{e} | VERSIONS > CURRENT | Unable to read the spot version.")
+            return None
+        return tuple(v if isinstance(v, int) else 0 for v in (head.get("counter"), head.get("latest")))
+
+    def _at(self, name, counter, load):
+        """Returns load() as of counter, reusing the copy kept in self.name
+            while the counter hasn't moved."""
+
+        with self.lock:
+            kept = getattr(self, name)
+        if kept is not None and kept[0] == counter:
+            return kept[1]
+        value = load()
+        with self.lock:
+            setattr(self, name, (counter, value))
+        return value
+
+    def spots(self, counter):
+        """Returns the {spot id: spot} set as of counter, downloading it only
+            if the counter moved since the last download. The set is shared,
+            so callers must not modify it."""
+
+        return self._at("tree", counter, lambda: as_dict(self.store.get("spots", cached=False)))
+
+    def since(self, version, spots, counter):
+        """Returns (full, changed ids, deleted ids) between the given version
+            and now, for the {spot id: spot} set as of counter. full is True
+            when the set was replaced after that version, in which case every
+            spot is listed."""
+
+        stamped = self._at("stamped", counter, lambda: self.store.get(self.root, cached=False) or {})
+        reset = stamped.get("reset")
+        ## The write that stamped reset also stamped latest with the same
+        ## value, so a client holding that version already has the new set
+        if isinstance(reset, int) and version < reset:
+            return True, list(spots), []
+        ## A spot without a stamp wasn't written since the last reset, or was
+        ## never written since versions were kept
+        ids = as_dict(stamped.get("ids"))
+        changed = [id for id in spots
+                   if (ids[id] >= version if isinstance(ids.get(id), int) else reset is None)]
+        deleted = [id for id, v in ids.items() if isinstance(v, int) and v >= version and id not in spots]
+        return False, changed, deleted
@@ -0,0 +1,216 @@
+## Python-specific imports
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from cachetools import TTLCache
+
+###################################################################
+## Custom imports
+from models import same
+
+
+_MISSING = object()
+
+## Sensor fields a change feed object carries (see models.Sensor.to_dict)
+TRACKED = ("type", "area", "value", "spot")
+
+
+###################################################################
+## Write-behind buffer for sensor updates
+class WriteBuffer:
+    """Coalesces high-frequency sensor updates into batched writes.
+
+        put() keeps only the latest value of each field per sensor, drops
+        fields that match what is pending or what this buffer last wrote,
+        and flushes every dirty sensor in a single multi-path update once
+        the flush window has passed. The record of written values is never
+        filled from reads, which another worker may have outdated; it
+        expires after ttl seconds, and observe() drops a sensor's entry when
+        a change feed shows a different value. With a window of 0 every
+        put() is written immediately and a failed write raises.
+
+        A batch that fails because the datastore is unreachable is requeued.
+        Any other failure is retried one sensor at a time, and the sensors
+        that still fail are dead-lettered (logged and kept in dead) instead
+        of blocking every later flush. Pending writes are flushed on
+        interpreter exit."""
+
+    def __init__(self, db, window=0.25, dead_letters=100, ttl=60, size=100000):
+        self.db = db
+        self.window = window
+        self.pending = {}
+        self.flushed = TTLCache(maxsize=size, ttl=ttl)
+        self.dead = deque(maxlen=dead_letters)
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.suppressed = 0
+        self.coalesced = 0
+        self.written = 0
+        self.flushes = 0
+        self.dead_lettered = 0
+        atexit.register(self.flush)
+
+    def put(self, id, fields):
+        """Queues the given fields for sensors/{id}. Returns False if the
+            update was suppressed because it is already pending or written."""
+
+        with self.lock:
+            pending = self.pending.get(id, {})
+            written = self.flushed.get(id, {})
+            changed = {}
+            for k, v in fields.items():
+                current = pending[k] if k in pending else written.get(k, _MISSING)
+                if current is _MISSING or not same(current, v):
+                    changed[k] = v
+            if not changed:
+                self.suppressed += 1
+                return False
+
+            if id in self.pending:
+                self.coalesced += 1
+                self.pending[id].update(changed)
+            else:
+                self.pending[id] = changed
+
+        if self.window <= 0:
+            self.flush(strict=True)
+        else:
+            self._start()
+            self.wake.set()
+        return True
+
+    def observe(self, sensors):
+        """Change-feed callback with {sensor id: object (None if deleted)}.
+            Forgets what was written for a sensor whose object no longer
+            matches it, so the next put() of that value is written again."""
+
+        with self.lock:
+            for id, obj in sensors.items():
+                written = self.flushed.get(id)
+                if written is None:
+                    continue
+                if not isinstance(obj, dict) or any(k in TRACKED and not same(obj.get(k), v)
+                                                    for k, v in written.items()):
+                    del self.flushed[id]
+
+    def overlay(self, id, sensor):
+        """Applies any pending fields for sensors/{id} to a read result."""
+
+        with self.lock:
+            pending = self.pending.get(id)
+            if pending is None or sensor is None:
+                return sensor
+            sensor = dict(sensor)
+            sensor.update(pending)
+            return sensor
+
+    def flush(self, strict=False):
+        """Writes every dirty sensor in one multi-path update. With strict
+            the error of a failed write is raised instead of handled."""
+
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+            if not pending:
+                return 0
+
+            try:
+                self._write(pending)
+            except Exception as e:
+                if strict:
+                    raise
+                if self._unreachable(e):
+                    logging.error(f"{e} | WRITEBUFFER > FLUSH | Unable to write {len(pending)} sensor(s), requeueing.")
+                    self._requeue(pending)
+                    return 0
+                pending = self._retry(pending, e)
+
+            self.written += len(pending)
+            self.flushes += 1
+            return len(pending)
+
+    def _write(self, pending):
+        updates = {}
+        for id, fields in pending.items():
+            for k, v in fields.items():
+                updates[f"sensors/{id}/{k}"] = v
+        self.db.reference("/").update(updates)
+
+        ## Remember what went out, for suppressing repeats
+        with self.lock:
+            for id, fields in pending.items():
+                written = dict(self.flushed.get(id, {}))
+                written.update(fields)
+                self.flushed[id] = written
+
+    def _unreachable(self, e):
+        check = getattr(self.db, "unreachable", None)
+        return check is not None and check(e)
+
+    def _requeue(self, pending):
+        ## Put the values back unless a newer one arrived meanwhile
+        with self.lock:
+            for id, fields in pending.items():
+                fields.update(self.pending.get(id, {}))
+                self.pending[id] = fields
+        if self.window > 0:
+            self.wake.set()
+
+    def _retry(self, pending, error):
+        """Writes a rejected batch one sensor at a time, requeueing the ones
+            that hit an unreachable datastore and dead-lettering the rest.
+            Returns the sensors that were written."""
+
+        logging.warning(f"{error} | WRITEBUFFER > FLUSH | Batch of {len(pending)} sensor(s) rejected, "
+                        f"writing them one at a time.")
+        written, requeue = {}, {}
+        for id, fields in pending.items():
+            try:
+                self._write({id: fields})
+                written[id] = fields
+            except Exception as e:
+                if self._unreachable(e):
+                    requeue[id] = fields
+                    continue
+                logging.error(f"{e} | WRITEBUFFER > FLUSH | Dropping the update of {id}: {fields}.")
+                with self.lock:
+                    self.dead.append((id, fields, str(e)))
+                    self.dead_lettered += 1
+        if requeue:
+            self._requeue(requeue)
+        return written
+
+    def _start(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="writebuffer", daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+            ## Let the window fill up before writing it out
+            time.sleep(self.window)
+            self.flush()
+
+    def stats(self):
+        """Returns the suppressed/coalesced/written/dead-lettered counters."""
+
+        with self.lock:
+            return {
+                "suppressed": self.suppressed,
+                "coalesced": self.coalesced,
+                "written": self.written,
+                "flushes": self.flushes,
+                "dead_lettered": self.dead_lettered,
+                "pending": len(self.pending),
+                "remembered": len(self.flushed),
+                "window": self.window,
+            }